@@ -2,22 +2,62 @@ import streamlit as st
 import sys
 import os
 import copy
+import time
+from functools import partial
 
 # Add project root to path for imports
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from xrp_track import trace_transactions, build_graph, visualize_graph, get_transaction
-import matplotlib.pyplot as plt  # Needed for graph
 import datetime  # For parsing dates
 
 import io
-from PIL import Image
 from utils.db_utils import add_or_update_tag  # For tag management
+from utils import cache_utils
+from utils.records import Transfer
+from utils.api_utils import ensure_pool_size
+from utils.jobs import JobQueue, DEFAULT_JOB_WORKERS  # Background trace jobs
 import yaml
 from streamlit_authenticator import Authenticate
-import reportlab
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
+from utils.report import write_report  # Paginated PDF/HTML reports
+
+JOB_POLL_SECONDS = 1.0  # How often a page showing a running job refreshes its progress
+
+
+@st.cache_resource
+def job_queue():
+    # One worker pool per server process, shared by every user session
+    return JobQueue(workers=int(os.environ.get('TRACE_JOB_WORKERS', DEFAULT_JOB_WORKERS)))
+
+
+# Job body: trace from an account or a single transaction into session, then build the graph
+def run_trace(account, tx_id, start_datetime, end_datetime, depth, workers, cache_only, session):
+    session.cache_only = cache_only  # Offline mode belongs to this job, not the server process
+    ensure_pool_size(workers)  # Pools are shared by all jobs; never smaller than one job's workers
+    node_levels = session.node_levels
+    if tx_id:
+        txn_data = get_transaction(tx_id, cache_only=cache_only)
+        transactions = [Transfer.from_xrpscan(txn_data)]
+        if 'Destination' in txn_data:
+            node_levels[txn_data.get('Account', '')] = 0
+            node_levels[txn_data['Destination']] = 1
+            session.traced.add(txn_data.get('Account', ''))
+            transactions.extend(trace_transactions(txn_data['Destination'], start_datetime, end_datetime, depth=1, max_depth=depth, workers=workers, session=session))
+    else:
+        node_levels[account] = 0
+        transactions = trace_transactions(account, start_datetime, end_datetime, max_depth=depth, workers=workers, session=session)
+    G = build_graph(transactions, node_levels, session.suspected_mixers)
+    return {'graph': G, 'node_levels': node_levels, 'alerts': session.alerts, 'transactions': transactions}
+
+
+# Report for a finished trace, built in memory from the graph image the page already rendered
+def generate_report(result, fmt='pdf'):
+    buffer = io.BytesIO()
+    write_report(buffer, result['graph'], result['alerts'], 'XRP Transaction Trace Report', transfers=result['transactions'],
+                 image=result.get('image'), fmt=fmt)
+    buffer.seek(0)
+    return buffer
+
 
 # Login setup
 # Direct access to st.secrets
@@ -61,42 +101,60 @@ if authentication_status:
     start = st.text_input('Start Date (YYYY-MM-DDTHH:MM:SS, optional)')
     end = st.text_input('End Date (YYYY-MM-DDTHH:MM:SS, optional)')
     depth = st.number_input('Max Depth', min_value=1, max_value=5, value=3)
+    workers = st.number_input('Concurrent Fetches', min_value=1, max_value=16, value=4)
+    cache_only = st.checkbox('Offline (cached API responses only)')
 
     if st.button('Trace Transactions'):
         if not account and not tx_id:
             st.error('Please provide either an account or a transaction ID.')
         else:
-            node_levels = {}
-            alerts = []
-            if tx_id:
-                txn_data = get_transaction(tx_id)
-                initial_account = txn_data.get('Account', '')
-                transactions = [txn_data]
-                if 'Destination' in txn_data:
-                    node_levels[initial_account] = 0
-                    node_levels[txn_data['Destination']] = 1
-                    traced = set([initial_account])
-                    start_datetime = datetime.datetime.strptime(start, '%Y-%m-%dT%H:%M:%S') if start else None
-                    end_datetime = datetime.datetime.strptime(end, '%Y-%m-%dT%H:%M:%S') if end else None
-                    transactions.extend(trace_transactions(txn_data['Destination'], start_datetime, end_datetime, depth=1, max_depth=depth, traced=traced, node_levels=node_levels, alerts=alerts))
-            else:
-                initial_account = account
-                start_datetime = datetime.datetime.strptime(start, '%Y-%m-%dT%H:%M:%S') if start else None
-                end_datetime = datetime.datetime.strptime(end, '%Y-%m-%dT%H:%M:%S') if end else None
-                node_levels[initial_account] = 0
-                transactions = trace_transactions(account, start_datetime, end_datetime, max_depth=depth, node_levels=node_levels, alerts=alerts)
-            
-            G = build_graph(transactions, node_levels)
-            
-            # Generate graph image
-            fig = plt.figure(figsize=(10, 10))
-            visualize_graph(G, node_levels, filename=None)  # Modify visualize to not save but use fig
-            # Note: Need to adjust visualize_graph to draw on provided fig or return image
-            # For now, assume it saves to 'xrp_transaction_graph.png'
-            visualize_graph(G, node_levels)
-            img = Image.open('xrp_transaction_graph.png')
-            st.image(img, caption='Transaction Graph')
-            
+            start_datetime = datetime.datetime.strptime(start, '%Y-%m-%dT%H:%M:%S') if start else None
+            end_datetime = datetime.datetime.strptime(end, '%Y-%m-%dT%H:%M:%S') if end else None
+            # Identical requests share one job and its cached result, across users; concurrency
+            # changes how fast a trace runs, not what it finds, so it is not part of the key
+            key = (account, tx_id, start_datetime, end_datetime, depth, cache_only)
+            job = job_queue().submit(key, partial(run_trace, account, tx_id, start_datetime, end_datetime, depth, workers, cache_only),
+                                     description=tx_id or account, owner=username)
+            st.session_state['job_id'] = job.id
+            st.session_state.setdefault('job_ids', [])
+            if job.id not in st.session_state['job_ids']:
+                st.session_state['job_ids'].append(job.id)
+
+    # This user's jobs; pick one to view
+    jobs = [job for job in map(job_queue().get, st.session_state.get('job_ids', [])) if job is not None]
+    if jobs:
+        st.sidebar.subheader('Trace Jobs')
+        for listed in reversed(jobs):
+            if st.sidebar.button(f"{listed.description[:16]} ({listed.status})", key=f"job-{listed.id}"):
+                st.session_state['job_id'] = listed.id
+
+    job = job_queue().get(st.session_state.get('job_id'))
+    result = None
+    if job is not None:
+        progress = job.progress()
+        st.caption(f"Job {job.id}: {progress['status']}, {progress['visited']} accounts visited, "
+                   f"frontier {progress['frontier']}, {progress['requests']} requests, {progress['elapsed']:.0f}s")
+        if not job.done:
+            # Only the analyst who started a trace may cancel it; others may be waiting on it too
+            if job.owner == username and st.button('Cancel Trace'):
+                job.cancel()
+        elif job.status == 'failed':
+            st.error(f"Trace failed: {job.error}")
+        elif job.status == 'cancelled':
+            st.warning('Trace cancelled.')
+        else:
+            result = job.result
+            G, node_levels, alerts, transactions = result['graph'], result['node_levels'], result['alerts'], result['transactions']
+            if 'image' not in result:
+                # Rendered here rather than in the job: pyplot is not safe to use from worker threads
+                img_buf = visualize_graph(G, node_levels, filename=None, max_nodes=500, collapse_below=1.0)
+                result['image'] = img_buf.getvalue() if img_buf else None
+            if result['image']:
+                st.image(result['image'], caption='Transaction Graph')
+
+            stats = cache_utils.cache_stats()
+            st.caption(f"API cache: {stats['hits']} hits, {stats['misses']} misses")
+
             if alerts:
                 st.subheader('Alerts')
                 for alert in alerts:
@@ -116,29 +174,15 @@ if authentication_status:
         else:
             st.error('Address and Label are required.') 
 
-    if st.button('Generate PDF Report'):
-        pdf_buffer = generate_pdf_report(G, node_levels, alerts, transactions)
-        st.download_button('Download PDF Report', pdf_buffer, file_name='xrp_trace_report.pdf', mime='application/pdf')
+    if result and st.button('Generate Report'):
+        st.download_button('Download PDF Report', generate_report(result, 'pdf'), file_name='xrp_trace_report.pdf', mime='application/pdf')
+        st.download_button('Download HTML Report', generate_report(result, 'html'), file_name='xrp_trace_report.html', mime='text/html')
     authenticator.logout('Logout', 'sidebar')
+
+    if job is not None and not job.done:
+        time.sleep(JOB_POLL_SECONDS)
+        st.rerun()  # Poll until the job finishes; the trace itself keeps running between reruns
 elif authentication_status == False:
     st.error('Username/password is incorrect')
 elif authentication_status is None:
     st.warning('Please enter your username and password')
-
-def generate_pdf_report(G, node_levels, alerts, transactions):
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
-    c.drawString(100, 750, 'XRP Transaction Trace Report')
-    # Add summary, alerts, etc.
-    c.drawString(100, 700, 'Forensic Summary: Identified exchanges and mixers.')
-    for i, alert in enumerate(alerts):
-        c.drawString(100, 650 - i*20, alert)
-    # Add graph image (save temp and draw)
-    img_buf = visualize_graph(G, node_levels, filename=None)
-    if img_buf:
-        img = Image.open(img_buf)
-        img.save('temp_graph.png')
-        c.drawImage('temp_graph.png', 100, 300, width=400, height=300)
-    c.save()
-    buffer.seek(0)
-    return buffer 
\ No newline at end of file
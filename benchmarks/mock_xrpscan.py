@@ -0,0 +1,135 @@
+import json
+import time
+import random
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+ROOT = 'rBenchRoot'
+BASE_DATE = datetime(2023, 7, 15, 12, 0, 0)
+
+
+def account_name(level, index):
+    return ROOT if level == 0 else f"rBench{level}x{index}"
+
+
+def build_histories(fan_out=5, depth=3, noise=0, seed=0):
+    """Synthetic ledger: a tree fanning out fan_out payments per account down to depth.
+
+    Each account's history is newest first, like XRPSCAN: its outgoing payments, the payment
+    that funded it, and noise non-payment transactions. Deterministic for a given seed.
+    """
+    rng = random.Random(seed)
+    histories = {}
+    level_accounts = [ROOT]
+    for level in range(depth + 1):
+        next_accounts = []
+        for parent in level_accounts:
+            history = histories.setdefault(parent, [])
+            if level < depth:
+                for _ in range(fan_out):
+                    child = account_name(level + 1, len(next_accounts))
+                    next_accounts.append(child)
+                    payment = {'Account': parent, 'Destination': child, 'TransactionType': 'Payment',
+                               'Amount': {'currency': 'XRP', 'value': str(rng.randint(1, 10_000) * 1_000_000)}}
+                    history.append(payment)
+                    histories.setdefault(child, []).append(payment)
+            history.extend({'Account': parent, 'TransactionType': 'OfferCreate'} for _ in range(noise))
+        level_accounts = next_accounts
+    for history in histories.values():
+        rng.shuffle(history)
+        for i, txn in enumerate(history):
+            # Copies, so a payment shared by sender and receiver gets a date in each history
+            history[i] = dict(txn, hash=f"{rng.getrandbits(64):016X}", ledger_index=80_000_000 - i,
+                              date=(BASE_DATE - timedelta(minutes=i)).strftime('%Y-%m-%dT%H:%M:%S.000Z'))
+    return histories
+
+
+class MockXrpscanHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, so pooled connections are reused
+
+    def do_GET(self):
+        server = self.server
+        server.record('requests')
+        if server.latency:
+            time.sleep(server.latency)
+        fault = server.next_fault()
+        if fault:
+            server.record(f'injected_{fault}')
+            self._send(fault, {'error': 'injected'}, {'Retry-After': '0'} if fault == 429 else {})
+            return
+        url = urlsplit(self.path)
+        parts = url.path.strip('/').split('/')
+        if len(parts) < 2 or parts[-1] != 'transactions':
+            self._send(404, {'error': 'not found'})
+            return
+        history = server.histories.get(parts[-2], [])
+        query = parse_qs(url.query)
+        offset = int(query.get('marker', ['0'])[0])
+        limit = min(int(query.get('limit', ['200'])[0]), server.page_size)
+        body = {'transactions': history[offset:offset + limit]}
+        if offset + limit < len(history):
+            body['marker'] = str(offset + limit)
+        self._send(200, body)
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+        self.server.record('bytes', len(payload))
+
+    def log_message(self, *args):
+        pass
+
+
+class MockXrpscan(ThreadingHTTPServer):
+    """Local stand-in for the XRPSCAN account-transactions endpoint.
+
+    Serves build_histories() output with marker paging, optional per-request latency, and
+    429/504 responses injected at the given rates (seeded, so runs are reproducible).
+    """
+    daemon_threads = True
+
+    def __init__(self, histories, page_size=200, latency=0.0, rate_429=0.0, rate_504=0.0, seed=0):
+        super().__init__(('127.0.0.1', 0), MockXrpscanHandler)
+        self.histories = histories
+        self.page_size = page_size
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.rate_504 = rate_504
+        self.rng = random.Random(seed)
+        self.stats = {'requests': 0, 'injected_429': 0, 'injected_504': 0, 'bytes': 0}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def record(self, name, n=1):
+        with self.lock:
+            self.stats[name] += n
+
+    def next_fault(self):
+        with self.lock:
+            roll = self.rng.random()
+        if roll < self.rate_429:
+            return 429
+        if roll < self.rate_429 + self.rate_504:
+            return 504
+        return None
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,195 @@
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import xrp_track
+from utils import api_utils, cache_utils, db_utils
+from utils.records import Transfer
+from benchmarks.mock_xrpscan import MockXrpscan, build_histories, ROOT
+
+# Defaults for every knob; each is also a --flag
+DEFAULTS = {
+    'fan_out': 5, 'depth': 3, 'noise': 100, 'page_size': 50, 'latency': 0.0, 'rate_429': 0.0, 'rate_504': 0.0,
+    'workers': 4, 'edges': 100_000, 'history': 5_000, 'render_nodes': 2_000, 'repeat': 3, 'seed': 0,
+    'startup_target': 0.2,
+}
+TRACKED_METRICS = ('seconds', 'requests', 'peak_bytes')  # Compared against a baseline; higher is worse
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Dependencies only the rendering, report and network stages need; importing the CLI must not load them
+DEFERRED_MODULES = ('matplotlib', 'networkx', 'reportlab', 'requests', 'PIL')
+IMPORT_SCRIPT = '''
+import sys, json, time
+started = time.perf_counter()
+import xrp_track
+elapsed = time.perf_counter() - started
+print(json.dumps({'seconds': elapsed, 'loaded': sorted(name for name in %r if name in sys.modules)}))
+'''
+
+
+def measure(fn, repeat):
+    # Best wall time of untraced runs, then one traced run for the memory high-water mark
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, {'seconds': round(best, 4), 'peak_bytes': peak}
+
+
+def bench_trace(config, workdir):
+    histories = build_histories(config['fan_out'], config['depth'], config['noise'], config['seed'])
+    with MockXrpscan(histories, config['page_size'], config['latency'], config['rate_429'], config['rate_504'], config['seed']) as server:
+        xrp_track.XRPSCAN_API = f"{server.url}/api/v1"
+        runs = []
+
+        def run():
+            # Every run starts cold: empty page cache, fresh pools and rate limiter
+            cache_utils.CACHE_PATH = os.path.join(workdir, f"cache{len(runs)}.db")
+            api_utils.reset_api_state()
+            runs.append(dict(server.stats))
+            with redirect_stdout(io.StringIO()):
+                return xrp_track.trace_transactions(ROOT, None, None, max_depth=config['depth'], workers=config['workers'])
+
+        transfers, metrics = measure(run, config['repeat'])
+        last = {name: server.stats[name] - runs[-1][name] for name in server.stats}  # The traced run alone
+        api_utils.reset_api_state()
+    metrics.update(requests=last['requests'], injected_429=last['injected_429'], injected_504=last['injected_504'],
+                   bytes=last['bytes'], transfers=len(transfers), accounts=len(histories))
+    return metrics
+
+
+def synthetic_transfers(n, seed):
+    # A random tree of n payments under ROOT, with levels, as the tracer would yield them
+    rng = random.Random(seed)
+    node_levels = {ROOT: 0}
+    accounts = [ROOT]
+    transfers = []
+    for i in range(n):
+        source = accounts[rng.randrange(len(accounts))]
+        destination = f"rSynth{i}"
+        node_levels[destination] = node_levels[source] + 1
+        accounts.append(destination)
+        transfers.append(Transfer(source, destination, float(rng.randint(1, 10_000) * 1_000_000), 1689422400.0 + i, f"H{i}"))
+    return transfers, node_levels
+
+
+def bench_build_graph(config):
+    transfers, node_levels = synthetic_transfers(config['edges'], config['seed'])
+    G, metrics = measure(lambda: xrp_track.build_graph(transfers, dict(node_levels)), config['repeat'])
+    metrics.update(nodes=len(G), edges=G.number_of_edges())
+    return metrics
+
+
+def bench_heuristics(config):
+    # One busy account: history incoming and outgoing payments
+    rng = random.Random(config['seed'])
+    transfers = [Transfer(f"rIn{i}", ROOT, 1_000_000.0 * rng.randint(1, 500), 1689422400.0 + i) if i % 2 else
+                 Transfer(ROOT, f"rOut{i}", 1_000_000.0 * rng.randint(1, 500), 1689422400.0 + i)
+                 for i in range(config['history'])]
+    with redirect_stdout(io.StringIO()):
+        _, metrics = measure(lambda: xrp_track.detect_heuristics(transfers, ROOT, []), config['repeat'])
+    metrics.update(transfers=len(transfers))
+    return metrics
+
+
+def bench_render(config):
+    transfers, node_levels = synthetic_transfers(config['render_nodes'], config['seed'])
+    G = xrp_track.build_graph(transfers, node_levels)
+    with redirect_stdout(io.StringIO()):
+        _, metrics = measure(lambda: xrp_track.visualize_graph(G, node_levels, filename=None), config['repeat'])
+    metrics.update(nodes=len(G))
+    return metrics
+
+
+def bench_import(config):
+    # Import time of the CLI module in a fresh interpreter (interpreter startup excluded)
+    runs = [json.loads(subprocess.run([sys.executable, '-c', IMPORT_SCRIPT % (DEFERRED_MODULES,)], cwd=ROOT_DIR, check=True,
+                                      capture_output=True, text=True).stdout.splitlines()[-1]) for _ in range(config['repeat'])]
+    seconds = min(run['seconds'] for run in runs)
+    return {'seconds': round(seconds, 4), 'within_target': seconds <= config['startup_target'], 'deferred_loaded': runs[0]['loaded']}
+
+
+def run_benchmarks(config=None, only=None):
+    """Run the suite offline; returns a JSON-serialisable dict of config, environment and results."""
+    config = dict(DEFAULTS, **(config or {}))
+    benches = {'import': bench_import, 'trace_transactions': bench_trace, 'build_graph': bench_build_graph,
+               'detect_heuristics': bench_heuristics, 'visualize_graph': bench_render}
+    saved = (xrp_track.XRPSCAN_API, cache_utils.CACHE_PATH, db_utils.DB_PATH, api_utils.PROVIDER_LIMITS.get('127.0.0.1'),
+             api_utils.BACKOFF_BASE)
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        db_utils.DB_PATH = os.path.join(workdir, 'tags.db')  # Empty tag store; never touches data/tags.db
+        api_utils.PROVIDER_LIMITS['127.0.0.1'] = (10_000.0, 100)  # The mock server is not rate limited
+        api_utils.BACKOFF_BASE = 0.01  # Injected faults are retried without real-world waits
+        try:
+            for name, bench in benches.items():
+                if only and name not in only:
+                    continue
+                results[name] = bench(config, workdir) if name == 'trace_transactions' else bench(config)
+        finally:
+            xrp_track.XRPSCAN_API, cache_utils.CACHE_PATH, db_utils.DB_PATH = saved[:3]
+            if saved[3] is None:
+                api_utils.PROVIDER_LIMITS.pop('127.0.0.1', None)
+            else:
+                api_utils.PROVIDER_LIMITS['127.0.0.1'] = saved[3]
+            api_utils.BACKOFF_BASE = saved[4]
+    return {
+        'config': config,
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'results': results,
+    }
+
+
+def compare(report, baseline, tolerance=0.2):
+    """List the tracked metrics that grew by more than tolerance over the baseline report."""
+    regressions = []
+    for name, metrics in report['results'].items():
+        old = baseline.get('results', {}).get(name, {})
+        for metric in TRACKED_METRICS:
+            if metric in metrics and old.get(metric) and metrics[metric] > old[metric] * (1 + tolerance):
+                regressions.append(f"{name}.{metric}: {old[metric]} -> {metrics[metric]} (+{metrics[metric] / old[metric] - 1:.0%})")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline tracer benchmarks against a mock XRPSCAN server.")
+    for name, default in DEFAULTS.items():
+        parser.add_argument(f"--{name}", type=type(default), default=default)
+    parser.add_argument("--only", help="Comma-separated benchmarks to run (default: all)")
+    parser.add_argument("--output", default="bench_results.json", help="Where to write the JSON results")
+    parser.add_argument("--baseline", help="Earlier results file; exit non-zero if a tracked metric regressed")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed growth over the baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    config = {name: getattr(args, name) for name in DEFAULTS}
+    report = run_benchmarks(config, args.only.split(',') if args.only else None)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    for name, metrics in report['results'].items():
+        print(f"{name}: " + ', '.join(f"{metric}={value}" for metric, value in metrics.items()))
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
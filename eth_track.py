@@ -1,181 +1,300 @@
-import numpy as np
-import requests
-import networkx as nx
-import matplotlib.pyplot as plt
 import time
+import calendar
 from datetime import datetime, timedelta
-import random
+import argparse
+from functools import partial
+from contextlib import ExitStack
 from dotenv import load_dotenv
 import os
+from utils.api_utils import ApiError, backoff_delay, request_json, pacing_stats, ensure_pool_size  # Shared rate limiter, backoff and pooled sessions
+from utils import cache_utils  # On-disk cache of API responses
+from utils.records import Transfer, format_units  # Compact records with exact integer amounts
+from utils.backends import LedgerBackend
+from utils.taint import TAINT_MODELS  # Taint propagation models
+from utils.clusters import update_clusters  # Persistent address clusters
+from utils.report import write_report  # Paginated PDF/HTML reports
+from utils import tracer, graph  # Chain-agnostic tracing and graph core
+from utils.tracer import DEFAULT_WORKERS, MIN_TRACE_AMOUNT, MIN_TAINT_SHARE, analyze_heuristics
+from utils.graph import visualize_graph
+from utils.heuristics import load_rules
+from utils.session import TraceSession  # Per-trace state
+from utils import metrics  # Stage timers, counters and profiling
 
 load_dotenv()
 # Etherscan API key
 API_KEY = os.getenv('ETHERSCAN_API_KEY')
+API_URL = "https://api.etherscan.io/api"
 
-# Function to fetch transactions for a given account with retry on rate limiting
-def get_transactions(account, startblock=0, endblock=99999999, page=1, offset=10000, sort='desc'):
-    url = f"https://api.etherscan.io/api"
-    params = {
-        'module': 'account',
-        'action': 'txlist',
-        'address': account,
-        'startblock': startblock,
-        'endblock': endblock,
-        'page': page,
-        'offset': offset,
-        'sort': sort,
-        'apikey': API_KEY
-    }
-    while True:
-        response = requests.get(url, params=params)
-        if response.status_code == 429:
-            print("Rate limit hit, sleeping for 60 seconds...")
-            time.sleep(60)
-        else:
-            response.raise_for_status()
-            return response.json()
-
-
-# Recursive function to fetch all transactions for an account within a date range
-def fetch_all_transactions(account, start_datetime, end_datetime, depth=1, max_depth=2):
-    transactions = []
-    page = 1
+# Etherscan returns at most 10,000 rows per query (page * offset <= 10000), so longer histories
+# are walked by moving startblock forward rather than by page number
+PAGE_SIZE = 10000
+LATEST_BLOCK = 99999999
+
+# Transfer kinds and the Etherscan account action that lists them
+ACTIONS = {'normal': 'txlist', 'internal': 'txlistinternal', 'token': 'tokentx'}
+DEFAULT_KINDS = ('normal', 'internal', 'token')
+
+# Token contract -> (symbol, decimals), filled in as token transfers are fetched
+TOKENS = {}
+
+
+def unix_time(dt):
+    # Naive datetimes are UTC throughout, as in xrp_track
+    return calendar.timegm(dt.utctimetuple())
+
+
+def etherscan_call(params, retries=5):
+    # Etherscan reports rate limiting in a 200 response body rather than with a 429
+    params = dict(params, apikey=API_KEY)
+    for attempt in range(retries):
+        data = request_json(API_URL, params=params)
+        result = data.get('result')
+        if data.get('status') == '0' and isinstance(result, str) and 'rate limit' in result.lower():
+            delay = backoff_delay(attempt)
+            print(f"Etherscan rate limit hit, sleeping for {delay:.1f} seconds...")
+            time.sleep(delay)
+            continue
+        return data
+    raise ApiError(f"Etherscan rate limit persisted after {retries} attempts")
+
+
+# Convert a date bound to a block number: the first block at or after a start date, the last
+# at or before an end date. Returns None for dates not yet mined.
+def block_at(dt, closest='before', cache_only=None):
+    if dt is None:
+        return None
+    timestamp = unix_time(dt)
+    if timestamp >= time.time():
+        return None
+    key = f"eth:block:{timestamp}:{closest}"
+    cached = cache_utils.get_cached(key)
+    if cached is not None:
+        return cached
+    if cache_utils.is_offline(cache_only):
+        raise cache_utils.CacheMissError(f"No cached block number for {dt} ({closest})")
+    data = etherscan_call({'module': 'block', 'action': 'getblocknobytime', 'timestamp': timestamp, 'closest': closest})
+    if data.get('status') != '1':
+        raise ApiError(f"Etherscan could not resolve a block for {dt}: {data.get('result')}")
+    block = int(data['result'])
+    cache_utils.put_cached(key, block)
+    return block
+
+
+def block_range(start_datetime, end_datetime, cache_only=None):
+    startblock = block_at(start_datetime, 'after', cache_only)
+    endblock = block_at(end_datetime, 'before', cache_only)
+    return (0 if startblock is None else startblock), (LATEST_BLOCK if endblock is None else endblock)
+
+
+# Function to fetch one window of an account's transfers (cached; a window ending at a mined block never changes)
+@metrics.timed('get_transactions')
+def get_transactions(account, action='txlist', startblock=0, endblock=LATEST_BLOCK, offset=PAGE_SIZE, cache_only=None, head_ttl=None):
+    key = f"eth:{action}:{account}:{startblock}:{endblock}:{offset}"
+    offline = cache_utils.is_offline(cache_only)
+    # Offline, a stale open-ended window is still the best data there is
+    cached = cache_utils.get_cached(key, ttl=cache_utils.head_page_ttl(head_ttl) if endblock == LATEST_BLOCK and not offline else None)
+    if cached is not None:
+        return cached
+    if offline:
+        raise cache_utils.CacheMissError(f"No cached {action} window for account {account} ({startblock}-{endblock})")
+    data = etherscan_call({'module': 'account', 'action': action, 'address': account, 'startblock': startblock,
+                           'endblock': endblock, 'page': 1, 'offset': offset, 'sort': 'asc'})
+    if not isinstance(data.get('result'), list):
+        raise ApiError(f"Etherscan {action} failed for {account}: {data.get('result')}")
+    rows = data['result']  # 'No transactions found' comes back as status 0 with an empty list
+    cache_utils.put_cached(key, rows)
+    return rows
+
+
+def _row_key(row):
+    return row['hash'], row.get('traceId'), row.get('logIndex')
+
+
+# Stream an account's rows of one kind within a block range, oldest first. A full window is
+# followed by one starting at its last block; rows from that boundary block are not repeated.
+def iter_account_rows(account, action, startblock=0, endblock=LATEST_BLOCK, session=None):
+    boundary = set()
+    cache_only, head_ttl = (session.cache_only, session.head_page_ttl) if session is not None else (None, None)
     while True:
-        data = get_transactions(account, page=page)
-        if data['status'] == '0':
+        rows = get_transactions(account, action, startblock, endblock, cache_only=cache_only, head_ttl=head_ttl)
+        metrics.count('pages_fetched')
+        if session is not None:
+            session.count('pages_fetched')
+            session.count('pages_used', 1 if rows else 0)
+        for row in rows:
+            if _row_key(row) not in boundary:
+                yield row
+        if len(rows) < PAGE_SIZE:
             break
-        for txn in data['result']:
-            txn_time = int(txn['timeStamp'])
-            txn_date = datetime.utcfromtimestamp(txn_time)
-            amount = float(txn['value']) / 1e18  # Convert from Wei to Ether
-            if start_datetime <= txn_date <= end_datetime and amount > 0.0000:
-                print(f"Including transaction: {txn['hash']} - {amount:.10f} ETH")  # Debug statement
-                transactions.append(txn)
-        if len(data['result']) < 10000:
+        last = int(rows[-1]['blockNumber'])
+        if last == startblock:
+            print(f"Warning: block {last} holds more than {PAGE_SIZE} {action} rows for {account}; truncated")
+            if session is not None:
+                session.complete_histories.discard(account)
             break
-        page += 1
-    return transactions
-
-
-# Recursive function to trace ETH flow within a date range
-def trace_transactions(account, start_datetime, end_datetime, depth=0, max_depth=2, traced=set(), node_levels={}):
-    if depth > max_depth or account in traced:
-        return []
-
-    print(f"Tracing transactions for account {account} at depth {depth}")
-
-    traced.add(account)
-    transactions = fetch_all_transactions(account, start_datetime, end_datetime, depth, max_depth)
-    all_transactions = []
-
-    for txn in transactions:
-        destination = txn['to']
-        amount = float(txn['value']) / 1e18  # Convert from Wei to Ether
-        if destination and destination not in traced and amount > 0.0000:
-            all_transactions.append(txn)
-            node_levels[destination] = depth + 1
-            all_transactions.extend(
-                trace_transactions(destination, start_datetime, end_datetime, depth + 1, max_depth, traced,
-                                   node_levels))
-
-    return all_transactions
-
-
-def build_graph(transactions, node_levels):
-    G = nx.DiGraph()
-    for txn in transactions:
-        source = txn['from']
-        destination = txn['to']
-        amount = float(txn['value']) / 1e18  # Convert from Wei to Ether
-        G.add_edge(source, destination, weight=amount)
-        if source not in node_levels:
-            node_levels[source] = 0  # Original wallet level
-        # Set the subset_key attribute for each node
-        G.nodes[source]['subset_key'] = node_levels[source]
-        G.nodes[destination]['subset_key'] = node_levels[destination]
-    return G
-
-
-def format_wallet_address(address):
-    return f"{address[:4]}...{address[-4:]}"
-
-
-def visualize_graph(G, node_levels, scale_factor=3.0, filename="graph.png"):
-    pos = {}
-    level_nodes = {}
-    max_depth = max(node_levels.values())
-
-    # Group nodes by levels
-    for node, level in node_levels.items():
-        if level not in level_nodes:
-            level_nodes[level] = []
-        level_nodes[level].append(node)
-
-    # Sort nodes at each level by descending transaction amount
-    for level, nodes in level_nodes.items():
-        if level == 0:
-            pos[nodes[0]] = (0, 0)
-        else:
-            nodes.sort(key=lambda node: sum([G.edges[edge]['weight'] for edge in G.in_edges(node)]), reverse=True)
-            for i, node in enumerate(nodes):
-                pos[node] = (level, -i)
-
-    # Perturb node positions slightly to avoid overlapping edges
-    for node in pos:
-        x, y = pos[node]
-        pos[node] = (x + random.uniform(-0.05, 0.05), y + random.uniform(-0.05, 0.05))
-
-    remaining_nodes = set(G.nodes) - set(pos.keys())
-    for node in remaining_nodes:
-        pos[node] = (random.uniform(0, max_depth + 1), random.uniform(-len(G.nodes) / 2, len(G.nodes) / 2))
-
-    plt.figure(figsize=(30, 30))
-
-    color_map = []
-    for node in G:
-        level = node_levels[node]
-        gray_value = 1 - (level / max(node_levels.values())) * 0.8
-        color_map.append((gray_value, gray_value, gray_value))
-
-    edge_weights = [G.edges[edge]['weight'] for edge in G.edges]
-
-    if edge_weights:  # Check if edge_weights is not empty
-        sorted_weights = sorted(edge_weights)
-        quantiles = np.percentile(sorted_weights, [25, 50, 75])
-
-        edge_color_map = []
-        for edge in G.edges:
-            weight = G.edges[edge]['weight']
-            if weight <= quantiles[0]:
-                edge_color_map.append('#084960')
-            elif weight <= quantiles[1]:
-                edge_color_map.append('#016E93')
-            elif weight <= quantiles[2]:
-                edge_color_map.append('#4897B4')
-            else:
-                edge_color_map.append('#B0D8E9')
-    else:
-        edge_color_map = ['#084960'] * len(G.edges)  # Default color if no edges
+        boundary = {_row_key(row) for row in rows if int(row['blockNumber']) == last}
+        startblock = last
+
+
+@metrics.timed('fetch_all_transactions')
+def fetch_all_transactions(account, start_datetime, end_datetime, kinds=DEFAULT_KINDS):
+    startblock, endblock = block_range(start_datetime, end_datetime)
+    return [row for kind in kinds for row in iter_account_rows(account.lower(), ACTIONS[kind], startblock, endblock)]
+
 
-    labels = {node: format_wallet_address(node) for node in G.nodes}
-    nx.draw(G, pos, with_labels=True, labels=labels, node_size=200, node_color=color_map, font_size=10,
-            font_weight='bold',
-            edge_color=edge_color_map)
-    edge_labels = {edge: f"{G.edges[edge]['weight']:,} ETH" for edge in G.edges}
-    nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels)
-    plt.savefig(filename)
-    print(f"Graph saved as {filename}")
+def to_transfer(row):
+    if 'tokenDecimal' in row:
+        TOKENS.setdefault(row['contractAddress'].lower(), (row.get('tokenSymbol') or '?', int(row['tokenDecimal'] or 0)))
+    return Transfer.from_etherscan(row)
+
+
+def is_value_transfer(row):
+    # Failed calls, contract creations and zero-value calls move nothing
+    return bool(row.get('to')) and row.get('isError', '0') != '1' and int(row.get('value') or 0) > 0
+
+
+# Etherscan as a tracer backend: the date window becomes a block range once per trace, and an
+# account's history is its normal, internal and token transfers within it, in both directions
+class EtherscanBackend(LedgerBackend):
+    name = 'etherscan'
+    unit = 'ETH'
+    decimals = 18  # Amounts are integer wei
+
+    def __init__(self, kinds=DEFAULT_KINDS):
+        self.kinds = kinds
+
+    def normalize(self, account):
+        return account.lower()
+
+    def window(self, start_datetime, end_datetime, session=None):
+        startblock, endblock = block_range(start_datetime, end_datetime, session.cache_only if session is not None else None)
+        print(f"Tracing blocks {startblock} to {endblock}")
+        return startblock, endblock
+
+    def reaches_genesis(self, window):
+        return window[0] == 0
+
+    def fetch_page(self, account, window, cursor=None):
+        # One Etherscan window of one kind. cursor is (kind index, start block, keys of the rows
+        # from that block already returned); kinds are paged one after another
+        kind, startblock, boundary = cursor or (0, window[0], frozenset())
+        rows = get_transactions(account, ACTIONS[self.kinds[kind]], startblock, window[1])
+        transfers = [to_transfer(row) for row in rows if _row_key(row) not in boundary and is_value_transfer(row)]
+        last = int(rows[-1]['blockNumber']) if rows else None
+        if len(rows) >= PAGE_SIZE and last != startblock:
+            return transfers, (kind, last, frozenset(_row_key(row) for row in rows if int(row['blockNumber']) == last))
+        return transfers, ((kind + 1, window[0], frozenset()) if kind + 1 < len(self.kinds) else None)
+
+    def iter_account(self, account, window, depth=0, max_depth=0, watermarks=None, session=None):
+        startblock, endblock = window
+        if session is not None and self.reaches_genesis(window):
+            session.complete_histories.add(account)  # Withdrawn by iter_account_rows if a block is truncated
+        for kind in self.kinds:
+            for row in iter_account_rows(account, ACTIONS[kind], startblock, endblock, session):
+                if is_value_transfer(row):
+                    yield to_transfer(row)
+
+    def format_value(self, amount, asset=None):
+        if asset is None:
+            return f"{format_units(amount)} ETH"
+        symbol, decimals = TOKENS.get(asset, (asset, 0))
+        return f"{format_units(amount, decimals)} {symbol}"
+
+
+ETHERSCAN = EtherscanBackend()
+
+# The shared tracing and graph core, bound to Etherscan
+iter_trace = partial(tracer.iter_trace, ETHERSCAN)
+trace_transactions = partial(tracer.trace_transactions, ETHERSCAN)
+iter_priority_trace = partial(tracer.iter_priority_trace, ETHERSCAN)
+build_graph = partial(graph.build_graph, ETHERSCAN)
+analyze_taint = partial(tracer.analyze_taint, ETHERSCAN)
 
 
 # Main function
 if __name__ == "__main__":
-    initial_account = "0xb566f98023AD311499f4A30350da878FFd543954"
-    end_datetime = datetime.utcnow()
-    start_datetime = end_datetime - timedelta(weeks=13)
-
-    node_levels = {initial_account: 0}  # Level of the initial account
-    transactions = trace_transactions(initial_account, start_datetime, end_datetime, max_depth=2,
-                                      node_levels=node_levels)
-    G = build_graph(transactions, node_levels)
-    visualize_graph(G, node_levels, scale_factor=3.0,
-                    filename="ena_claimer1.png")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Trace ETH and token transfers and visualize flow.")
+    parser.add_argument("--account", required=True, help="Starting Ethereum address")
+    parser.add_argument("--start", help="Start date (YYYY-MM-DDTHH:MM:SS) (default: 13 weeks before --end)")
+    parser.add_argument("--end", help="End date (YYYY-MM-DDTHH:MM:SS) (default: now)")
+    parser.add_argument("--depth", type=int, default=2, help="Max recursion depth for tracing")
+    parser.add_argument("--kinds", default=','.join(DEFAULT_KINDS), help="Comma-separated transfer kinds to follow: normal, internal, token")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Max accounts fetched concurrently per depth level")
+    parser.add_argument("--strategy", choices=["bfs", "value"], default="bfs", help="Expand every account level by level (bfs) or the highest-value flows first (value)")
+    parser.add_argument("--min_amount", type=float, default=MIN_TRACE_AMOUNT, help="Value strategy: ignore transfers below this many ETH")
+    parser.add_argument("--min_taint", type=float, default=MIN_TAINT_SHARE, help="Value strategy: don't expand accounts receiving less than this share of traced funds")
+    parser.add_argument("--follow_tagged", action="store_true", help="Value strategy: keep tracing through tagged addresses")
+    parser.add_argument("--cache-only", action="store_true", help="Offline mode: use only cached API responses")
+    parser.add_argument("--rules", help="JSON file of heuristic rules and thresholds (default: built-in rules)")
+    parser.add_argument("--skip_heuristics", action="store_true", help="Skip the whole-trace heuristics (per-hop mixer screening still runs)")
+    parser.add_argument("--max_requests", type=int, help="Stop expanding after this many API pages")
+    parser.add_argument("--max_seconds", type=float, help="Stop expanding after this many seconds")
+    parser.add_argument("--max_nodes", type=int, help="Draw only the root(s) and the N highest-value nodes")
+    parser.add_argument("--taint", choices=TAINT_MODELS, help="Estimate how much traced value reached each account (haircut, poison or fifo), alert on exchanges and tags it reached, and shade the graph by it")
+    parser.add_argument("--cluster", action="store_true", help="Merge this trace's funding, activation and deposit-tag links into the address cluster index")
+    parser.add_argument("--profile", nargs="?", const="", metavar="FILE", help="Profile the run with cProfile and tracemalloc; optionally save pstats to FILE")
+    parser.add_argument("--metrics", metavar="FILE", help="Write stage timings and counters to FILE (.prom/.txt: Prometheus text, otherwise JSON)")
+    parser.add_argument("--metrics_port", type=int, help="Serve live metrics on this port (/metrics and /metrics.json)")
+    parser.add_argument("--graph_file", default="eth_transaction_graph.png", help="Graph output file (.png or .svg)")
+    parser.add_argument("--report", help="Also write a report: PDF, or HTML for a .html name (summary, graph, alerts, flow and transfer tables)")
+    args = parser.parse_args()
+
+    kinds = tuple(kind.strip() for kind in args.kinds.split(',') if kind.strip())
+    unknown = set(kinds) - set(ACTIONS)
+    if unknown:
+        parser.error(f"Unknown --kinds: {', '.join(sorted(unknown))}")
+    if args.metrics_port:
+        metrics.serve_metrics(args.metrics_port)
+    profiling = ExitStack()
+    if args.profile is not None:
+        profiling.enter_context(metrics.profiled(args.profile or None))
+    backend = EtherscanBackend(kinds)
+    ensure_pool_size(args.workers)  # One keep-alive connection per fetch worker
+
+    end_datetime = datetime.strptime(args.end, '%Y-%m-%dT%H:%M:%S') if args.end else datetime.utcnow()
+    start_datetime = datetime.strptime(args.start, '%Y-%m-%dT%H:%M:%S') if args.start else end_datetime - timedelta(weeks=13)
+
+    # Every fetched transfer is held only for the analyses that need it; the report needs just the kept ones
+    collect_history = not args.skip_heuristics or bool(args.taint) or args.cluster
+    session = TraceSession(collect_history=collect_history, max_requests=args.max_requests, max_seconds=args.max_seconds,
+                           cache_only=args.cache_only)
+    if args.rules:
+        session.rules = load_rules(args.rules)
+    if args.strategy == "value":
+        transactions = tracer.iter_priority_trace(backend, args.account, start_datetime, end_datetime, max_depth=args.depth, workers=args.workers,
+                                                  min_amount=args.min_amount, min_taint=args.min_taint, stop_at_tagged=not args.follow_tagged, session=session)
+    else:
+        transactions = tracer.iter_trace(backend, args.account, start_datetime, end_datetime, max_depth=args.depth, workers=args.workers, session=session)
+    kept = []
+    if args.report:
+        transactions = tracer.iter_kept(transactions, kept)
+    with metrics.stage('tracing'):  # The whole trace, including the graph it streams into
+        G = graph.build_graph(backend, transactions, session.node_levels, session.suspected_mixers)
+    if not args.skip_heuristics:
+        analyze_heuristics(session.history, session.alerts, session.rules, backend.decimals)
+    if args.taint:
+        tracer.analyze_taint(backend, session.history, [args.account], session.alerts, args.taint, G)
+    if args.cluster:
+        merges = update_clusters(session.history, backend.known_exchanges, tracer.KNOWN_TAGS, session.suspected_mixers,
+                                 complete=session.complete_histories)
+        print(f"Cluster index: {merges} new merges")
+    image = visualize_graph(G, session.node_levels, scale_factor=3.0, filename=args.graph_file, max_nodes=args.max_nodes)
+    if args.report:
+        write_report(args.report, G, session.alerts, 'Ethereum Transaction Trace Report', transfers=kept, image=image)
+        print(f"Report saved as {args.report}")
+    profiling.close()  # Prints the profile, if one was taken
+    if args.metrics:
+        metrics.write_metrics(args.metrics)
+
+    summary = session.summary()
+    print(f"Trace: {summary['visited']} accounts visited, {summary['accounts_fetched']} fetched, {summary['transfers_kept']} transfers kept, "
+          f"{summary['pages_fetched']} pages in {summary['elapsed']:.1f}s")
+    for host, host_stats in pacing_stats().items():
+        print(f"{host}: {host_stats['requests']} requests, {host_stats['rate_limited']} rate limited, "
+              f"{host_stats['pacing_wait']:.1f}s paced")
+    if session.alerts:
+        print("\nSummary of Alerts:")
+        for alert in session.alerts:
+            print(alert)
+    else:
+        print("\nNo tagged addresses detected in the traced path.")
@@ -0,0 +1,7 @@
+import pytest
+
+@pytest.fixture(autouse=True)
+def isolated_tag_db(tmp_path, monkeypatch):
+    # Keep the tracer's tag and cluster lookups off the shared data/ databases during tests
+    monkeypatch.setattr('utils.db_utils.DB_PATH', str(tmp_path / 'tags.db'))
+    monkeypatch.setattr('utils.clusters.CLUSTER_PATH', str(tmp_path / 'clusters.db'))
@@ -0,0 +1,83 @@
+import pytest
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from utils import api_utils
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Serves the queued (status, headers) responses in order, then 200 with a JSON body
+    responses = []
+    protocol_version = 'HTTP/1.1'  # Keep-alive, so pooled connections are reused
+
+    def do_GET(self):
+        status, headers = self.responses.pop(0) if self.responses else (200, {})
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        body = json.dumps({'path': self.path}).encode()
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    monkeypatch.setattr('utils.api_utils.BACKOFF_BASE', 0.01)
+    monkeypatch.setattr('utils.api_utils.DEFAULT_LIMIT', (100.0, 10))
+    api_utils.reset_api_state()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    api_utils.reset_api_state()  # Closes pooled keep-alive connections
+    server.shutdown()
+    StubHandler.responses = []
+
+def test_request_json_honours_retry_after(stub_server):
+    StubHandler.responses = [(429, {'Retry-After': '0'}), (504, {})]
+    data = api_utils.request_json(f"{stub_server}/account/x")
+    assert data == {'path': '/account/x'}
+    stats = api_utils.pacing_stats()['127.0.0.1']
+    assert stats['requests'] == 3
+    assert stats['rate_limited'] == 1
+    assert stats['retries'] == 2
+
+def test_request_json_gives_up_after_retries(stub_server):
+    StubHandler.responses = [(503, {})] * 3
+    with pytest.raises(api_utils.ApiError):
+        api_utils.request_json(f"{stub_server}/down", retries=3)
+    assert api_utils.pacing_stats()['127.0.0.1']['errors'] == 1
+
+def test_token_bucket_throttles_and_recovers():
+    bucket = api_utils.TokenBucket(rate=100.0, capacity=2)
+    assert bucket.acquire() == 0.0
+    bucket.throttle()
+    assert bucket.rate == 50.0
+    assert bucket.acquire() > 0  # Tokens were drained by the 429
+    bucket.recover()
+    assert bucket.rate == 60.0
+    assert api_utils.retry_after_seconds('7') == 7.0
+    assert api_utils.retry_after_seconds(None) is None
+
+def test_pooled_session_reuses_connection(stub_server):
+    for i in range(3):
+        api_utils.request_json(f"{stub_server}/page/{i}")
+    stats = api_utils.pacing_stats()['127.0.0.1']
+    assert stats['requests'] == 3
+    assert stats['new_connections'] == 1
+    assert stats['bytes'] > 0
+    latency = api_utils.latency_stats()['127.0.0.1']
+    assert latency['connect'] > 0 and latency['ttfb'] > 0
+
+def test_pool_grows_to_the_worker_count(stub_server):
+    # Edge case: more fetch workers than the default pool must not queue for connections
+    from urllib.parse import urlsplit
+    host = urlsplit(stub_server).hostname
+    assert api_utils.get_session(host).get_adapter(stub_server)._pool_maxsize == api_utils.DEFAULT_POOL_SIZE
+    api_utils.ensure_pool_size(16)
+    assert api_utils.get_session(host).get_adapter(stub_server)._pool_maxsize == 16
+    api_utils.ensure_pool_size(2)  # Never shrinks
+    assert api_utils.get_session(host).get_adapter(stub_server)._pool_maxsize == 16
@@ -0,0 +1,31 @@
+import requests
+from benchmarks.mock_xrpscan import MockXrpscan, build_histories, ROOT
+from benchmarks.run_benchmarks import run_benchmarks, compare, bench_import
+
+def test_mock_server_pages_histories_and_injects_faults():
+    histories = build_histories(fan_out=2, depth=1, noise=5)
+    assert len(histories) == 3 and len(histories[ROOT]) == 7
+    with MockXrpscan(histories, page_size=4) as server:
+        url = f"{server.url}/api/v1/account/{ROOT}/transactions"
+        first = requests.get(url, params={'limit': 200}).json()
+        second = requests.get(url, params={'limit': 200, 'marker': first['marker']}).json()
+        assert len(first['transactions']) == 4 and len(second['transactions']) == 3 and 'marker' not in second
+        server.rate_429 = 1.0
+        response = requests.get(url)
+        assert response.status_code == 429 and response.headers['Retry-After'] == '0'
+        assert server.stats['requests'] == 3 and server.stats['injected_429'] == 1
+
+def test_trace_benchmark_runs_offline_and_retries_faults():
+    config = {'fan_out': 2, 'depth': 2, 'noise': 10, 'page_size': 5, 'rate_504': 0.1, 'repeat': 1}
+    results = run_benchmarks(config, only=['trace_transactions'])['results']['trace_transactions']
+    assert results['accounts'] == 7 and results['transfers'] == 6
+    assert results['requests'] > results['injected_504'] + results['injected_429']
+
+def test_compare_flags_only_regressions_beyond_tolerance():
+    baseline = {'results': {'build_graph': {'seconds': 1.0, 'peak_bytes': 1000, 'nodes': 10}}}
+    report = {'results': {'build_graph': {'seconds': 1.1, 'peak_bytes': 2000, 'nodes': 99}, 'new_bench': {'seconds': 5.0}}}
+    assert compare(report, baseline, tolerance=0.2) == ['build_graph.peak_bytes: 1000 -> 2000 (+100%)']
+
+def test_cli_import_defers_plotting_report_and_http_dependencies():
+    results = bench_import({'repeat': 1, 'startup_target': 0.2})
+    assert results['deferred_loaded'] == []
@@ -0,0 +1,81 @@
+import pytest
+from unittest.mock import patch
+from utils import cache_utils
+
+@pytest.fixture
+def temp_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr('utils.cache_utils.CACHE_PATH', str(tmp_path / 'cache.db'))
+    monkeypatch.setattr('utils.cache_utils.CACHE_ONLY', False)
+    cache_utils.reset_cache_stats()
+    return tmp_path
+
+def test_get_transactions_served_from_cache(temp_cache):
+    from xrp_track import get_transactions
+    with patch('xrp_track.request_json') as mock_get:
+        mock_get.return_value = {'transactions': [{'hash': 'h1'}], 'marker': 'm1'}
+        first = get_transactions('acct')
+        second = get_transactions('acct')
+        assert first == second
+        assert mock_get.call_count == 1
+    stats = cache_utils.cache_stats()
+    assert stats['hits'] == 1 and stats['misses'] == 1
+
+def test_cache_only_raises_on_miss(temp_cache, monkeypatch):
+    from xrp_track import get_transactions, iter_account_transactions
+    from utils.session import TraceSession
+    # A trace's own offline setting applies without touching the process-wide flag
+    with patch('xrp_track.request_json') as mock_get:
+        with pytest.raises(cache_utils.CacheMissError):
+            list(iter_account_transactions('offline_acct', None, None, session=TraceSession(cache_only=True)))
+        assert mock_get.call_count == 0
+    assert cache_utils.CACHE_ONLY is False
+    monkeypatch.setattr('utils.cache_utils.CACHE_ONLY', True)
+    with pytest.raises(cache_utils.CacheMissError):
+        get_transactions('unknown_acct')
+    # Head pages past their TTL are still served offline
+    cache_utils.put_cached(cache_utils.page_key('acct'), {'transactions': []})
+    monkeypatch.setattr('utils.cache_utils.HEAD_PAGE_TTL', -1)
+    assert get_transactions('acct') == {'transactions': []}
+
+def test_head_page_ttl_and_eviction(temp_cache):
+    cache_utils.put_cached('a', {'n': 1})
+    cache_utils.put_cached('b', {'n': 2})
+    assert cache_utils.get_cached('a', ttl=-1) is None  # Expired
+    assert cache_utils.get_cached('a') == {'n': 1}  # Settled pages never expire
+    conn = cache_utils.connect_cache()
+    assert cache_utils.evict(conn, max_bytes=1) == 2
+    conn.close()
+    assert cache_utils.get_cached('b') is None
+
+def test_offline_and_head_ttl_follow_the_session(temp_cache):
+    # Each trace carries its own settings: an offline ETH trace never asks Etherscan for block numbers
+    eth_track = pytest.importorskip('eth_track')
+    from datetime import datetime
+    from utils.session import TraceSession
+    with patch('eth_track.etherscan_call') as mock_call:
+        with pytest.raises(cache_utils.CacheMissError):
+            eth_track.EtherscanBackend().window(datetime(2020, 1, 1), None, TraceSession(cache_only=True))
+        assert mock_call.call_count == 0
+    # A re-trace refetches the head page without changing the TTL for anyone else
+    from xrp_track import iter_account_transactions
+    cache_utils.put_cached(cache_utils.page_key('acct'), {'transactions': []})
+    with patch('xrp_track.request_json', return_value={'transactions': []}) as mock_get:
+        list(iter_account_transactions('acct', None, None, session=TraceSession()))
+        assert mock_get.call_count == 0
+        list(iter_account_transactions('acct', None, None, session=TraceSession(head_page_ttl=0)))
+        assert mock_get.call_count == 1
+    assert cache_utils.HEAD_PAGE_TTL > 0
+
+def test_hits_reuse_the_thread_connection_and_throttle_access_stamps(temp_cache):
+    # A hot cache must not turn every read into a write: recent stamps are left alone
+    cache_utils.put_cached('a', {'n': 1})
+    conn = cache_utils.shared_connection()
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    conn.execute('UPDATE pages SET accessed_at = 100 WHERE key = ?', ('a',))
+    conn.commit()
+    assert cache_utils.get_cached('a') == {'n': 1}
+    stamp = conn.execute('SELECT accessed_at FROM pages WHERE key = ?', ('a',)).fetchone()[0]
+    assert stamp > 100  # Stale stamp refreshed
+    assert cache_utils.get_cached('a') == {'n': 1}
+    assert conn.execute('SELECT accessed_at FROM pages WHERE key = ?', ('a',)).fetchone()[0] == stamp
+    assert cache_utils.shared_connection() is conn
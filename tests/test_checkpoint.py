@@ -0,0 +1,77 @@
+import pytest
+from unittest.mock import patch
+from utils.checkpoint import TraceCheckpoint, load_checkpoint, pending_levels
+from xrp_track import iter_trace
+
+HISTORIES = {
+    'root': [{'Account': 'root', 'Destination': 'a', 'Amount': {'value': '1'}},
+             {'Account': 'root', 'Destination': 'b', 'Amount': {'value': '2'}}],
+    'a': [{'Account': 'a', 'Destination': 'c', 'Amount': {'value': '3'}}],
+}
+
+def fake_get(fail_on=None):
+    def get(account, marker=None, limit=200, cache_only=None, head_ttl=None):
+        if account == fail_on:
+            raise Exception("Max retries exceeded")
+        return {'transactions': HISTORIES.get(account, [])}
+    return get
+
+def test_interrupted_trace_resumes_from_journal(tmp_path):
+    # Success path: an exception mid-trace leaves a journal that resumes with only the pending accounts
+    path = str(tmp_path / 'trace.ckpt')
+    checkpoint = TraceCheckpoint(path, interval=3600)
+    checkpoint.start({'root': 'root'}, 'root')
+    with patch('xrp_track.get_transactions', side_effect=fake_get(fail_on='b')):
+        with pytest.raises(Exception):
+            list(iter_trace('root', None, None, max_depth=2, node_levels={'root': 0}, workers=1, checkpoint=checkpoint))
+    checkpoint.close()
+
+    state = load_checkpoint(path)
+    assert state['processed'] == {'root', 'a'}
+    node_levels = {'root': 0, **state['node_levels']}
+    assert pending_levels(state, node_levels, 2) == {1: ['b'], 2: ['c']}
+    with patch('xrp_track.get_transactions', side_effect=fake_get()) as mock_get:
+        rest = list(iter_trace('root', None, None, max_depth=2, traced=set(state['order']), node_levels=node_levels,
+                               workers=1, revisit=pending_levels(state, node_levels, 2)))
+        assert [call.args[0] for call in mock_get.call_args_list] == ['b', 'c']
+    assert [t.destination for t in state['transfers']] == ['a', 'b', 'c'] and rest == []
+
+def test_load_checkpoint_ignores_torn_line(tmp_path):
+    # Edge case: a hard kill can leave a partial last line
+    path = tmp_path / 'trace.ckpt'
+    path.write_text('{"params": {}, "root": "r"}\n{"source": "r", "depth": 0, "reached": [], "levels": {}, "transfers": [], "alerts": [], "mixer": false}\n{"source": "x", "dep')
+    state = load_checkpoint(str(path))
+    assert state['processed'] == {'r'}
+    # Resuming cuts the torn line off, so the next entry starts on a line of its own
+    checkpoint = TraceCheckpoint(str(path))
+    checkpoint.resume(state['offset'])
+    checkpoint.record('y', 1, [], [], {}, [])
+    checkpoint.close()
+    assert load_checkpoint(str(path))['processed'] == {'r', 'y'}
+
+def test_load_checkpoint_missing(tmp_path):
+    # Failure scenario: nothing to resume
+    assert load_checkpoint(str(tmp_path / 'none.ckpt')) is None
+
+
+def test_resume_refetches_history_instead_of_journaling_it(tmp_path):
+    # Edge case: whole-trace analyses still see every processed account's history after a resume
+    from utils import tracer
+    from xrp_track import XRPSCAN
+    path = str(tmp_path / 'trace.ckpt')
+    checkpoint = TraceCheckpoint(path, interval=3600)
+    checkpoint.start({'root': 'root'}, 'root')
+    session = tracer.TraceSession(collect_history=True)
+    with patch('xrp_track.get_transactions', side_effect=fake_get(fail_on='b')):
+        with pytest.raises(Exception):
+            list(tracer.iter_trace(XRPSCAN, 'root', None, None, max_depth=2, workers=1, checkpoint=checkpoint, session=session))
+    checkpoint.close()
+    with open(path) as f:
+        assert all('history' not in line for line in f)
+
+    assert load_checkpoint(path)['processed'] == {'root', 'a'}
+    resumed = tracer.TraceSession(collect_history=True, max_requests=0)  # Refetching is outside the budget
+    with patch('xrp_track.get_transactions', side_effect=fake_get()):
+        tracer.refetch_history(XRPSCAN, {'root': 0, 'a': 1}, None, None, 2, workers=1, session=resumed)
+    assert [(t.account, t.destination) for t in resumed.history] == [(t.account, t.destination) for t in session.history]
+    assert resumed.complete_histories == {'root', 'a'}
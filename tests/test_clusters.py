@@ -0,0 +1,62 @@
+from datetime import datetime
+from utils import tracer
+from utils.backends import FixtureBackend
+from utils.clusters import ClusterIndex, cluster_links, update_clusters, CLUSTERS
+from utils.records import Transfer
+
+EXCHANGE = 'rExchange'
+
+def test_union_find_persists_and_keeps_the_strongest_label():
+    index = ClusterIndex()
+    assert index.find('rA') == 'rA' and index.cluster_label('rA') is None
+    index.label('rC', 'Suspected mixer', 'mixer')
+    assert index.union('rA', 'rB', 'manual') and index.union('rB', 'rC', 'manual', case='case1')
+    assert not index.union('rA', 'rC', 'manual')  # Already one cluster
+    index.label('rD', 'Kraken', 'exchange')
+    index.union('rD', 'rA', 'manual')
+    assert index.save() == 3
+
+    reloaded = ClusterIndex()  # A fresh process sees the saved forest
+    assert reloaded.find('rA') == reloaded.find('rC') == reloaded.find('rD')
+    assert reloaded.cluster_label('rB') == ('Kraken', 'exchange')
+    assert reloaded.members('rC') == ['rA', 'rB', 'rC', 'rD']
+
+def test_links_from_activation_common_funding_and_destination_tags():
+    transfers = [
+        Transfer('rFunder', 'rW1', 50, 1000, 'H1'),
+        Transfer('rFunder', 'rW2', 50, 1100, 'H2'),  # Same funder, same hour: one batch
+        Transfer('rFunder', 'rLater', 50, 1000 + 86400, 'H3'),  # A day later: a separate batch
+        Transfer('rW1', EXCHANGE, 10, 2000, 'H4', destination_tag=77),
+        Transfer('rOther', EXCHANGE, 10, 2100, 'H5', destination_tag=77),  # Same deposit account
+        Transfer('rW2', EXCHANGE, 10, 2200, 'H6', destination_tag=78),
+        Transfer(EXCHANGE, 'rPaid', 10, 3000, 'H7'),  # Exchange withdrawals never link customers
+    ]
+    links = {(a, b, reason) for a, b, reason in cluster_links(transfers, services={EXCHANGE})}
+    assert links == {('rFunder', 'rW1', 'activation'), ('rFunder', 'rW2', 'activation'), ('rFunder', 'rLater', 'activation'),
+                     ('rW1', 'rW2', 'common_funding'), ('rOther', 'rW1', f'destination_tag:{EXCHANGE}:77')}
+    # A date-bounded or truncated history's first inflow proves nothing: only deposit tags link those
+    links = {(a, b, reason) for a, b, reason in cluster_links(transfers, services={EXCHANGE}, complete={'rW1'})}
+    assert links == {('rFunder', 'rW1', 'activation'), ('rOther', 'rW1', f'destination_tag:{EXCHANGE}:77')}
+    backend = FixtureBackend({'rFunder': transfers[:3]})
+    session = tracer.TraceSession()
+    tracer.trace_transactions(backend, 'rFunder', datetime(1970, 1, 1), None, max_depth=0, session=session)
+    assert session.complete_histories == set()
+    session = tracer.TraceSession()
+    tracer.trace_transactions(backend, 'rFunder', None, None, max_depth=0, session=session)
+    assert session.complete_histories == {'rFunder'}
+
+def test_trace_stops_at_members_of_exchange_clusters():
+    # rHot is a wallet of the exchange found by an earlier case; later traces never fetch it
+    update_clusters([Transfer(EXCHANGE, 'rHot', 10, 1000, 'H0')], known_exchanges={EXCHANGE: 'Binance'})
+    CLUSTERS.union(EXCHANGE, 'rHot', 'manual')
+    CLUSTERS.save()
+    backend = FixtureBackend({
+        'rRoot': [Transfer('rRoot', 'rHot', 5_000_000, 2000, 'H1'), Transfer('rRoot', 'rMid', 5_000_000, 2000, 'H2')],
+        'rHot': [Transfer('rHot', 'rDeep', 5_000_000, 3000, 'H3')],
+        'rMid': [],
+    })
+    session = tracer.TraceSession()
+    transfers = tracer.trace_transactions(backend, 'rRoot', None, None, max_depth=3, session=session)
+    assert [txn.hash for txn in transfers] == ['H1', 'H2']
+    assert 'rHot' not in session.traced and session.node_levels['rHot'] == 1
+    assert any(alert.startswith('CLUSTER ALERT') and 'Binance' in alert for alert in session.alerts)
@@ -1,6 +1,6 @@
 import pytest
 import sqlite3
-from utils.db_utils import load_tags, add_or_update_tag
+from utils.db_utils import load_tags, add_or_update_tag, TagStore, TAGS, bulk_import_tags, export_tags
 
 @pytest.fixture
 def temp_db(tmp_path):
@@ -30,4 +30,72 @@ def test_update_tag(monkeypatch, temp_db):
 def test_load_empty(monkeypatch, temp_db):
     monkeypatch.setattr('utils.db_utils.DB_PATH', temp_db)
     tags = load_tags()
-    assert tags == {} 
\ No newline at end of file
+    assert tags == {} 
+
+
+def test_tag_store_lookup_and_hot_reload(monkeypatch, temp_db):
+    # Success path: cached lookups see writes from this process and from other connections
+    monkeypatch.setattr('utils.db_utils.DB_PATH', temp_db)
+    monkeypatch.setattr('utils.db_utils.RELOAD_CHECK_INTERVAL', 0)
+    store = TAGS
+    store.invalidate()
+    assert store.get('addr1') is None
+    add_or_update_tag('addr1', 'Exchange', 'exchange')  # e.g. the Streamlit tag form
+    assert store.get('addr1')['label'] == 'Exchange'
+    conn = sqlite3.connect(temp_db)  # Writer outside the shared connection, e.g. another process
+    conn.execute("INSERT OR REPLACE INTO tags VALUES ('addr1', 'Renamed', 'exchange', '')")
+    conn.commit()
+    conn.close()
+    assert store.get('addr1')['label'] == 'Renamed'
+
+def test_tag_store_bulk_lookup(monkeypatch, temp_db):
+    # Success path: one call resolves a whole frontier and caches the misses too
+    monkeypatch.setattr('utils.db_utils.DB_PATH', temp_db)
+    monkeypatch.setattr('utils.db_utils.LOOKUP_CHUNK', 2)
+    for i in range(3):
+        add_or_update_tag(f'a{i}', f'L{i}', 'other')
+    store = TagStore()
+    found = store.get_many(['a0', 'a1', 'a2', 'untagged'])
+    assert sorted(found) == ['a0', 'a1', 'a2']
+    assert 'untagged' not in store and store.hits == 1
+
+def test_bulk_import_and_export_round_trip(monkeypatch, temp_db, tmp_path):
+    # Success path: CSV in, JSONL out, rows without a label skipped
+    monkeypatch.setattr('utils.db_utils.DB_PATH', temp_db)
+    source = tmp_path / 'feed.csv'
+    source.write_text('address,label,type,notes\nr1,Binance,exchange,hot wallet\nr2,Sanctioned,,\nr3,,other,\n')
+    rows, _ = bulk_import_tags(str(source), chunk_size=1)
+    assert rows == 2
+    assert load_tags()['r2'] == {'label': 'Sanctioned', 'type': 'other', 'notes': ''}
+    target = tmp_path / 'out.jsonl'
+    assert export_tags(str(target))[0] == 2
+    assert target.read_text().splitlines()[0] == '{"address": "r1", "label": "Binance", "type": "exchange", "notes": "hot wallet"}'
+
+def test_tag_store_across_threads(monkeypatch, temp_db):
+    # Failure scenario (regression): lookups from another thread's connection cleared the cache,
+    # and connections of finished threads stayed open
+    import gc
+    import threading
+    from utils.db_utils import shared_connection
+    monkeypatch.setattr('utils.db_utils.DB_PATH', temp_db)
+    monkeypatch.setattr('utils.db_utils.RELOAD_CHECK_INTERVAL', 0)
+    add_or_update_tag('addr1', 'Exchange', 'exchange')
+    store = TagStore()
+    store.get('addr1')
+    conn = sqlite3.connect(temp_db)  # An outside write moves this process's data_version on
+    conn.execute("INSERT INTO tags VALUES ('addr2', 'Other', 'other', '')")
+    conn.commit()
+    conn.close()
+    assert store.get('addr1')['label'] == 'Exchange' and store.hits == 0  # Reloaded once
+    worker_conns = []
+    def lookup():
+        worker_conns.append(shared_connection())
+        store.get('addr1')
+    worker = threading.Thread(target=lookup)
+    worker.start()
+    worker.join()
+    assert store.hits == 1  # Served from the cache the main thread filled
+    del worker
+    gc.collect()
+    with pytest.raises(sqlite3.ProgrammingError):
+        worker_conns[0].execute('SELECT 1')  # Closed once its thread ended
@@ -1,9 +1,10 @@
 import pytest
 from xrp_track import detect_heuristics
+from utils.records import Transfer
 
 def test_detect_heuristics_mixer_detection():
     # Success path: detects mixer with >10 incoming txns
-    transactions = [{'Destination': 'test_account'}] * 11
+    transactions = [Transfer('source', 'test_account', 1.0)] * 11
     alerts = []
     detect_heuristics(transactions, 'test_account', alerts)
     assert len(alerts) == 1
@@ -11,7 +12,7 @@ def test_detect_heuristics_mixer_detection():
 
 def test_detect_heuristics_no_mixer():
     # Failure scenario: no detection with <=10 incoming
-    transactions = [{'Destination': 'test_account'}] * 10
+    transactions = [Transfer('source', 'test_account', 1.0)] * 10
     alerts = []
     detect_heuristics(transactions, 'test_account', alerts)
     assert len(alerts) == 0
@@ -0,0 +1,59 @@
+import pytest
+from unittest.mock import patch
+from utils.records import Transfer, format_units
+from utils.graph import edge_label
+
+
+def test_wei_amounts_stay_exact():
+    # Success path: values past float precision survive conversion and formatting unchanged
+    row = {'from': '0xA', 'to': '0xB', 'value': '123456789012345678901', 'timeStamp': '1700000000', 'hash': '0x1'}
+    txn = Transfer.from_etherscan(row)
+    assert txn.amount == 123456789012345678901 and txn.asset is None
+    assert (txn.account, txn.destination) == ('0xa', '0xb')
+    assert format_units(txn.amount) == '123.456789012345678901'
+    assert format_units(1_500_000, 6) == '1.5'
+
+
+def test_account_rows_walk_block_windows(monkeypatch):
+    # Edge case: a full window continues from its last block without repeating that block's rows
+    eth_track = pytest.importorskip('eth_track')
+    monkeypatch.setattr(eth_track, 'PAGE_SIZE', 2)
+    windows = {
+        0: [{'hash': 'a', 'blockNumber': '5'}, {'hash': 'b', 'blockNumber': '7'}],
+        7: [{'hash': 'b', 'blockNumber': '7'}, {'hash': 'c', 'blockNumber': '9'}],
+        9: [{'hash': 'c', 'blockNumber': '9'}],
+    }
+    with patch('eth_track.get_transactions') as mock_get:
+        mock_get.side_effect = lambda account, action, startblock, endblock, cache_only=None, head_ttl=None: windows[startblock]
+        rows = list(eth_track.iter_account_rows('0xa', 'txlist', 0, 100))
+        assert [row['hash'] for row in rows] == ['a', 'b', 'c']
+        assert mock_get.call_count == 3
+    # The backend's generic paging walks the same windows
+    for window in windows.values():
+        for row in window:
+            row.update({'from': '0xa', 'to': '0xb', 'value': '1'})
+    with patch('eth_track.get_transactions') as mock_get:
+        mock_get.side_effect = lambda account, action, startblock, endblock: windows[startblock]
+        backend = eth_track.EtherscanBackend(kinds=('normal',))
+        assert [txn.hash for txn in eth_track.LedgerBackend.iter_account(backend, '0xa', (0, 100))] == ['a', 'b', 'c']
+
+
+def test_trace_follows_internal_and_token_transfers():
+    # Success path: all three kinds are followed, failed calls are dropped, edges sum exactly per asset
+    eth_track = pytest.importorskip('eth_track')
+    rows = {
+        ('0xroot', 'txlist'): [{'from': '0xroot', 'to': '0xa', 'value': '1000000000000000001', 'hash': '0x1', 'blockNumber': '1'},
+                               {'from': '0xroot', 'to': '0xbad', 'value': '5', 'isError': '1', 'hash': '0x2', 'blockNumber': '1'}],
+        ('0xroot', 'txlistinternal'): [{'from': '0xroot', 'to': '0xa', 'value': '2', 'hash': '0x3', 'traceId': '0', 'blockNumber': '2'}],
+        ('0xroot', 'tokentx'): [{'from': '0xroot', 'to': '0xt', 'value': '2500000', 'hash': '0x4', 'logIndex': '1', 'blockNumber': '3',
+                                 'contractAddress': '0xUSDC', 'tokenSymbol': 'USDC', 'tokenDecimal': '6'}],
+    }
+    with patch('eth_track.get_transactions') as mock_get, patch('eth_track.block_range', return_value=(0, 10)):
+        mock_get.side_effect = lambda account, action, startblock, endblock, cache_only=None, head_ttl=None: rows.get((account, action), [])
+        session = eth_track.TraceSession()
+        transfers = eth_track.trace_transactions('0xROOT', None, None, max_depth=1, workers=3, session=session)
+        G = eth_track.build_graph(transfers, session.node_levels)
+    assert {txn.destination for txn in transfers} == {'0xa', '0xt'}
+    assert G.edges['0xroot', '0xa']['value'] == 1000000000000000003
+    assert edge_label(G, ('0xroot', '0xt')) == '2.5 USDC'
+    assert session.node_levels == {'0xroot': 0, '0xa': 1, '0xt': 1}
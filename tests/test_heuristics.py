@@ -0,0 +1,45 @@
+from utils.records import Transfer
+from utils.heuristics import run_heuristics, compute_features, DEFAULT_RULES
+from utils.records import TransferBatch
+
+def test_features_in_one_pass():
+    # Success path: degrees, fan-out and round-amount ratio for every account at once
+    transfers = [Transfer('a', f'd{i}', 100_000_000.0) for i in range(6)] + [Transfer('x', 'a', 5.0)] * 3
+    features = compute_features(TransferBatch.from_records(transfers))
+    row = {name: values[list(features['accounts']).index('a')] for name, values in features.items()}
+    assert (row['in_degree'], row['out_degree'], row['fan_in'], row['fan_out']) == (3, 6, 1, 6)
+    assert row['round_ratio'] == 1.0
+    _, findings = run_heuristics(transfers)
+    assert {(f['account'], f['rule']) for f in findings} == {('a', 'cluster'), ('a', 'round_amounts')}
+    # Round amounts are whole coins in the backend's own units: 100 XRP of drops is dust in wei
+    assert compute_features(TransferBatch.from_records(transfers), decimals=18)['round_ratio'].max() == 0.0
+    wei = [Transfer('a', f'd{i}', 100 * 10 ** 18) for i in range(6)]
+    assert compute_features(TransferBatch.from_records(wei), decimals=18)['round_ratio'].max() == 1.0
+    # Exact wei: one wei off a round amount is not round, which float64 cannot tell apart
+    wei += [Transfer('a', f'e{i}', 100 * 10 ** 18 + 1) for i in range(6)]
+    assert compute_features(TransferBatch.from_records(wei, exact=True), decimals=18)['round_ratio'].max() == 0.5
+
+
+def test_value_features_count_native_transfers_only():
+    # Edge case: token amounts are in other units, so they count as edges but never as value
+    transfers = [Transfer('a', 'b', 90, asset='USDC'), Transfer('a', 'c', 10), Transfer('a', 'd', 10 ** 8, asset='USDC')]
+    features, _ = run_heuristics(transfers)
+    row = {name: values[list(features['accounts']).index('a')] for name, values in features.items()}
+    assert (row['out_degree'], row['fan_out'], row['value_out'], row['concentration']) == (3, 3, 10, 1.0)
+    assert row['round_ratio'] == 0.0
+
+def test_peel_chain_detected():
+    # Success path: each hop forwards most of its funds and peels off a small amount
+    transfers = [Transfer('src', 'h1', 100.0),
+                 Transfer('h1', 'h2', 90.0), Transfer('h1', 'p1', 10.0),
+                 Transfer('h2', 'h3', 80.0), Transfer('h2', 'p2', 10.0)]
+    _, findings = run_heuristics(transfers, rules=[r for r in DEFAULT_RULES if r['name'] == 'peel_chain'])
+    assert [f['account'] for f in findings] == ['h1']  # h2's main output h3 is not itself a peel hop
+
+def test_configurable_thresholds_and_empty_input():
+    # Edge case: custom rule thresholds, account filter and empty input
+    transfers = [Transfer('s', 'm', 1.0)] * 3
+    rules = [{'name': 'mixer', 'conditions': [('in_degree', '>', 2)]}]
+    assert run_heuristics(transfers, rules, accounts=['s'])[1] == []
+    assert run_heuristics(transfers, rules, accounts=['m'])[1][0]['features'] == {'in_degree': 3}
+    assert run_heuristics([], rules) == (None, [])
@@ -0,0 +1,52 @@
+import time
+import threading
+from utils import tracer
+from utils.backends import FixtureBackend
+from utils.jobs import JobQueue
+from utils.records import Transfer
+
+class SlowFixture(FixtureBackend):
+    def fetch_page(self, account, window, cursor=None):
+        time.sleep(0.02)
+        return super().fetch_page(account, window, cursor)
+
+def chain_histories(n):
+    return {f"r{i}": [Transfer(f"r{i}", f"r{i + 1}", 5_000_000, 1689422400 + i, f"H{i}")] for i in range(n)}
+
+def test_identical_requests_share_one_job_and_result():
+    queue = JobQueue(workers=2)
+    backend = FixtureBackend(chain_histories(4))
+    run = lambda session: tracer.trace_transactions(backend, 'r0', None, None, max_depth=3, workers=1, session=session)
+    job = queue.submit(('r0', None, None, None, 3), run, owner='alice')
+    assert queue.submit(('r0', None, None, None, 3), run, owner='bob') is job
+    job.future.result(timeout=10)
+    assert job.status == 'done' and len(job.result) == 4
+    assert job.progress()['visited'] == 4 and job.progress()['requests'] == 4
+    assert queue.submit(('r0', None, None, None, 3), run).result is job.result and backend.requests == 4
+    queue.shutdown()
+
+def test_cancel_stops_a_running_trace_and_is_not_cached():
+    queue = JobQueue(workers=1)
+    backend = SlowFixture(chain_histories(200))
+    job = queue.submit('long', lambda session: tracer.trace_transactions(backend, 'r0', None, None, max_depth=199, workers=1, session=session))
+    while job.session.stats['accounts_fetched'] < 3:
+        time.sleep(0.01)
+    queue.cancel(job.id)
+    job.future.result(timeout=10)
+    assert job.status == 'cancelled' and job.result is None
+    assert backend.requests < 20
+    assert queue.submit('long', lambda session: 'again') is not job
+    queue.shutdown()
+
+def test_failed_jobs_report_the_error_and_queued_jobs_cancel_before_starting():
+    queue = JobQueue(workers=1)
+    release = threading.Event()
+    blocker = queue.submit('block', lambda session: release.wait(10))
+    queued = queue.submit('queued', lambda session: 'never')
+    queued.cancel()
+    failing = queue.submit('fail', lambda session: 1 / 0)
+    release.set()
+    failing.future.result(timeout=10)
+    assert blocker.status == 'done' and queued.status == 'cancelled'
+    assert failing.status == 'failed' and failing.error.startswith('ZeroDivisionError')
+    queue.shutdown()
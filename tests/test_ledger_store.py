@@ -0,0 +1,69 @@
+import csv
+import gzip
+import json
+from datetime import datetime
+from benchmarks.mock_xrpscan import build_histories, ROOT
+from utils import tracer
+from utils.ledger_store import LedgerStoreBackend, import_export, store_stats, RIPPLE_EPOCH
+
+def write_jsonl(path, records):
+    opener = gzip.open if str(path).endswith('.gz') else open
+    with opener(path, 'wt') as f:
+        f.writelines(json.dumps(record) + '\n' for record in records)
+
+def test_import_streams_formats_and_dedupes(tmp_path):
+    db = str(tmp_path / 'ledger.db')
+    write_jsonl(tmp_path / 'xrpscan.jsonl.gz', [
+        {'Account': 'rA', 'Destination': 'rB', 'Amount': '5000000', 'date': '2023-07-15T12:00:00.000Z', 'hash': 'H1', 'ledger_index': 10},
+        {'Account': 'rA', 'TransactionType': 'OfferCreate', 'hash': 'H2'},  # Moves no value
+        {'tx': {'Account': 'rB', 'Destination': 'rC', 'Amount': '4000000', 'date': 742824000, 'hash': 'H3'}, 'meta': {}},
+    ])
+    with open(tmp_path / 'flat.csv', 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['account', 'destination', 'amount', 'timestamp', 'hash', 'asset'])
+        writer.writerow(['0xa', '0xb', str(10 ** 30), '1689422400', '0xH', ''])
+    seen, added, _ = import_export([str(tmp_path / 'xrpscan.jsonl.gz'), str(tmp_path / 'flat.csv')], db)
+    assert (seen, added) == (3, 3)
+    assert import_export([str(tmp_path / 'xrpscan.jsonl.gz')], db)[:2] == (2, 0)  # Re-import adds nothing
+    assert store_stats(db)['transfers'] == 3
+
+    backend = LedgerStoreBackend(db)
+    assert backend.get_transaction('H3')['date'] == datetime.utcfromtimestamp(742824000 + RIPPLE_EPOCH).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+    assert backend.fetch_page('0xa', backend.window(None, None))[0][0].amount == 10 ** 30  # Exact beyond 64 bits
+
+def test_store_backend_pages_both_directions_within_window(tmp_path):
+    db = str(tmp_path / 'ledger.db')
+    write_jsonl(tmp_path / 'export.jsonl', [{'Account': 'rA' if i % 2 else 'rX', 'Destination': 'rX' if i % 2 else 'rA', 'Amount': str(i),
+                                              'date': f"2023-07-15T12:{i:02d}:00.000Z", 'hash': f"H{i}"} for i in range(10)])
+    import_export([str(tmp_path / 'export.jsonl')], db)
+    backend = LedgerStoreBackend(db, page_size=3)
+    window = backend.window(datetime(2023, 7, 15, 12, 2), datetime(2023, 7, 15, 12, 8))
+    first, cursor = backend.fetch_page('rA', window)
+    assert [txn.hash for txn in first] == ['H8', 'H7', 'H6'] and cursor[0] == first[-1].timestamp
+    assert [txn.hash for txn in backend.iter_account('rA', window)] == [f"H{i}" for i in range(8, 1, -1)]
+
+def test_depth_five_trace_runs_from_the_store(tmp_path):
+    db = str(tmp_path / 'ledger.db')
+    histories = build_histories(fan_out=3, depth=5, noise=2)
+    # Each payment once, from its sender's history (the mock gives the receiver's copy its own hash)
+    write_jsonl(tmp_path / 'export.jsonl', [txn for account, history in histories.items() for txn in history if txn['Account'] == account])
+    import_export([str(tmp_path / 'export.jsonl')], db)
+    session = tracer.TraceSession()
+    transfers = tracer.trace_transactions(LedgerStoreBackend(db), ROOT, None, None, max_depth=5, session=session)
+    assert len(transfers) == 3 + 9 + 27 + 81 + 243
+    assert max(session.node_levels.values()) == 5
+
+def test_store_keeps_issued_currencies_and_pages_through_ties(tmp_path):
+    # Edge case: IOU payments keep their token, and keyset paging survives equal and missing timestamps
+    db = str(tmp_path / 'ledger.db')
+    iou = {'currency': 'USD', 'issuer': 'rIssuer', 'value': '12.5'}
+    write_jsonl(tmp_path / 'export.jsonl',
+                [{'Account': 'rA', 'Destination': 'rB', 'Amount': iou, 'date': '2023-07-15T12:00:00.000Z', 'hash': 'IOU'}] +
+                [{'Account': 'rA', 'Destination': f"r{i}", 'Amount': str(i + 1), 'date': '2023-07-15T13:00:00.000Z', 'hash': f"T{i}"} for i in range(4)] +
+                [{'Account': 'rA', 'Destination': f"n{i}", 'Amount': str(i + 1), 'hash': f"N{i}"} for i in range(3)])
+    import_export([str(tmp_path / 'export.jsonl')], db)
+    backend = LedgerStoreBackend(db, page_size=2)
+    transfers = list(backend.iter_account('rA', backend.window(None, None)))
+    assert [txn.hash for txn in transfers] == ['T3', 'T2', 'T1', 'T0', 'IOU', 'N2', 'N1', 'N0']
+    token = transfers[4]
+    assert (token.asset, token.amount) == ('USD.rIssuer', 12.5)
@@ -0,0 +1,49 @@
+import json
+from utils import metrics
+
+def test_timed_stages_and_counters_are_recorded():
+    metrics.reset_metrics()
+
+    @metrics.timed('work')
+    def work(n):
+        metrics.count('items', n)
+        return n * 2
+
+    assert work(3) == 6 and work(4) == 8
+    snap = metrics.snapshot()
+    assert snap['stages']['work']['calls'] == 2
+    assert snap['stages']['work']['max_seconds'] <= snap['stages']['work']['seconds']
+    assert snap['counters'] == {'items': 7}
+    assert snap['memory']['max_rss_bytes'] > 0
+
+def test_prometheus_and_json_exports(tmp_path):
+    metrics.reset_metrics()
+    with metrics.stage('build_graph'):
+        metrics.count('pages_fetched', 5)
+    text = metrics.to_prometheus()
+    assert '# TYPE xrp_tracker_stage_calls_total counter' in text
+    assert 'xrp_tracker_stage_calls_total{stage="build_graph"} 1' in text
+    assert 'xrp_tracker_events_total{event="pages_fetched"} 5' in text
+    metrics.write_metrics(str(tmp_path / 'run.json'))
+    metrics.write_metrics(str(tmp_path / 'run.prom'))
+    assert json.loads((tmp_path / 'run.json').read_text())['counters'] == {'pages_fetched': 5}
+    assert (tmp_path / 'run.prom').read_text().startswith('# HELP')
+
+def test_profiled_saves_pstats_and_tracks_stage_memory(tmp_path, capsys):
+    metrics.reset_metrics()
+    with metrics.profiled(str(tmp_path / 'run.prof'), top=5):
+        with metrics.stage('alloc'):
+            blob = [bytes(1000) for _ in range(1000)]
+    assert len(blob) == 1000
+    assert (tmp_path / 'run.prof').exists()
+    assert metrics.snapshot()['stages']['alloc']['peak_bytes'] > 1_000_000
+    assert 'Peak traced memory' in capsys.readouterr().out
+
+def test_trace_times_each_account_fetch():
+    from utils import tracer
+    from utils.backends import FixtureBackend
+    from utils.records import Transfer
+    metrics.reset_metrics()
+    backend = FixtureBackend({'root': [Transfer('root', 'a', 1_000_000)], 'a': [Transfer('a', 'b', 500_000)]})
+    list(tracer.iter_trace(backend, 'root', None, None, max_depth=3, workers=2))
+    assert metrics.snapshot()['stages']['fetching']['calls'] == 3  # root, a and b
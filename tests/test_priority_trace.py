@@ -0,0 +1,51 @@
+from unittest.mock import patch
+from xrp_track import iter_priority_trace
+from utils.session import TraceSession
+
+EXCHANGE = 'rHb9CJAWyB4rj91VRWn96DkukG4bwdtyTh'
+
+
+def _pay(source, destination, xrp):
+    return {'Account': source, 'Destination': destination, 'Amount': {'value': str(int(xrp * 1_000_000))}, 'date': '2023-01-01T00:00:00.000Z'}
+
+
+def test_priority_trace_follows_value_first():
+    # Success path: the bigger flow is expanded first, dust is dropped and exchanges are leaves
+    histories = {
+        'root': [_pay('root', 'small', 10), _pay('root', 'big', 900), _pay('root', 'dust', 0.5), _pay('root', EXCHANGE, 90)],
+        'big': [_pay('big', 'next', 800)],
+    }
+    with patch('xrp_track.get_transactions') as mock_get:
+        mock_get.side_effect = lambda account, marker=None, limit=200, cache_only=None, head_ttl=None: {'transactions': histories.get(account, [])}
+        session = TraceSession()
+        transfers = list(iter_priority_trace('root', None, None, max_depth=3, workers=1, session=session))
+        fetched = [call.args[0] for call in mock_get.call_args_list]
+        assert fetched == ['root', 'big', 'next', 'small']
+        assert {txn.destination for txn in transfers} == {'small', 'big', EXCHANGE, 'next'}
+        assert session.node_levels['next'] == 2
+
+
+def test_priority_trace_stops_at_request_budget():
+    # Edge case: once the page budget is spent, queued accounts are left unexpanded
+    histories = {'root': [_pay('root', 'a', 5), _pay('root', 'b', 3)], 'a': [_pay('a', 'c', 5)]}
+    with patch('xrp_track.get_transactions') as mock_get:
+        mock_get.side_effect = lambda account, marker=None, limit=200, cache_only=None, head_ttl=None: {'transactions': histories.get(account, [])}
+        session = TraceSession(max_requests=2)
+        transfers = list(iter_priority_trace('root', None, None, workers=1, session=session))
+        assert mock_get.call_count == 2
+        assert [txn.destination for txn in transfers] == ['a', 'b', 'c']
+        assert session.exhausted
+        assert session.stats['unexpanded'] == 2  # b and c
+
+
+def test_priority_trace_taint_cutoff():
+    # Edge case: an account receiving 5 XRP of traced funds but sending 1000 is diluted below min_taint
+    histories = {
+        'root': [_pay('root', 'mixer', 5)],
+        'mixer': [_pay('mixer', 'out', 1000)],
+    }
+    with patch('xrp_track.get_transactions') as mock_get:
+        mock_get.side_effect = lambda account, marker=None, limit=200, cache_only=None, head_ttl=None: {'transactions': histories.get(account, [])}
+        transfers = list(iter_priority_trace('root', None, None, value=5_000_000, min_taint=0.01, workers=1))
+        assert [txn.destination for txn in transfers] == ['mixer', 'out']
+        assert [call.args[0] for call in mock_get.call_args_list] == ['root', 'mixer']  # 'out' is only 0.5% tainted
@@ -0,0 +1,45 @@
+import io
+import re
+import pytest
+from utils import graph
+from utils.backends import FixtureBackend
+from utils.records import Transfer
+from utils.report import write_report
+
+def traced_graph(payments):
+    backend = FixtureBackend({}, known_exchanges={'rEx': 'Binance'})
+    transfers = [Transfer('rRoot', f'rLeaf{i}', (i + 1) * 1_000_000, 1689422400 + i, f'H{i}') for i in range(payments)]
+    transfers.append(Transfer('rRoot', 'rEx', 500_000_000, 1689422400, 'HX'))
+    node_levels = {'rRoot': 0, 'rEx': 1, **{f'rLeaf{i}': 1 for i in range(payments)}}
+    return graph.build_graph(backend, transfers, node_levels), node_levels, transfers
+
+def test_pdf_paginates_alerts_and_tables_with_the_graph_in_memory(tmp_path):
+    G, node_levels, transfers = traced_graph(2000)
+    image = graph.visualize_graph(G, node_levels, filename=str(tmp_path / 'graph.png'), max_nodes=20)
+    assert image.getvalue() == (tmp_path / 'graph.png').read_bytes()  # Rendered once, written and returned
+    alerts = [f"ALERT: Transfer {i} to <rEx>" for i in range(500)]
+    buffer = io.BytesIO()
+    write_report(buffer, G, alerts, transfers=transfers + transfers, image=image)
+    pdf = buffer.getvalue()
+    assert pdf.startswith(b'%PDF')
+    # 500 alerts and 2 x 2001 table rows at ~60 lines a page
+    assert len(re.findall(rb'/Type /Page\b', pdf)) > (500 + 2 * 2001) // 60
+    assert b'/Subtype /Image' in pdf
+
+def test_html_report_escapes_dedupes_and_caps_tables(tmp_path):
+    G, _, transfers = traced_graph(30)
+    target = tmp_path / 'report.html'
+    assert write_report(str(target), G, ['TAG ALERT: <script>x</script>'], transfers=transfers + transfers, max_rows=10) == 'html'
+    page = target.read_text()
+    assert '&lt;script&gt;' in page and '<script>' not in page
+    assert page.count('<td>H') == 10  # Duplicate transfers appear once, and the table stops at max_rows
+    assert '... 21 more rows not shown' in page and 'exchange Binance' in page
+    assert '1 TAG ALERT' in page
+
+def test_report_format_follows_the_file_name():
+    G, _, _ = traced_graph(1)
+    buffer = io.BytesIO()
+    assert write_report(buffer, G, [], fmt='html') == 'html'
+    assert buffer.getvalue().startswith(b'<!DOCTYPE html>') and not buffer.closed
+    with pytest.raises(ValueError):
+        write_report(io.BytesIO(), G, [], fmt='docx')
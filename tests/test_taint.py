@@ -0,0 +1,39 @@
+import pytest
+from utils import tracer, graph
+from utils.backends import FixtureBackend
+from utils.records import Transfer
+from utils.taint import propagate_taint, taint_by_account
+
+# root's 100 joins 50 clean in a; a then sends 60 to an exchange and 90 onward to b
+FLOW = [Transfer('x', 'a', 50, 5, 'H0'), Transfer('root', 'a', 100, 10, 'H1'),
+        Transfer('a', 'ex', 60, 20, 'H2'), Transfer('a', 'b', 90, 30, 'H3')]
+
+@pytest.mark.parametrize('model, to_exchange, to_b', [('haircut', 40, 60), ('poison', 60, 90), ('fifo', 10, 90)])
+def test_models_split_tainted_value(model, to_exchange, to_b):
+    tainted = taint_by_account(propagate_taint(FLOW, ['root'], model))
+    assert tainted['ex'][0] == pytest.approx(to_exchange)
+    assert tainted['b'][0] == pytest.approx(to_b)
+    assert tainted['a'] == pytest.approx((100, 2 / 3))
+    assert 'x' not in tainted
+
+def test_duplicates_tokens_and_cycles():
+    # The same payment seen in both histories counts once; token transfers carry no taint
+    transfers = FLOW + [Transfer('root', 'a', 100, 10, 'H1'), Transfer('a', 'c', 10**9, 25, 'T1', asset='0xtoken'),
+                        Transfer('b', 'a', 90, 40, 'H4')]
+    result = propagate_taint(transfers, ['root'], 'haircut')
+    tainted = taint_by_account(result)
+    assert 'c' not in tainted and result['rounds'] < 100
+    assert tainted['a'][0] == pytest.approx(100 + 90 * tainted['b'][1])
+    with pytest.raises(ValueError):
+        propagate_taint(FLOW, ['root'], 'lifo')
+
+def test_analyze_taint_alerts_on_exchanges_and_shades_graph():
+    backend = FixtureBackend({'root': [FLOW[1]], 'a': [FLOW[3], FLOW[2], FLOW[1], FLOW[0]]}, known_exchanges={'ex': 'Binance'})
+    session = tracer.TraceSession(collect_history=True)
+    transfers = tracer.trace_transactions(backend, 'root', None, None, max_depth=1, session=session)
+    G = graph.build_graph(backend, transfers, session.node_levels)
+    alerts = []
+    tracer.analyze_taint(backend, session.history, ['root'], alerts, 'fifo', G)
+    assert alerts == ['TAINT ALERT (fifo): 0.00001 XRP of traced funds reached Binance (ex), 17% of its inflow']
+    assert G.nodes['b']['taint'] == pytest.approx(1.0) and G.graph['taint_model'] == 'fifo'
+    assert graph.visualize_graph(G, session.node_levels, filename=None) is not None
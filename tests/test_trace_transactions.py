@@ -8,18 +8,135 @@ def test_trace_transactions_success():
         mock_get.return_value = {'transactions': [{'Account': 'source', 'Destination': 'dest', 'Amount': {'value': '1000000'}, 'date': '2023-01-01T00:00:00.000Z'}]}
         transactions = trace_transactions('test_account', None, None, max_depth=1)
         assert len(transactions) == 1
-        assert transactions[0]['Destination'] == 'dest'
+        assert transactions[0].destination == 'dest'
 
 def test_trace_transactions_max_depth():
     # Edge case: stops at max depth
     with patch('xrp_track.get_transactions') as mock_get:
         mock_get.return_value = {'transactions': [{'Account': 'source', 'Destination': 'dest', 'Amount': {'value': '1000000'}}]}
         transactions = trace_transactions('test_account', None, None, max_depth=0)
-        assert len(transactions) == 0  # Should not recurse
+        assert len(transactions) == 1  # The root's own transfer is kept...
+        assert mock_get.call_count == 1  # ...but its destination is never fetched
 
 def test_trace_transactions_no_transactions():
     # Failure scenario: no transactions returned
     with patch('xrp_track.get_transactions') as mock_get:
         mock_get.return_value = {'transactions': []}
         transactions = trace_transactions('test_account', None, None, max_depth=1)
-        assert len(transactions) == 0 
\ No newline at end of file
+        assert len(transactions) == 0 
+
+
+def test_trace_transactions_concurrent_frontier():
+    # Success path: each level is fetched concurrently and levels match a breadth-first walk
+    histories = {
+        'root': [{'Account': 'root', 'Destination': 'a', 'Amount': {'value': '1'}, 'date': '2023-01-01T00:00:00.000Z'},
+                 {'Account': 'root', 'Destination': 'b', 'Amount': {'value': '2'}, 'date': '2023-01-01T00:00:00.000Z'}],
+        'a': [{'Account': 'a', 'Destination': 'c', 'Amount': {'value': '3'}, 'date': '2023-01-01T00:00:00.000Z'}],
+        'b': [{'Account': 'b', 'Destination': 'c', 'Amount': {'value': '4'}, 'date': '2023-01-01T00:00:00.000Z'}],
+    }
+    with patch('xrp_track.get_transactions') as mock_get:
+        mock_get.side_effect = lambda account, marker=None, limit=200, cache_only=None, head_ttl=None: {'transactions': histories.get(account, [])}
+        node_levels = {'root': 0}
+        transactions = trace_transactions('root', None, None, max_depth=2, traced=set(), node_levels=node_levels, alerts=[], workers=4)
+        assert [txn.destination for txn in transactions] == ['a', 'b', 'c']
+        assert node_levels == {'root': 0, 'a': 1, 'b': 1, 'c': 2}
+        assert mock_get.call_count == 4
+
+def test_fetch_all_transactions_stops_at_start_bound():
+    # Edge case: newest-first paging stops once a page reaches back past start_datetime
+    from datetime import datetime
+    from xrp_track import fetch_all_transactions
+    pages = {
+        None: {'transactions': [{'date': '2023-07-16T10:00:00.000Z'}, {'date': '2023-07-15T12:00:00.000Z'}], 'marker': 'p2'},
+        'p2': {'transactions': [{'date': '2023-07-15T01:00:00.000Z'}, {'date': '2023-07-14T23:00:00.000Z'}], 'marker': 'p3'},
+        'p3': {'transactions': [{'date': '2023-07-13T00:00:00.000Z'}]},
+    }
+    with patch('xrp_track.get_transactions') as mock_get:
+        mock_get.side_effect = lambda account, marker=None, limit=200, cache_only=None, head_ttl=None: pages[marker]
+        transactions = fetch_all_transactions('acct', datetime(2023, 7, 15), datetime(2023, 7, 15, 23, 59, 59), depth=0, max_depth=2)
+        assert [txn['date'] for txn in transactions] == ['2023-07-15T12:00:00.000Z', '2023-07-15T01:00:00.000Z']
+        assert mock_get.call_count == 2
+
+def test_iter_trace_streams_into_build_graph():
+    # Success path: the generator feeds build_graph directly, with levels set before each txn
+    from xrp_track import iter_trace, build_graph
+    histories = {
+        'root': [{'Account': 'root', 'Destination': 'a', 'Amount': {'value': '2000000'}},
+                 {'Account': 'root', 'TransactionType': 'OfferCreate'}],
+        'a': [{'Account': 'a', 'Destination': 'b', 'Amount': {'value': '1000000'}}],
+    }
+    with patch('xrp_track.get_transactions') as mock_get:
+        mock_get.side_effect = lambda account, marker=None, limit=200, cache_only=None, head_ttl=None: {'transactions': histories.get(account, [])}
+        node_levels = {'root': 0}
+        stream = iter_trace('root', None, None, max_depth=1, node_levels=node_levels)
+        assert mock_get.call_count == 0  # Nothing is fetched until the stream is consumed
+        G = build_graph(stream, node_levels)
+        assert G.edges['root', 'a']['weight'] == 2.0
+        assert G.nodes['b']['subset_key'] == 2
+
+def test_transfer_record_from_xrpscan():
+    # Success path: only the traced fields survive conversion, addresses are interned
+    import sys
+    from utils.records import Transfer
+    txn = {'Account': 'rSrc', 'Destination': 'rDst', 'Amount': {'value': '2500000', 'currency': 'XRP'},
+           'date': '2023-01-01T00:00:00.000Z', 'hash': 'ABC', 'meta': {'AffectedNodes': []}}
+    record = Transfer.from_xrpscan(txn)
+    assert (record.account, record.destination, record.amount, record.hash) == ('rSrc', 'rDst', 2500000.0, 'ABC')
+    assert record.timestamp == 1672531200.0
+    assert record.destination is sys.intern('rDst')
+    assert not hasattr(record, '__dict__')
+
+def test_iter_trace_incremental_update():
+    # Success path: a re-trace only picks up ledger activity past each account's watermark
+    from xrp_track import iter_trace
+    from utils.session import TraceSession
+    from utils.case_state import case_reached_by
+    histories = {
+        'root': [{'Account': 'root', 'Destination': 'a', 'Amount': {'value': '1'}, 'ledger_index': 10, 'date': '2023-01-01T00:00:00.000Z'}],
+        'a': [],
+    }
+    with patch('xrp_track.get_transactions') as mock_get:
+        mock_get.side_effect = lambda account, marker=None, limit=200, cache_only=None, head_ttl=None: {'transactions': list(histories.get(account, []))}
+        node_levels, traced, watermarks = {'root': 0}, set(), {}
+        first = list(iter_trace('root', None, None, max_depth=1, traced=traced, node_levels=node_levels, watermarks=watermarks))
+        assert [txn.destination for txn in first] == ['a']
+        assert watermarks == {'root': {'ledger_index': 10, 'date': '2023-01-01T00:00:00.000Z'}, 'a': {'ledger_index': None, 'date': None}}
+
+        histories['root'].insert(0, {'Account': 'root', 'Destination': 'a', 'Amount': {'value': '3'}, 'ledger_index': 11, 'date': '2023-01-01T12:00:00.000Z'})
+        histories['root'].insert(0, {'Account': 'root', 'Destination': 'b', 'Amount': {'value': '2'}, 'ledger_index': 12, 'date': '2023-01-02T00:00:00.000Z'})
+        alerts = []
+        session = TraceSession()
+        session.reached_by = case_reached_by({'transfers': [[txn.account, txn.destination] for txn in first]})
+        second = list(iter_trace('root', None, None, max_depth=1, traced=traced, node_levels=node_levels, alerts=alerts,
+                                 watermarks=watermarks, revisit={0: ['root'], 1: ['a']}, session=session))
+        assert [txn.destination for txn in second] == ['b', 'a']  # New transfers over the existing root -> a edge too
+        assert node_levels['b'] == 1
+        assert watermarks['root']['ledger_index'] == 12
+
+
+def test_trace_sessions_do_not_share_state():
+    # Failure scenario (regression): repeated calls without state used to share one traced set
+    from utils.session import TraceSession
+    with patch('xrp_track.get_transactions') as mock_get:
+        mock_get.return_value = {'transactions': [{'Account': 'root', 'Destination': 'dest', 'Amount': {'value': '1000000'}, 'date': '2023-01-01T00:00:00.000Z'}]}
+        first = trace_transactions('root', None, None, max_depth=0)
+        second = trace_transactions('root', None, None, max_depth=0)
+        assert len(first) == len(second) == 1
+        session = TraceSession()
+        trace_transactions('root', None, None, max_depth=1, session=session)
+        assert session.traced == {'root', 'dest'}
+        assert session.node_levels == {'dest': 1}
+        summary = session.summary()
+        assert (summary['accounts_fetched'], summary['transfers_kept'], summary['visited']) == (2, 1, 2)
+
+def test_iter_trace_stops_mid_level_at_request_budget():
+    # Edge case: a wide level is not fetched in full once the page budget is spent
+    from utils.session import TraceSession
+    wide = [{'Account': 'root', 'Destination': f'd{i}', 'Amount': {'value': '1000000'}} for i in range(10)]
+    with patch('xrp_track.get_transactions') as mock_get:
+        mock_get.side_effect = lambda account, marker=None, limit=200, cache_only=None, head_ttl=None: {'transactions': wide if account == 'root' else []}
+        session = TraceSession(max_requests=3)
+        transfers = trace_transactions('root', None, None, max_depth=2, workers=1, session=session)
+        assert mock_get.call_count == 3  # root, d0 and d1; d2..d9 stay leaves
+        assert len(transfers) == 10 and session.exhausted
+        assert session.stats['accounts_fetched'] == 3
@@ -0,0 +1,36 @@
+import networkx as nx
+import matplotlib.pyplot as plt
+from xrp_track import visualize_graph, collapse_leaves, RENDER_STATS
+
+def fan_graph(leaves):
+    G = nx.DiGraph()
+    node_levels = {'root': 0, 'hub': 1}
+    G.add_edge('root', 'hub', weight=1000.0)
+    for i in range(leaves):
+        G.add_edge('hub', f'leaf{i}', weight=float(i + 1))
+        node_levels[f'leaf{i}'] = 2
+    return G, node_levels
+
+def test_visualize_graph_buffer_closes_figure():
+    # Success path: in-memory render leaves no open figures behind
+    G, node_levels = fan_graph(5)
+    buf = visualize_graph(G, node_levels, filename=None)
+    assert buf.read(4) == b'\x89PNG'
+    assert plt.get_fignums() == []
+    assert RENDER_STATS['nodes'] == 7
+
+def test_collapse_leaves_merges_small_transfers():
+    # Success path: leaves under the threshold become one aggregate node
+    G, node_levels = fan_graph(10)
+    H, levels = collapse_leaves(G, node_levels, min_value=5)
+    assert H.number_of_nodes() == 2 + 6 + 1  # root, hub, leaves 5..10, one bucket for leaves 1..4
+    assert H.edges['hub', 'hub:+4']['weight'] == 10.0
+    assert levels['hub:+4'] == 2
+
+def test_visualize_graph_large_svg(tmp_path):
+    # Edge case: thinned SVG output without per-edge labels
+    G, node_levels = fan_graph(400)
+    target = tmp_path / 'graph.svg'
+    visualize_graph(G, node_levels, filename=str(target), max_nodes=50, edge_label_limit=10)
+    assert target.read_text().lstrip().startswith('<?xml')
+    assert RENDER_STATS['nodes'] == 50
@@ -0,0 +1,207 @@
+import time
+import random
+import threading
+from urllib.parse import urlsplit
+
+# Requests per second and burst size per API host. Etherscan's free tier allows 5 calls/sec;
+# XRPSCAN does not publish a hard number, so stay well under the point where it starts returning 429.
+PROVIDER_LIMITS = {
+    'api.xrpscan.com': (2.0, 4),
+    'api.etherscan.io': (5.0, 5),
+}
+DEFAULT_LIMIT = (2.0, 2)
+
+# Connections kept alive per host at the default worker count. Pools block when full, so callers
+# running more fetch workers than this call ensure_pool_size first and never queue for a connection.
+POOL_SIZES = {
+    'api.xrpscan.com': 8,
+    'api.etherscan.io': 5,
+}
+DEFAULT_POOL_SIZE = 4
+
+BACKOFF_BASE = 1.0  # Seconds; doubled per retry, with full jitter
+BACKOFF_CAP = 60.0
+RETRY_STATUSES = {500, 502, 503, 504}
+
+
+class ApiError(Exception):
+    pass
+
+
+class TokenBucket:
+    """Thread-safe token bucket. On a 429 the refill rate is halved, then recovers on successes."""
+
+    def __init__(self, rate, capacity):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        # Returns the seconds spent waiting for a token
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill(time.monotonic())
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def throttle(self):
+        with self.lock:
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+            self.tokens = 0
+
+    def recover(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+
+_buckets = {}
+_stats = {}
+_sessions = {}
+_min_pool_size = 0  # Raised by ensure_pool_size
+_lock = threading.Lock()
+
+
+def _host_state(host):
+    with _lock:
+        if host not in _buckets:
+            _buckets[host] = TokenBucket(*PROVIDER_LIMITS.get(host, DEFAULT_LIMIT))
+            _stats[host] = {'requests': 0, 'rate_limited': 0, 'retries': 0, 'errors': 0,
+                            'pacing_wait': 0.0, 'backoff_wait': 0.0, 'new_connections': 0,
+                            'connect_time': 0.0, 'ttfb_time': 0.0, 'download_time': 0.0, 'bytes': 0}
+        return _buckets[host], _stats[host]
+
+
+def get_session(host):
+    # One pooled session per host, shared by all tracer threads
+    with _lock:
+        if host not in _sessions:
+            from utils import http_pool  # requests/urllib3 load with the first request, not at import
+            _sessions[host] = http_pool.new_session(max(POOL_SIZES.get(host, DEFAULT_POOL_SIZE), _min_pool_size))
+        return _sessions[host]
+
+
+def ensure_pool_size(workers):
+    # Make every host's pool hold at least one connection per fetch worker. Sessions built
+    # smaller are dropped (not closed, so requests in flight finish) and rebuilt on next use.
+    global _min_pool_size
+    with _lock:
+        if workers > _min_pool_size:
+            _min_pool_size = workers
+            _sessions.clear()
+
+
+def _timed_get(session, url, params, timeout, stats):
+    # Splits the request into connect, time-to-first-byte and body download
+    from utils.http_pool import timing
+    timing.connect = 0.0
+    start = time.perf_counter()
+    response = session.get(url, params=params, timeout=timeout, stream=True)
+    headers_at = time.perf_counter()
+    body = response.content
+    done = time.perf_counter()
+    connect = timing.connect
+    with _lock:
+        stats['connect_time'] += connect
+        stats['new_connections'] += 1 if connect else 0
+        stats['ttfb_time'] += headers_at - start - connect
+        stats['download_time'] += done - headers_at
+        stats['bytes'] += len(body)
+    return response
+
+
+def _count(stats, name, n=1):
+    with _lock:
+        stats[name] += n
+
+
+def retry_after_seconds(value):
+    # Retry-After is either delta-seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    from email.utils import parsedate_to_datetime
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt):
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+def request_json(url, params=None, retries=5, timeout=10):
+    host = urlsplit(url).hostname
+    bucket, stats = _host_state(host)
+    session = get_session(host)
+    from requests import exceptions  # Already loaded by get_session
+    for attempt in range(retries):
+        _count(stats, 'pacing_wait', bucket.acquire())
+        _count(stats, 'requests')
+        try:
+            response = _timed_get(session, url, params, timeout, stats)
+        except (exceptions.ConnectionError, exceptions.Timeout) as e:
+            delay = backoff_delay(attempt)
+            print(f"Request to {host} failed ({e.__class__.__name__}), retrying in {delay:.1f}s... ({attempt + 1}/{retries})")
+        else:
+            if response.status_code == 429:
+                bucket.throttle()
+                _count(stats, 'rate_limited')
+                delay = retry_after_seconds(response.headers.get('Retry-After'))
+                if delay is None:
+                    delay = backoff_delay(attempt)
+                print(f"Rate limit hit on {host}, sleeping for {delay:.1f} seconds...")
+            elif response.status_code in RETRY_STATUSES:
+                delay = backoff_delay(attempt)
+                print(f"{response.status_code} error from {host}, retrying in {delay:.1f}s... ({attempt + 1}/{retries})")
+            else:
+                response.raise_for_status()
+                bucket.recover()
+                return response.json()
+        if attempt + 1 < retries:
+            _count(stats, 'retries')
+            _count(stats, 'backoff_wait', delay)
+            time.sleep(delay)
+    _count(stats, 'errors')
+    raise ApiError(f"Max retries exceeded for {url}")
+
+
+def pacing_stats():
+    with _lock:
+        return {host: dict(stats, rate=_buckets[host].rate) for host, stats in _stats.items()}
+
+
+def latency_stats():
+    # Mean per-request connect / TTFB / download seconds for each host
+    with _lock:
+        return {host: {'connect': stats['connect_time'] / max(stats['requests'], 1),
+                       'ttfb': stats['ttfb_time'] / max(stats['requests'], 1),
+                       'download': stats['download_time'] / max(stats['requests'], 1),
+                       'new_connections': stats['new_connections']}
+                for host, stats in _stats.items()}
+
+
+def reset_api_state():
+    global _min_pool_size
+    with _lock:
+        _buckets.clear()
+        _stats.clear()
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+        _min_pool_size = 0
@@ -0,0 +1,96 @@
+import json
+import calendar
+from abc import ABC, abstractmethod
+from utils.records import Transfer, format_amount, format_units
+from utils import metrics
+
+
+class LedgerBackend(ABC):
+    """Source of one chain's account histories for the shared tracer.
+
+    A backend turns an account and a date window into a stream of Transfer records (both
+    directions, so per-account heuristics see incoming flows). Backends implement fetch_page,
+    and may also override iter_account when paging needs more state (XRPSCAN's depth cut-off
+    and re-trace watermarks). Amounts are in the chain's base unit: 10 ** decimals per unit.
+    """
+    name = 'ledger'
+    unit = ''
+    decimals = 0
+    known_exchanges = {}
+
+    def normalize(self, account):
+        # Canonical spelling of an address, so the same account is never traced twice
+        return account
+
+    def window(self, start_datetime, end_datetime, session=None):
+        # Resolved once per trace; ETH turns dates into a block range here
+        return start_datetime, end_datetime
+
+    def reaches_genesis(self, window):
+        # Whether window has no start bound, so an account's full history within it includes
+        # the payment that funded it
+        return window[0] is None
+
+    @abstractmethod
+    def fetch_page(self, account, window, cursor=None):
+        """Return (transfers, next_cursor) for one page; next_cursor is None after the last."""
+
+    def iter_account(self, account, window, depth=0, max_depth=0, watermarks=None, session=None):
+        cursor = None
+        while True:
+            transfers, cursor = self.fetch_page(account, window, cursor)
+            metrics.count('pages_fetched')
+            if session is not None:
+                session.count('pages_fetched')
+                session.count('pages_used', 1 if transfers else 0)
+            yield from transfers
+            if cursor is None:
+                break
+        if session is not None and self.reaches_genesis(window):
+            session.complete_histories.add(account)
+
+    def native_value(self, amount):
+        # Amount in whole units, for layout and ranking only
+        return amount / 10 ** self.decimals
+
+    def format_value(self, amount, asset=None):
+        if asset is not None:
+            return f"{format_amount(amount)} {asset}"
+        if isinstance(amount, int):
+            return f"{format_units(amount, self.decimals)} {self.unit}"
+        return f"{self.native_value(amount):,} {self.unit}"
+
+
+class FixtureBackend(LedgerBackend):
+    """Offline backend serving fixed histories, for tests and benchmarks.
+
+    histories maps account -> list of Transfer records, newest first like the live APIs;
+    page_size splits each history into pages so paging and request counts are exercised.
+    """
+    name = 'fixture'
+
+    def __init__(self, histories, page_size=200, unit='XRP', decimals=6, known_exchanges=None):
+        self.histories = histories
+        self.page_size = page_size
+        self.unit = unit
+        self.decimals = decimals
+        self.known_exchanges = known_exchanges or {}
+        self.requests = 0
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        # JSON object of account -> [[account, destination, amount, timestamp, hash(, asset)], ...]
+        with open(path) as f:
+            data = json.load(f)
+        return cls({account: [Transfer(*row) for row in rows] for account, rows in data.items()}, **kwargs)
+
+    def fetch_page(self, account, window, cursor=None):
+        self.requests += 1
+        start = cursor or 0
+        history = self.histories.get(account, [])
+        page = history[start:start + self.page_size]
+        start_time, end_time = (None if bound is None else calendar.timegm(bound.utctimetuple()) for bound in window)  # Naive datetimes are UTC
+        transfers = [txn for txn in page if txn.timestamp is None
+                     or ((start_time is None or txn.timestamp >= start_time) and (end_time is None or txn.timestamp <= end_time))]
+        next_cursor = start + self.page_size if start + self.page_size < len(history) else None
+        return transfers, next_cursor
@@ -0,0 +1,139 @@
+import sqlite3
+import os
+import json
+import time
+import zlib
+import threading
+import weakref
+
+CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data/cache.db')
+
+# The newest page of an account (no marker) can still grow, so it expires; marker pages and
+# single transactions are settled ledger history and are kept until evicted for space.
+HEAD_PAGE_TTL = 6 * 3600  # Seconds
+MAX_CACHE_BYTES = 512 * 1024 * 1024  # Compressed payload bytes kept on disk
+EVICT_CHECK_EVERY = 100  # Writes between size checks
+ACCESS_STAMP_EVERY = 300  # Seconds: a hit only rewrites accessed_at when the stamp is older (LRU needs no finer grain)
+
+# Offline mode: serve only from the cache and fail on a miss (set by --cache-only). A trace
+# can override it for itself with TraceSession.cache_only.
+CACHE_ONLY = False
+
+_stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+_lock = threading.Lock()
+_local = threading.local()
+
+
+class CacheMissError(Exception):
+    pass
+
+
+def is_offline(cache_only=None):
+    # A per-call or per-trace setting wins; None falls back to the process-wide CACHE_ONLY
+    return CACHE_ONLY if cache_only is None else cache_only
+
+
+def head_page_ttl(ttl=None):
+    # Likewise for the head-page TTL (a re-trace sets 0 on its session to see new activity)
+    return HEAD_PAGE_TTL if ttl is None else ttl
+
+
+def connect_cache(check_same_thread=True):
+    conn = sqlite3.connect(CACHE_PATH, timeout=30, check_same_thread=check_same_thread)
+    conn.execute('PRAGMA journal_mode=WAL')  # Fetch threads read while another writes
+    conn.execute('PRAGMA synchronous=NORMAL')  # A lost last write only costs a refetch
+    conn.execute('CREATE TABLE IF NOT EXISTS pages (key TEXT PRIMARY KEY, body BLOB, size INTEGER, '
+                 'created_at REAL, accessed_at REAL)')
+    conn.execute('CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed_at)')
+    return conn
+
+
+class _ThreadConnection:
+    # Owner of one thread's cache connection, closed by the finalizer once the thread ends
+    def __init__(self):
+        self.path = CACHE_PATH
+        self.conn = connect_cache(check_same_thread=False)
+        self.close = weakref.finalize(self, self.conn.close)
+
+
+def shared_connection():
+    # One long-lived connection per thread, reopened if CACHE_PATH changes
+    holder = getattr(_local, 'holder', None)
+    if holder is None or holder.path != CACHE_PATH:
+        if holder is not None:
+            holder.close()
+        holder = _local.holder = _ThreadConnection()
+    return holder.conn
+
+
+def page_key(account, marker=None, limit=200):
+    marker_part = json.dumps(marker, sort_keys=True) if marker else ''
+    return f"account:{account}:{limit}:{marker_part}"
+
+
+def transaction_key(tx_id):
+    return f"tx:{tx_id}"
+
+
+def _count(name, n=1):
+    with _lock:
+        _stats[name] += n
+
+
+def get_cached(key, ttl=None):
+    conn = shared_connection()
+    row = conn.execute('SELECT body, created_at, accessed_at FROM pages WHERE key = ?', (key,)).fetchone()
+    now = time.time()
+    if row is None or (ttl is not None and now - row[1] > ttl):
+        _count('misses')
+        return None
+    if now - row[2] > ACCESS_STAMP_EVERY:
+        conn.execute('UPDATE pages SET accessed_at = ? WHERE key = ?', (now, key))
+        conn.commit()
+    _count('hits')
+    return json.loads(zlib.decompress(row[0]))
+
+
+def put_cached(key, value):
+    body = zlib.compress(json.dumps(value).encode('utf-8'))
+    now = time.time()
+    conn = shared_connection()
+    conn.execute('INSERT OR REPLACE INTO pages (key, body, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+                 (key, body, len(body), now, now))
+    conn.commit()
+    with _lock:
+        _stats['writes'] += 1
+        check_size = _stats['writes'] % EVICT_CHECK_EVERY == 0
+    if check_size:
+        evict(conn)
+
+
+def evict(conn, max_bytes=None):
+    # Drop least recently used entries until the cache is back under 90% of its byte budget
+    max_bytes = MAX_CACHE_BYTES if max_bytes is None else max_bytes
+    total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM pages').fetchone()[0]
+    if total <= max_bytes:
+        return 0
+    target = total - int(max_bytes * 0.9)
+    freed = 0
+    doomed = []
+    for key, size in conn.execute('SELECT key, size FROM pages ORDER BY accessed_at'):
+        doomed.append((key,))
+        freed += size
+        if freed >= target:
+            break
+    conn.executemany('DELETE FROM pages WHERE key = ?', doomed)
+    conn.commit()
+    _count('evictions', len(doomed))
+    return len(doomed)
+
+
+def cache_stats():
+    with _lock:
+        return dict(_stats)
+
+
+def reset_cache_stats():
+    with _lock:
+        for name in _stats:
+            _stats[name] = 0
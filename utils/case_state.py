@@ -0,0 +1,68 @@
+import os
+import json
+from datetime import datetime
+from utils.records import Transfer
+
+CASES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data/cases')
+
+
+def case_path(name):
+    return os.path.join(CASES_DIR, f"{name}.json")
+
+
+def new_case(account, start_datetime, end_datetime, max_depth):
+    return {
+        'account': account,
+        'start': start_datetime.isoformat() if start_datetime else None,
+        'end': end_datetime.isoformat() if end_datetime else None,
+        'max_depth': max_depth,
+        'traced': [],
+        'node_levels': {},
+        'watermarks': {},  # account -> newest ledger_index/date seen
+        'transfers': [],  # Graph edges kept so far: [account, destination, amount, timestamp, hash, asset]
+        'alerts': [],
+        'updated_at': None,
+    }
+
+
+def load_case(name):
+    with open(case_path(name)) as f:
+        return json.load(f)
+
+
+def save_case(name, state):
+    # Written to a temp file and renamed, so an interrupted save never corrupts the case
+    os.makedirs(CASES_DIR, exist_ok=True)
+    state['updated_at'] = datetime.utcnow().isoformat(timespec='seconds')
+    path = case_path(name)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(path + '.tmp', path)
+
+
+def case_transfers(state):
+    return [Transfer(*row) for row in state['transfers']]
+
+
+def record_transfers(transfers, state):
+    # Pass a transfer stream through unchanged while appending each one to the case
+    for txn in transfers:
+        state['transfers'].append([txn.account, txn.destination, txn.amount, txn.timestamp, txn.hash, txn.asset, txn.destination_tag])
+        yield txn
+
+
+def case_reached_by(state):
+    # Account -> the source whose edge first reached it. Only that edge's transfers were kept,
+    # so the first kept transfer into each account names it.
+    reached_by = {}
+    for row in state['transfers']:
+        reached_by.setdefault(row[1], row[0])
+    return reached_by
+
+
+def revisit_levels(state):
+    # Accounts fetched on earlier runs, grouped by depth, for an incremental re-trace
+    levels = {}
+    for account in state['watermarks']:
+        levels.setdefault(state['node_levels'].get(account, 0), []).append(account)
+    return levels
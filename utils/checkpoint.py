@@ -0,0 +1,118 @@
+import os
+import json
+import time
+from utils.records import Transfer
+
+CHECKPOINT_INTERVAL = 30.0  # Seconds between forced flushes of buffered entries
+CHECKPOINT_BUFFER = 500  # Entries buffered before a flush regardless of time
+
+
+def _rows(transfers):
+    return [[t.account, t.destination, t.amount, t.timestamp, t.hash, t.asset, t.destination_tag] for t in transfers]
+
+
+class TraceCheckpoint:
+    """Append-only journal of a running trace, one JSON line per fully processed account.
+
+    Each entry holds only what that account added (newly reached accounts, levels, kept
+    transfers, alerts, watermark), so a checkpoint costs the size of the new work, not of the
+    whole visited set. Replaying the journal rebuilds the trace state and the frontier still
+    to do. Full account histories are not journaled; tracer.refetch_history rebuilds them.
+    """
+
+    def __init__(self, path, interval=CHECKPOINT_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.buffer = []
+        self.flushed_at = time.monotonic()
+        self.file = None
+
+    def start(self, params, root):
+        # Begin a fresh journal; params identify the trace so a resume can be validated
+        self.file = open(self.path, 'w')
+        self.buffer.append({'params': params, 'root': root})
+        self.flush()
+
+    def resume(self, offset=None):
+        # Append after the last intact entry; offset (from load_checkpoint) cuts off a torn line
+        self.file = open(self.path, 'a')
+        if offset is not None:
+            self.file.truncate(offset)
+
+    def record(self, source, depth, reached, kept, node_levels, alerts, mixer=False, watermark=None):
+        entry = {
+            'source': source, 'depth': depth, 'reached': reached,
+            'levels': {txn.destination: node_levels[txn.destination] for txn in kept},
+            'transfers': _rows(kept), 'alerts': alerts, 'mixer': mixer,
+        }
+        if watermark is not None:
+            entry['watermark'] = watermark
+        self.buffer.append(entry)
+        if len(self.buffer) >= CHECKPOINT_BUFFER or time.monotonic() - self.flushed_at >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if self.buffer and self.file:
+            self.file.write(''.join(json.dumps(entry) + '\n' for entry in self.buffer))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.buffer = []
+        self.flushed_at = time.monotonic()
+
+    def close(self, remove=False):
+        if self.file:
+            self.flush()
+            self.file.close()
+            self.file = None
+        if remove and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def load_checkpoint(path):
+    """Replay a journal into the state needed to resume, or None if there is no usable one.
+
+    state['offset'] is the byte length of the intact entries; pass it to
+    TraceCheckpoint.resume() so new entries don't land after a torn line.
+    """
+    if not os.path.exists(path):
+        return None
+    state = None
+    offset = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break  # Torn final line from a hard kill; everything before it is intact
+            if not line.endswith(b'\n'):
+                break  # Cut off right at the end of the JSON: still torn
+            offset += len(line)
+            if 'params' in entry:
+                state = {'params': entry['params'], 'order': [entry['root']], 'processed': set(),
+                         'node_levels': {}, 'transfers': [], 'alerts': [], 'mixers': set(),
+                         'watermarks': {}}
+                continue
+            if state is None:
+                return None
+            state['processed'].add(entry['source'])
+            state['order'].extend(entry['reached'])
+            state['node_levels'].update(entry['levels'])
+            state['transfers'].extend(Transfer(*row) for row in entry['transfers'])
+            state['alerts'].extend(entry['alerts'])
+            if entry['mixer']:
+                state['mixers'].add(entry['source'])
+            if 'watermark' in entry:
+                state['watermarks'][entry['source']] = entry['watermark']
+    if state is not None:
+        state['offset'] = offset
+    return state
+
+
+def pending_levels(state, node_levels, max_depth):
+    # Accounts reached but not yet fetched, grouped by depth in the order they were reached
+    levels = {}
+    for account in state['order']:
+        level = node_levels.get(account, 0)
+        if account not in state['processed'] and level <= max_depth:
+            levels.setdefault(level, []).append(account)
+    return levels
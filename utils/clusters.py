@@ -0,0 +1,283 @@
+import os
+import time
+import sqlite3
+import argparse
+import threading
+from collections import defaultdict
+
+# Persistent cross-case address clusters: a union-find forest stored next to data/tags.db and
+# held in memory as parent/rank dicts, so find() is effectively constant time (path
+# compression plus union by rank). Merges come from the heuristics in cluster_links() and from
+# analysts; each one is recorded with its reason and case. A cluster takes a label from its
+# tagged, exchange or mixer members, and the tracer stops at any member of an exchange or mixer
+# cluster without fetching it.
+CLUSTER_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data/clusters.db')
+
+SERVICE_TYPES = ('exchange', 'mixer')  # Cluster types the tracer does not expand
+LABEL_PRIORITY = {'exchange': 3, 'mixer': 2, 'other': 1}  # Which label a merged cluster keeps
+FUNDING_WINDOW = 3600  # Seconds; first inflows from one funder this close together are one batch
+MAX_FUNDED_BATCH = 50  # Larger funding batches look like a payout service, not one owner
+RELOAD_CHECK_INTERVAL = 1.0  # Seconds between checks for merges written by other processes
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS cluster_parent (address TEXT PRIMARY KEY, parent TEXT NOT NULL, rank INTEGER NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS cluster_labels (root TEXT PRIMARY KEY, label TEXT NOT NULL, type TEXT NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS cluster_evidence (a TEXT, b TEXT, reason TEXT, case_name TEXT, created_at REAL)',
+]
+
+
+def connect_clusters(path=None):
+    conn = sqlite3.connect(path or CLUSTER_PATH, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    for statement in SCHEMA:
+        conn.execute(statement)
+    return conn
+
+
+class ClusterIndex:
+    """Union-find over addresses, loaded lazily from CLUSTER_PATH on first use.
+
+    Lookups never touch the database; merges and labels are kept in memory until save(). A
+    missing database is an empty index (nothing is created until the first save). Saves from
+    other processes are picked up on the next lookup after the file changes.
+    """
+
+    def __init__(self):
+        self.parent = {}
+        self.rank = {}
+        self.labels = {}  # Root -> (label, type)
+        self.evidence = []
+        self.dirty = set()
+        self.dirty_labels = set()
+        self.path = None
+        self.mtime = None
+        self.checked_at = 0.0
+        self.lock = threading.RLock()
+
+    def _load(self):
+        now = time.monotonic()
+        if self.path == CLUSTER_PATH and now - self.checked_at < RELOAD_CHECK_INTERVAL:
+            return
+        mtime = os.path.getmtime(CLUSTER_PATH) if os.path.exists(CLUSTER_PATH) else None
+        with self.lock:
+            self.checked_at = now
+            if self.path == CLUSTER_PATH and mtime == self.mtime:
+                return
+            if self.path == CLUSTER_PATH and (self.dirty or self.dirty_labels or self.evidence):
+                return  # Unsaved merges win until save() writes them
+            self.parent, self.rank, self.labels = {}, {}, {}
+            self.path, self.mtime = CLUSTER_PATH, mtime
+            if mtime is None:
+                return
+            conn = sqlite3.connect(CLUSTER_PATH, timeout=30)
+            try:
+                for address, parent, rank in conn.execute('SELECT address, parent, rank FROM cluster_parent'):
+                    self.parent[address] = parent
+                    self.rank[address] = rank
+                self.labels = {root: (label, kind) for root, label, kind in conn.execute('SELECT root, label, type FROM cluster_labels')}
+            except sqlite3.OperationalError:
+                pass  # Created but never saved to
+            finally:
+                conn.close()
+
+    def _find(self, address):
+        root = address
+        while self.parent.get(root, root) != root:
+            root = self.parent[root]
+        while address != root:  # Path compression
+            self.parent[address], address = root, self.parent[address]
+            self.dirty.add(address)
+        return root
+
+    def find(self, address):
+        """Representative address of address's cluster (address itself if it is in none)."""
+        self._load()
+        with self.lock:
+            return self._find(address) if address in self.parent else address
+
+    def union(self, a, b, reason, case=None):
+        # Returns True if a and b were in different clusters
+        self._load()
+        with self.lock:
+            root_a, root_b = self._find(a), self._find(b)
+            if root_a == root_b:
+                return False
+            if self.rank.get(root_a, 0) < self.rank.get(root_b, 0):
+                root_a, root_b = root_b, root_a
+            self.parent[root_b] = root_a
+            self.parent.setdefault(root_a, root_a)
+            if self.rank.get(root_a, 0) == self.rank.get(root_b, 0):
+                self.rank[root_a] = self.rank.get(root_a, 0) + 1
+            self.rank.setdefault(root_b, 0)
+            self.dirty.update((root_a, root_b))
+            # The merged cluster keeps the stronger of the two labels
+            labels = [label for label in (self.labels.pop(root_a, None), self.labels.pop(root_b, None)) if label]
+            self.dirty_labels.update((root_a, root_b))
+            if labels:
+                self.labels[root_a] = max(labels, key=lambda label: LABEL_PRIORITY.get(label[1], 0))
+            self.evidence.append((a, b, reason, case, time.time()))
+            return True
+
+    def label(self, address, label, kind='other'):
+        # Label address's cluster unless it already has an equal or stronger label
+        self._load()
+        with self.lock:
+            self.parent.setdefault(address, address)
+            self.rank.setdefault(address, 0)
+            self.dirty.add(address)
+            root = self._find(address)
+            current = self.labels.get(root)
+            if current is None or LABEL_PRIORITY.get(kind, 0) > LABEL_PRIORITY.get(current[1], 0):
+                self.labels[root] = (label, kind)
+                self.dirty_labels.add(root)
+
+    def cluster_label(self, address):
+        """(label, type) of address's cluster, or None."""
+        self._load()
+        with self.lock:
+            if address not in self.parent:
+                return None
+            return self.labels.get(self._find(address))
+
+    def service_label(self, address):
+        # The label of an exchange or mixer cluster that address belongs to, else None
+        label = self.cluster_label(address)
+        return label if label and label[1] in SERVICE_TYPES else None
+
+    def members(self, address):
+        self._load()
+        with self.lock:
+            root = self.find(address)
+            return sorted(member for member in self.parent if self._find(member) == root) or [address]
+
+    def save(self):
+        """Write pending merges, labels and evidence to CLUSTER_PATH in one transaction."""
+        with self.lock:
+            if not (self.dirty or self.dirty_labels or self.evidence):
+                return 0
+            conn = connect_clusters()
+            try:
+                with conn:
+                    conn.executemany('INSERT OR REPLACE INTO cluster_parent (address, parent, rank) VALUES (?, ?, ?)',
+                                     [(address, self.parent[address], self.rank.get(address, 0)) for address in self.dirty if address in self.parent])
+                    conn.executemany('DELETE FROM cluster_labels WHERE root = ?', [(root,) for root in self.dirty_labels])
+                    conn.executemany('INSERT INTO cluster_labels (root, label, type) VALUES (?, ?, ?)',
+                                     [(root, *self.labels[root]) for root in self.dirty_labels if root in self.labels])
+                    conn.executemany('INSERT INTO cluster_evidence (a, b, reason, case_name, created_at) VALUES (?, ?, ?, ?, ?)', self.evidence)
+            finally:
+                conn.close()
+            merges = len(self.evidence)
+            self.dirty.clear()
+            self.dirty_labels.clear()
+            self.evidence = []
+            self.mtime = os.path.getmtime(CLUSTER_PATH)
+            return merges
+
+
+# Process-wide cluster index shared by the tracer and the CLI
+CLUSTERS = ClusterIndex()
+
+
+def cluster_links(transfers, services=(), complete=None):
+    """Same-owner links suggested by a trace's transfers, as (a, b, reason) tuples.
+
+    - activation: an account's first inflow, arriving before anything it sent, came from the
+      funder that activated it
+    - common_funding: accounts first funded by one funder within FUNDING_WINDOW of each other
+      (batch-created wallets); batches over MAX_FUNDED_BATCH are skipped
+    - destination_tag: senders paying a service address with the same destination tag share
+      that service's customer account
+    Addresses in services (exchanges and other tagged services) are never linked by activation
+    or funding, or every customer of an exchange would end up in one cluster. The first inflow
+    seen is only the funding payment if the account's whole history was fetched, so with
+    complete (the accounts whose history was; see TraceSession.complete_histories) activation
+    and funding links are limited to those. None treats every history as complete.
+    """
+    services = set(services)
+    first_in, first_out = {}, {}
+    deposits = defaultdict(set)
+    for txn in transfers:
+        if txn.destination is None or txn.amount is None or txn.account == txn.destination:
+            continue
+        timestamp = txn.timestamp if txn.timestamp is not None else float('inf')
+        if txn.destination not in first_in or timestamp < first_in[txn.destination][0]:
+            first_in[txn.destination] = (timestamp, txn.account)
+        first_out[txn.account] = min(first_out.get(txn.account, float('inf')), timestamp)
+        if txn.destination_tag is not None and txn.destination in services:
+            deposits[txn.destination, txn.destination_tag].add(txn.account)
+
+    links = []
+    funded = defaultdict(list)
+    for account, (timestamp, funder) in first_in.items():
+        if funder in services or account in services or timestamp == float('inf'):
+            continue
+        if complete is not None and account not in complete:
+            continue  # Date window or paging cut the history: its first inflow may not be the first
+        if timestamp <= first_out.get(account, float('inf')):
+            links.append((funder, account, 'activation'))
+        funded[funder].append((timestamp, account))
+    for batch in funded.values():
+        batch.sort()
+        group = [batch[0]]
+        for entry in batch[1:] + [(float('inf'), None)]:
+            if entry[0] - group[-1][0] <= FUNDING_WINDOW:
+                group.append(entry)
+                continue
+            if 1 < len(group) <= MAX_FUNDED_BATCH:
+                links.extend((group[0][1], account, 'common_funding') for _, account in group[1:])
+            group = [entry]
+    for (service, tag), senders in deposits.items():
+        senders = sorted(senders)
+        links.extend((senders[0], sender, f'destination_tag:{service}:{tag}') for sender in senders[1:])
+    return links
+
+
+def update_clusters(transfers, known_exchanges=None, tags=None, suspected_mixers=(), case=None, index=None, complete=None):
+    """Merge a finished trace into the persistent index; returns the number of new merges.
+
+    Known exchanges and tagged addresses label their clusters, and so do suspected mixers, so
+    later traces stop at any wallet linked to them. complete is passed on to cluster_links.
+    """
+    index = CLUSTERS if index is None else index
+    transfers = list(transfers)
+    known_exchanges = known_exchanges or {}
+    addresses = {txn.account for txn in transfers} | {txn.destination for txn in transfers if txn.destination}
+    tagged = tags.get_many(addresses) if tags is not None else {}
+    services = set(known_exchanges) | {address for address, tag in tagged.items() if tag['type'] == 'exchange'}
+    merges = sum(index.union(a, b, reason, case) for a, b, reason in cluster_links(transfers, services, complete))
+    for address, name in known_exchanges.items():
+        if address in addresses:
+            index.label(address, name, 'exchange')
+    for address, tag in tagged.items():
+        index.label(address, tag['label'], tag['type'] if tag['type'] in LABEL_PRIORITY else 'other')
+    for address in suspected_mixers:
+        index.label(address, 'Suspected mixer', 'mixer')
+    index.save()
+    return merges
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or edit the address cluster index.")
+    parser.add_argument("action", choices=["show", "merge", "label"])
+    parser.add_argument("address")
+    parser.add_argument("other", nargs="?", help="merge: second address; label: the label text")
+    parser.add_argument("--type", default="other", choices=sorted(LABEL_PRIORITY), help="label: cluster type")
+    parser.add_argument("--reason", default="manual", help="merge: evidence recorded with the merge")
+    parser.add_argument("--db", default=CLUSTER_PATH, help="Cluster database path")
+    args = parser.parse_args()
+
+    CLUSTER_PATH = args.db
+    if args.action == "merge":
+        if not args.other:
+            parser.error("merge needs two addresses")
+        CLUSTERS.union(args.address, args.other, args.reason)
+        CLUSTERS.save()
+    elif args.action == "label":
+        if not args.other:
+            parser.error("label needs the label text")
+        CLUSTERS.label(args.address, args.other, args.type)
+        CLUSTERS.save()
+    members = CLUSTERS.members(args.address)
+    print(f"Cluster of {args.address}: {len(members)} members, label {CLUSTERS.cluster_label(args.address)}")
+    for member in members[:50]:
+        print(f"  {member}")
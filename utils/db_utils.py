@@ -1,23 +1,264 @@
 import sqlite3
 import os
+import csv
+import json
+import time
+import weakref
+import argparse
+import threading
+from itertools import islice
+from collections import OrderedDict
 
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data/tags.db')
 
+TAG_CACHE_SIZE = 100_000  # Addresses (tagged or not) kept in the in-process LRU
+RELOAD_CHECK_INTERVAL = 1.0  # Seconds between checks for writes from other connections
+LOOKUP_CHUNK = 500  # Addresses per IN (...) query; below SQLite's bound-parameter limit
+BULK_CHUNK = 10_000  # Rows per executemany batch for imports / fetchmany batch for exports
+TAG_FIELDS = ('address', 'label', 'type', 'notes')
+
+_local = threading.local()
+
+
 def connect_db():
     conn = sqlite3.connect(DB_PATH)
     return conn
 
+
+def open_tags_connection(check_same_thread=True):
+    conn = sqlite3.connect(DB_PATH, timeout=30, check_same_thread=check_same_thread)
+    conn.execute('PRAGMA journal_mode=WAL')  # Readers don't block the tag form's writes
+    conn.execute('CREATE TABLE IF NOT EXISTS tags (address TEXT PRIMARY KEY, label TEXT, type TEXT, notes TEXT)')
+    return conn
+
+
+class _ThreadConnection:
+    # Owner of one thread's connection: the thread-local drops it when the thread ends, and the
+    # finalizer then closes the connection (from whichever thread collects it)
+    def __init__(self):
+        self.path = DB_PATH
+        self.conn = open_tags_connection(check_same_thread=False)
+        self.close = weakref.finalize(self, self.conn.close)
+
+
+def shared_connection():
+    # One long-lived connection per thread, reopened if DB_PATH changes
+    holder = getattr(_local, 'holder', None)
+    if holder is None or holder.path != DB_PATH:
+        if holder is not None:
+            holder.close()
+        holder = _local.holder = _ThreadConnection()
+    return holder.conn
+
+
+def _row_to_tag(row):
+    return {'label': row[1], 'type': row[2], 'notes': row[3]}
+
+
 def load_tags():
     conn = connect_db()
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM tags')
-    tags = {row[0]: {'label': row[1], 'type': row[2], 'notes': row[3]} for row in cursor.fetchall()}
+    tags = {row[0]: _row_to_tag(row) for row in cursor.fetchall()}
     conn.close()
     return tags
 
+
 def add_or_update_tag(address, label, tag_type, notes=''):
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute('INSERT OR REPLACE INTO tags (address, label, type, notes) VALUES (?, ?, ?, ?)', (address, label, tag_type, notes))
+    conn = shared_connection()
+    conn.execute('INSERT OR REPLACE INTO tags (address, label, type, notes) VALUES (?, ?, ?, ?)', (address, label, tag_type, notes))
     conn.commit()
-    conn.close() 
\ No newline at end of file
+    TAGS.invalidate(address)
+
+
+class TagStore:
+    """Dict-like, read-through view of the tags table.
+
+    Lookups go through an LRU cache in front of primary-key queries, so the table is never
+    loaded whole. Writes from other processes are noticed through SQLite's data_version
+    and clear the cache, so tag edits show up without a restart. data_version is only
+    comparable on one connection, so the store polls it on a connection of its own rather
+    than on the per-thread lookup connections.
+    """
+
+    def __init__(self, cache_size=TAG_CACHE_SIZE):
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.data_version = None
+        self.path = None
+        self.watch = None  # Connection used only to poll data_version, under self.lock
+        self.checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def _check_reload(self):
+        now = time.monotonic()
+        if now - self.checked_at < RELOAD_CHECK_INTERVAL and self.path == DB_PATH:
+            return
+        with self.lock:
+            if self.path != DB_PATH:
+                if self.watch is not None:
+                    self.watch.close()
+                self.watch = open_tags_connection(check_same_thread=False)
+                self.cache.clear()
+                self.data_version = None
+            version = self.watch.execute('PRAGMA data_version').fetchone()[0]
+            if self.data_version is not None and version != self.data_version:
+                self.cache.clear()
+            self.path, self.data_version, self.checked_at = DB_PATH, version, now
+
+    def _remember(self, address, tag):
+        self.cache[address] = tag
+        self.cache.move_to_end(address)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def get(self, address, default=None):
+        conn = shared_connection()
+        self._check_reload()
+        with self.lock:
+            if address in self.cache:
+                self.hits += 1
+                self.cache.move_to_end(address)
+                tag = self.cache[address]
+                return default if tag is None else tag
+            self.misses += 1
+        row = conn.execute('SELECT address, label, type, notes FROM tags WHERE address = ?', (address,)).fetchone()
+        tag = _row_to_tag(row) if row else None
+        with self.lock:
+            self._remember(address, tag)
+        return default if tag is None else tag
+
+    def get_many(self, addresses):
+        # Bulk lookup for a whole frontier; returns {address: tag} for the tagged ones
+        conn = shared_connection()
+        self._check_reload()
+        found = {}
+        missing = []
+        with self.lock:
+            for address in set(addresses):
+                if address in self.cache:
+                    self.hits += 1
+                    self.cache.move_to_end(address)
+                    if self.cache[address] is not None:
+                        found[address] = self.cache[address]
+                else:
+                    self.misses += 1
+                    missing.append(address)
+        for i in range(0, len(missing), LOOKUP_CHUNK):
+            chunk = missing[i:i + LOOKUP_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            rows = conn.execute(f'SELECT address, label, type, notes FROM tags WHERE address IN ({placeholders})', chunk).fetchall()
+            tags = {row[0]: _row_to_tag(row) for row in rows}
+            found.update(tags)
+            with self.lock:
+                for address in chunk:
+                    self._remember(address, tags.get(address))
+        return found
+
+    def __contains__(self, address):
+        return self.get(address) is not None
+
+    def __getitem__(self, address):
+        tag = self.get(address)
+        if tag is None:
+            raise KeyError(address)
+        return tag
+
+    def invalidate(self, address=None):
+        with self.lock:
+            if address is None:
+                self.cache.clear()
+            else:
+                self.cache.pop(address, None)
+
+
+# Process-wide tag store shared by the tracer and the app
+TAGS = TagStore()
+
+
+def tag_file_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def iter_tag_rows(path, fmt=None, default_type='other'):
+    # Stream (address, label, type, notes) tuples from a CSV (with header) or JSONL file
+    with open(path, newline='', encoding='utf-8') as f:
+        if tag_file_format(path, fmt) == 'jsonl':
+            records = (json.loads(line) for line in f if line.strip())
+        else:
+            records = csv.DictReader(f)
+        for record in records:
+            if not record.get('address') or not record.get('label'):
+                continue
+            yield (record['address'].strip(), record['label'], record.get('type') or default_type, record.get('notes') or '')
+
+
+def bulk_import_tags(path, fmt=None, chunk_size=BULK_CHUNK, default_type='other'):
+    """Load a tag file in one transaction; returns (rows, seconds)."""
+    started = time.perf_counter()
+    rows = iter_tag_rows(path, fmt, default_type)
+    total = 0
+    conn = connect_db()
+    try:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS tags (address TEXT PRIMARY KEY, label TEXT, type TEXT, notes TEXT)')
+        with conn:  # Single transaction: commits once at the end, rolls back on error
+            while True:
+                chunk = list(islice(rows, chunk_size))
+                if not chunk:
+                    break
+                conn.executemany('INSERT OR REPLACE INTO tags (address, label, type, notes) VALUES (?, ?, ?, ?)', chunk)
+                total += len(chunk)
+    finally:
+        conn.close()
+    TAGS.invalidate()
+    return total, time.perf_counter() - started
+
+
+def export_tags(path, fmt=None, chunk_size=BULK_CHUNK):
+    """Stream the tags table to CSV or JSONL; returns (rows, seconds)."""
+    started = time.perf_counter()
+    fmt = tag_file_format(path, fmt)
+    total = 0
+    conn = connect_db()
+    try:
+        cursor = conn.execute('SELECT address, label, type, notes FROM tags ORDER BY address')
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f) if fmt == 'csv' else None
+            if writer:
+                writer.writerow(TAG_FIELDS)
+            while True:
+                chunk = cursor.fetchmany(chunk_size)
+                if not chunk:
+                    break
+                if writer:
+                    writer.writerows(chunk)
+                else:
+                    f.writelines(json.dumps(dict(zip(TAG_FIELDS, row))) + '\n' for row in chunk)
+                total += len(chunk)
+    finally:
+        conn.close()
+    return total, time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import/export of the address tag database.")
+    parser.add_argument("action", choices=["import", "export"])
+    parser.add_argument("path", help="CSV (address,label,type,notes header) or JSONL file")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="File format (default: from extension)")
+    parser.add_argument("--db", default=DB_PATH, help="Tag database path")
+    parser.add_argument("--chunk", type=int, default=BULK_CHUNK, help="Rows per batch")
+    parser.add_argument("--default_type", default="other", help="Type for rows without one (import only)")
+    args = parser.parse_args()
+
+    DB_PATH = args.db
+    if args.action == "import":
+        rows, seconds = bulk_import_tags(args.path, args.format, args.chunk, args.default_type)
+    else:
+        rows, seconds = export_tags(args.path, args.format, args.chunk)
+    print(f"{args.action.capitalize()}ed {rows} tags in {seconds:.2f}s ({rows / max(seconds, 1e-9):,.0f} rows/s)")
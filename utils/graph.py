@@ -0,0 +1,233 @@
+import io
+import os
+import time
+import random
+import numpy as np
+from itertools import islice
+from utils.db_utils import TAGS
+from utils.records import TransferBatch
+from utils import metrics
+
+# Chain-agnostic graph building and rendering, shared by xrp_track and eth_track. networkx and
+# matplotlib are imported by the functions that need them, so importing this module (and the
+# tracer, which uses it) stays cheap for commands that never build or draw a graph.
+
+GRAPH_CHUNK_SIZE = 10_000  # Transfers summed per vectorised batch (and per tag lookup) in build_graph
+
+# Known tags: a cached, read-through view of data/tags.db (nothing is loaded at import)
+KNOWN_TAGS = TAGS
+
+
+# Sum a batch's amounts per (source, destination) pair in one vectorised pass; pairs come back
+# in the order they first appear
+def sum_by_edge(batch):
+    m = len(batch)
+    accounts, codes = np.unique(np.array(batch.sources + batch.destinations, dtype=str), return_inverse=True)
+    pairs, first, index = np.unique(codes[:m].astype(np.int64) * len(accounts) + codes[m:], return_index=True, return_inverse=True)
+    sums = np.zeros(len(pairs), dtype=batch.amounts.dtype)
+    np.add.at(sums, index, batch.amounts)
+    order = np.argsort(first)
+    return [((batch.sources[i], batch.destinations[i]), total) for i, total in zip(first[order].tolist(), sums[order].tolist())]
+
+
+# Create a graph from Transfer records (any iterable, consumed in a single pass). Edges sum the
+# exact base-unit value of every transfer (value, plus tokens per asset for token transfers);
+# weight is the native value in whole units, used for layout, colouring and thinning. Native
+# amounts are summed per edge a chunk at a time, and converted to whole units once per edge
+# after the last chunk.
+@metrics.timed('build_graph')
+def build_graph(backend, transactions, node_levels, suspected_mixers=()):
+    import networkx as nx
+    G = nx.DiGraph()
+    G.graph['ledger'] = backend  # For amount labels; nx.DiGraph(backend=...) is networkx's own dispatch
+    succ = G.succ
+    transactions = iter(transactions)
+    while True:
+        chunk = [txn for txn in islice(transactions, GRAPH_CHUNK_SIZE) if txn.destination is not None and txn.amount is not None]  # Ensure 'Destination' and 'Amount' fields exist
+        if not chunk:
+            break
+        KNOWN_TAGS.get_many(txn.destination for txn in chunk)  # Warm the tag cache in one query
+        native = [txn for txn in chunk if txn.asset is None]
+        edges = dict(sum_by_edge(TransferBatch.from_records(native, exact=True))) if native else {}
+        for txn in chunk:
+            if txn.asset is not None:
+                edges.setdefault((txn.account, txn.destination), 0)  # Token-only edges carry no native value
+        for (source, destination), value in edges.items():
+            if G.has_edge(source, destination):
+                succ[source][destination]['value'] += value
+            else:
+                G.add_edge(source, destination, weight=0.0, value=value)
+            if source not in node_levels:
+                node_levels[source] = 0  # Original wallet level
+            # Set the subset_key attribute for each node
+            G.nodes[source]['subset_key'] = node_levels[source]
+            G.nodes[destination]['subset_key'] = node_levels[destination]
+            # Flag if it's a known exchange or suspected mixer
+            G.nodes[destination]['is_exchange'] = destination in backend.known_exchanges
+            G.nodes[destination]['is_mixer'] = destination in suspected_mixers
+            # Flag tags
+            tag = KNOWN_TAGS.get(destination, None)
+            if tag:
+                G.nodes[destination]['tag_label'] = tag['label']
+                G.nodes[destination]['is_tagged'] = True
+        for txn in chunk:
+            if txn.asset is not None:
+                tokens = succ[txn.account][txn.destination].setdefault('tokens', {})
+                tokens[txn.asset] = tokens.get(txn.asset, 0) + txn.amount
+    for _, _, attrs in G.edges(data=True):
+        attrs['weight'] = backend.native_value(attrs['value'])
+    return G
+
+
+# Store each node's tainted share of inflow (from utils.taint.propagate_taint) for colouring
+def annotate_taint(G, result):
+    index, share = result['graph'].index, result['share']
+    for node in G:
+        i = index.get(node)
+        G.nodes[node]['taint'] = 0.0 if i is None else float(share[i])
+    G.graph['taint_model'] = result['model']
+
+
+def format_wallet_address(address):
+    return f"{address[:4]}...{address[-4:]}"
+
+
+# Amount label of one edge in the units of the graph's backend; hand-built graphs are in XRP
+def edge_label(G, edge):
+    attrs = G.edges[edge]
+    backend = G.graph.get('ledger')
+    if backend is None or 'value' not in attrs:
+        return f"{attrs['weight']:,} {backend.unit if backend else 'XRP'}"
+    parts = [backend.format_value(attrs['value'])] if attrs['value'] else []
+    parts.extend(backend.format_value(amount, asset) for asset, amount in attrs.get('tokens', {}).items())
+    return '\n'.join(parts)
+
+
+EDGE_COLORS = np.array(['#084960', '#016E93', '#4897B4', '#B0D8E9'])  # Weight quartiles, low to high
+EDGE_LABEL_LIMIT = 150  # Draw per-edge amount labels only up to this many edges
+ARROW_EDGE_LIMIT = 500  # Above this, draw edges as one line collection instead of arrow patches
+MAX_FIGURE_INCHES = 60
+TAINT_COLORS = 'Blues'  # Colormap shading unflagged nodes with tainted inflow by tainted share
+RENDER_STATS = {}  # Timing and size of the last visualize_graph call
+
+
+# Replace each parent's low-value, unflagged leaves with one aggregate node
+def collapse_leaves(G, node_levels, min_value):
+    H = G.copy()
+    levels = dict(node_levels)
+    small = {}
+    for node in G.nodes:
+        attrs = G.nodes[node]
+        if G.out_degree(node) or G.in_degree(node) != 1 or attrs.get('is_tagged') or attrs.get('is_exchange') or attrs.get('is_mixer'):
+            continue
+        parent = next(iter(G.predecessors(node)))
+        weight = G.edges[parent, node]['weight']
+        if weight < min_value:
+            small.setdefault(parent, []).append((node, weight))
+    for parent, leaves in small.items():
+        if len(leaves) < 2:
+            continue
+        bucket = f"{parent}:+{len(leaves)}"
+        H.remove_nodes_from(node for node, _ in leaves)
+        H.add_edge(parent, bucket, weight=sum(weight for _, weight in leaves))
+        H.nodes[bucket]['collapsed'] = len(leaves)
+        levels[bucket] = levels.get(leaves[0][0], levels.get(parent, 0) + 1)
+    return H, levels
+
+
+# Image format for a graph file: fmt, else the filename extension, else png
+def image_format(filename=None, fmt=None):
+    return fmt or (os.path.splitext(filename)[1][1:].lower() if filename else '') or 'png'
+
+
+# Visualize the graph. Large graphs can be thinned (max_nodes, collapse_below) and skip per-edge
+# labels and arrows; the output format follows the filename extension or fmt (png, svg, ...).
+# The image is rendered once into memory and returned (and also written to filename, if given)
+# so reports can embed it without rendering or reading the file again.
+@metrics.timed('visualize_graph')
+def visualize_graph(G, node_levels, scale_factor=3.0, filename="graph.png", fmt=None, max_nodes=None, collapse_below=None, edge_label_limit=EDGE_LABEL_LIMIT, dpi=100):
+    if not G.nodes:
+        print("No nodes in graph, skipping visualization.")
+        return None
+    import networkx as nx
+    import matplotlib.pyplot as plt
+    started = time.perf_counter()
+    if collapse_below:
+        G, node_levels = collapse_leaves(G, node_levels, collapse_below)
+
+    # Precompute each node's incoming value once; it drives both thinning and per-level order
+    in_weight = dict(G.in_degree(weight='weight'))
+    if max_nodes and len(G) > max_nodes:
+        roots = [node for node in G if node_levels.get(node) == 0]
+        ranked = sorted((node for node in G if node_levels.get(node) != 0), key=in_weight.get, reverse=True)
+        G = G.subgraph(roots + ranked[:max(max_nodes - len(roots), 0)])
+
+    max_depth = max((node_levels.get(node, 0) for node in G), default=0)
+    level_nodes = {}
+    for node in G:
+        level_nodes.setdefault(node_levels.get(node, max_depth + 1), []).append(node)
+
+    # Sort nodes at each level by descending transaction amount, perturbed slightly to avoid overlapping edges
+    pos = {}
+    for level, nodes in level_nodes.items():
+        nodes.sort(key=in_weight.get, reverse=True)
+        for i, node in enumerate(nodes):
+            pos[node] = (level + random.uniform(-0.05, 0.05), -i + random.uniform(-0.05, 0.05))
+
+    rows = max(len(nodes) for nodes in level_nodes.values())
+    width = min(MAX_FIGURE_INCHES, max(10, (max_depth + 2) * scale_factor))
+    height = min(MAX_FIGURE_INCHES, max(10, rows * 0.3))
+    fig, ax = plt.subplots(figsize=(width, height))
+    try:
+        color_map = []
+        taint_colors = plt.get_cmap(TAINT_COLORS)
+        for node in G:
+            if G.nodes[node].get('is_tagged', False):
+                color_map.append('purple')  # Police-flagged tags in purple
+            elif G.nodes[node].get('is_exchange', False):
+                color_map.append('red')  # Highlight exchanges in red
+            elif G.nodes[node].get('is_mixer', False):
+                color_map.append('orange')  # Highlight suspected mixers in orange
+            elif G.nodes[node].get('taint', 0) > 0:
+                color_map.append(taint_colors(0.3 + 0.7 * G.nodes[node]['taint']))
+            else:
+                level = node_levels.get(node, max_depth)
+                gray_value = 1 - (level / max(max_depth, 1)) * 0.8  # Shades of gray
+                color_map.append((gray_value, gray_value, gray_value))
+
+        edges = list(G.edges)
+        edge_weights = np.array([G.edges[edge]['weight'] for edge in edges], dtype=float)
+        if not len(edge_weights):
+            edge_color_map = []
+        else:
+            quantiles = np.percentile(edge_weights, [25, 50, 75])
+            edge_color_map = EDGE_COLORS[np.searchsorted(quantiles, edge_weights, side='left')].tolist()
+
+        labels = {}
+        for node in G.nodes:
+            if G.nodes[node].get('collapsed'):
+                labels[node] = f"+{G.nodes[node]['collapsed']} small"
+            else:
+                labels[node] = f"{format_wallet_address(node)} {G.nodes[node].get('tag_label', '')}"  # Add tag to label
+        nx.draw_networkx_nodes(G, pos, ax=ax, node_size=200, node_color=color_map)
+        nx.draw_networkx_edges(G, pos, ax=ax, edgelist=edges, edge_color=edge_color_map, arrows=len(edges) <= ARROW_EDGE_LIMIT)
+        nx.draw_networkx_labels(G, pos, ax=ax, labels=labels, font_size=10, font_weight='bold')
+        if len(edges) <= edge_label_limit:
+            edge_labels = {edge: edge_label(G, edge) for edge in edges}
+            nx.draw_networkx_edge_labels(G, pos, ax=ax, edge_labels=edge_labels)
+        ax.set_axis_off()
+
+        result = io.BytesIO()
+        fig.savefig(result, format=image_format(filename, fmt), dpi=dpi)
+        result.seek(0)
+    finally:
+        plt.close(fig)
+
+    elapsed = time.perf_counter() - started
+    RENDER_STATS.update(nodes=len(G), edges=G.number_of_edges(), seconds=elapsed)
+    print(f"Rendered {len(G)} nodes and {G.number_of_edges()} edges in {elapsed:.2f}s")
+    if filename:
+        with open(filename, 'wb') as f:
+            f.write(result.getbuffer())
+        print(f"Graph saved as {filename}")
+    return result
@@ -0,0 +1,147 @@
+import json
+import operator
+import numpy as np
+from utils.records import TransferBatch
+
+# Each rule flags the accounts whose features satisfy every condition (feature, op, threshold)
+DEFAULT_RULES = [
+    {'name': 'mixer', 'conditions': [('in_degree', '>', 10)]},
+    {'name': 'cluster', 'conditions': [('fan_out', '>', 5)]},
+    {'name': 'round_amounts', 'conditions': [('out_degree', '>=', 5), ('round_ratio', '>=', 0.8)]},
+    {'name': 'pass_through', 'conditions': [('value_in', '>', 0), ('hold_time', '<=', 3600), ('concentration', '>=', 0.9)]},
+    {'name': 'peel_chain', 'conditions': [('peel_chain', '>', 0)]},
+]
+
+ROUND_UNITS = 100  # Whole coins; outgoing amounts that are a multiple of 100 XRP (or ETH) count as round
+DEFAULT_DECIMALS = 6  # Amounts are XRP drops unless the caller passes its backend's decimals
+PEEL_SHARE = 0.8  # Share of outgoing value sent onward for a two-output hop to count as a peel
+
+OPERATORS = {'>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le, '==': operator.eq}
+
+
+def load_rules(path):
+    with open(path) as f:
+        rules = json.load(f)
+    for rule in rules:
+        rule['conditions'] = [tuple(condition) for condition in rule['conditions']]
+    return rules
+
+
+def _group_min(codes, values, n):
+    out = np.full(n, np.inf)
+    np.minimum.at(out, codes, values)
+    out[np.isinf(out)] = np.nan
+    return out
+
+
+def _group_max(codes, values, n):
+    out = np.full(n, -np.inf)
+    np.maximum.at(out, codes, values)
+    out[np.isinf(out)] = np.nan
+    return out
+
+
+def compute_features(batch, decimals=DEFAULT_DECIMALS):
+    """Per-account features for every address in the batch, computed in one vectorised pass.
+
+    Amounts are in base units, 10 ** decimals per coin. Degree, fan and timing features count
+    every transfer; value features (value_in/out, concentration, round_ratio, peels) count
+    native-coin transfers only, since token amounts are in other units. Round amounts are
+    checked on the batch's own amounts, so an exact batch (from_records(exact=True)) keeps
+    wei divisibility exact. Returns a dict of equal-length arrays keyed by feature name, plus
+    'accounts'.
+    """
+    m = len(batch)
+    addresses = np.array([a or '' for a in batch.sources] + [a or '' for a in batch.destinations], dtype=str)
+    accounts, codes = np.unique(addresses, return_inverse=True)
+    n = len(accounts)
+    src, dst = codes[:m], codes[m:]
+    raw = batch.amounts
+    native = np.array([asset is None and amount == amount for asset, amount in zip(batch.assets, raw)], dtype=bool)  # amount == amount drops NaN
+    amounts = np.zeros(m)
+    amounts[native] = raw[native].astype(np.float64)
+    times = batch.timestamps
+
+    in_degree = np.bincount(dst, minlength=n)
+    out_degree = np.bincount(src, minlength=n)
+    value_in = np.bincount(dst, weights=amounts, minlength=n)
+    value_out = np.bincount(src, weights=amounts, minlength=n)
+
+    # Distinct counterparties and per-pair totals (transfers without a Destination are skipped)
+    has_dst = accounts[dst] != ''
+    pairs, pair_index = np.unique(src[has_dst].astype(np.int64) * n + dst[has_dst], return_inverse=True)
+    pair_src, pair_dst = pairs // n, pairs % n
+    pair_value = np.bincount(pair_index, weights=amounts[has_dst], minlength=len(pairs))
+    fan_out = np.bincount(pair_src, minlength=n)
+    fan_in = np.bincount(pair_dst, minlength=n)
+
+    # Value concentration: share of outgoing value sent to the single largest counterparty
+    top_value = np.nan_to_num(_group_max(pair_src, pair_value, n), nan=0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        concentration = np.where(value_out > 0, top_value / value_out, 0.0)
+        round_out = np.zeros(m, dtype=bool)
+        round_out[native] = ((raw[native] > 0) & (raw[native] % (ROUND_UNITS * 10 ** decimals) == 0)).astype(bool)
+        native_out = np.bincount(src[native], minlength=n)
+        round_ratio = np.where(native_out > 0, np.bincount(src, weights=round_out, minlength=n) / native_out, 0.0)
+
+    # Velocity: transfers per hour over the account's active span; hold time: first in to first out
+    timed = ~np.isnan(times)
+    all_codes = np.concatenate([src[timed], dst[timed]])
+    all_times = np.concatenate([times[timed], times[timed]])
+    span = _group_max(all_codes, all_times, n) - _group_min(all_codes, all_times, n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        velocity = np.where(span > 0, (in_degree + out_degree) / (span / 3600), np.nan)
+    hold_time = _group_min(src[timed], times[timed], n) - _group_min(dst[timed], times[timed], n)
+
+    # Peel hop: funded account that splits into exactly two outputs, sending most value onward.
+    # A peel chain is a peel hop whose main output is itself a peel hop.
+    peel_hop = (fan_in >= 1) & (fan_out == 2) & (concentration >= PEEL_SHARE)
+    order = np.lexsort((pair_value, pair_src))
+    last_of_group = np.r_[pair_src[order][1:] != pair_src[order][:-1], True]
+    main_next = np.full(n, -1)
+    main_next[pair_src[order][last_of_group]] = pair_dst[order][last_of_group]
+    peel_chain = peel_hop & (main_next >= 0) & peel_hop[np.maximum(main_next, 0)]
+
+    return {
+        'accounts': accounts,
+        'in_degree': in_degree, 'out_degree': out_degree,
+        'fan_in': fan_in, 'fan_out': fan_out,
+        'value_in': value_in, 'value_out': value_out,
+        'concentration': concentration, 'round_ratio': round_ratio,
+        'velocity': velocity, 'hold_time': hold_time,
+        'peel_hop': peel_hop.astype(np.int8), 'peel_chain': peel_chain.astype(np.int8),
+    }
+
+
+def apply_rules(features, rules=DEFAULT_RULES, accounts=None):
+    """Evaluate rules over the feature table; returns a list of finding dicts.
+
+    accounts restricts the findings to those addresses.
+    """
+    all_accounts = features['accounts']
+    if accounts is not None:
+        selected = np.isin(all_accounts, list(accounts))
+    else:
+        selected = np.ones(len(all_accounts), dtype=bool)
+    selected &= all_accounts != ''  # Placeholder for transfers without a Destination
+    findings = []
+    for rule in rules:
+        mask = selected.copy()
+        for feature, op, threshold in rule['conditions']:
+            with np.errstate(invalid='ignore'):
+                mask &= OPERATORS[op](features[feature], threshold)
+        for i in np.flatnonzero(mask):
+            findings.append({
+                'account': str(all_accounts[i]),
+                'rule': rule['name'],
+                'features': {feature: features[feature][i].item() for feature, _, _ in rule['conditions']},
+            })
+    return findings
+
+
+def run_heuristics(transfers, rules=DEFAULT_RULES, accounts=None, decimals=DEFAULT_DECIMALS):
+    batch = transfers if isinstance(transfers, TransferBatch) else TransferBatch.from_records(transfers, exact=True)
+    if not len(batch):
+        return None, []
+    features = compute_features(batch, decimals)
+    return features, apply_rules(features, rules, accounts)
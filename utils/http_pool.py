@@ -0,0 +1,54 @@
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+import urllib3
+from urllib3.util import make_headers
+
+# HTTP transport for api_utils: pooled keep-alive sessions whose connections time their own
+# setup. Kept apart so requests and urllib3 are only imported once a request is made.
+
+# gzip/deflate always; br is added when the optional brotli package is installed
+ACCEPT_ENCODING = make_headers(accept_encoding=True)['accept-encoding']
+
+timing = threading.local()  # Connect time of the request in flight on this thread
+
+
+class _TimedHTTPConnection(urllib3.connection.HTTPConnection):
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        timing.connect += time.perf_counter() - start
+
+
+class _TimedHTTPSConnection(urllib3.connection.HTTPSConnection):
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        timing.connect += time.perf_counter() - start
+
+
+class _TimedHTTPConnectionPool(urllib3.HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """Pooled keep-alive adapter whose connections report their TCP+TLS setup time."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _TimedHTTPConnectionPool,
+                                                   'https': _TimedHTTPSConnectionPool}
+
+
+def new_session(pool_size):
+    session = requests.Session()
+    adapter = TimedHTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'Accept-Encoding': ACCEPT_ENCODING, 'Connection': 'keep-alive'})
+    return session
@@ -0,0 +1,121 @@
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from utils.session import TraceSession
+
+# Traces run concurrently per process (each also fetches with its own worker threads)
+DEFAULT_JOB_WORKERS = 2
+# Finished jobs kept for reuse by an identical request, oldest dropped first
+MAX_CACHED_JOBS = 32
+
+ACTIVE = ('queued', 'running')
+
+
+class TraceJob:
+    """One trace running in the background. Its TraceSession doubles as the progress feed;
+    result holds whatever the job function returned once status is 'done'."""
+
+    def __init__(self, key, description='', owner=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.description = description
+        self.owner = owner
+        self.session = TraceSession()
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self.future = None
+
+    @property
+    def done(self):
+        return self.status not in ACTIVE
+
+    def progress(self):
+        summary = self.session.summary()
+        return {'status': self.status, 'visited': summary['visited'], 'frontier': summary.get('frontier', 0),
+                'requests': summary['pages_fetched'], 'accounts_fetched': summary['accounts_fetched'],
+                'transfers': summary['transfers_kept'], 'alerts': summary['alerts'],
+                'elapsed': (self.finished_at or time.time()) - self.submitted_at}
+
+    def cancel(self):
+        # A queued job never starts; a running one stops at its next account
+        self.session.cancel()
+        if self.future is not None and self.future.cancel():
+            self.status = 'cancelled'
+            self.finished_at = time.time()
+
+
+class JobQueue:
+    """Worker pool for traces shared by every user of one process.
+
+    submit() dedupes on key: a request matching a queued, running or finished job gets that job
+    back (and its cached result) instead of a new trace. Failed and cancelled jobs are retried.
+    """
+
+    def __init__(self, workers=DEFAULT_JOB_WORKERS, max_cached=MAX_CACHED_JOBS):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='trace-job')
+        self.max_cached = max_cached
+        self.jobs = OrderedDict()  # Job id -> job, oldest first
+        self.by_key = {}
+        self.lock = threading.Lock()
+
+    def submit(self, key, fn, description='', owner=None):
+        """Run fn(session) in the background under key; returns the new or matching TraceJob."""
+        with self.lock:
+            job = self.by_key.get(key)
+            if job is not None and job.status not in ('failed', 'cancelled'):
+                self.jobs.move_to_end(job.id)
+                return job
+            job = TraceJob(key, description, owner)
+            self.jobs[job.id] = job
+            self.by_key[key] = job
+            job.future = self.executor.submit(self._run, job, fn)
+            self._evict()
+        return job
+
+    def _run(self, job, fn):
+        if job.session.cancelled:
+            job.status = 'cancelled'
+            job.finished_at = time.time()
+            return
+        job.status = 'running'
+        try:
+            result = fn(job.session)
+        except Exception as e:
+            job.error = f"{e.__class__.__name__}: {e}"
+            job.status = 'failed'
+        else:
+            if job.session.cancelled:
+                job.status = 'cancelled'  # A partial trace is never served as a cached result
+            else:
+                job.result = result
+                job.status = 'done'
+        job.finished_at = time.time()
+
+    def _evict(self):
+        finished = [job for job in self.jobs.values() if job.done]
+        for job in finished[:max(len(finished) - self.max_cached, 0)]:
+            del self.jobs[job.id]
+            if self.by_key.get(job.key) is job:
+                del self.by_key[job.key]
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+    def shutdown(self, wait=True):
+        with self.lock:
+            for job in self.jobs.values():
+                if not job.done:
+                    job.cancel()
+        self.executor.shutdown(wait=wait)
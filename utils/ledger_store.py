@@ -0,0 +1,250 @@
+import os
+import csv
+import gzip
+import json
+import time
+import sqlite3
+import calendar
+import argparse
+import threading
+from datetime import datetime, timezone
+from itertools import islice
+from utils.records import Transfer
+from utils.backends import LedgerBackend
+
+# Local, indexed store of ledger transfers imported from bulk history exports, so traces can
+# run as indexed SQLite lookups with no network at all
+LEDGER_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data/ledger.db')
+
+IMPORT_CHUNK = 50_000  # Rows per executemany batch
+PAGE_SIZE = 10_000  # Transfers per fetch_page; one local query, so pages can be large
+RIPPLE_EPOCH = 946684800  # rippled dates count seconds from 2000-01-01 UTC
+TRANSFER_FIELDS = ('hash', 'ledger_index', 'account', 'destination', 'amount', 'timestamp', 'asset')
+
+# asset is '' for the native coin so the unique index also dedupes native transfers (SQLite
+# treats NULLs as distinct). Amounts too large for SQLite's 64-bit integers (wei) are stored as text.
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS transfers (hash TEXT, ledger_index INTEGER, account TEXT NOT NULL, '
+    "destination TEXT NOT NULL, amount, timestamp REAL, asset TEXT NOT NULL DEFAULT '')",
+    'CREATE UNIQUE INDEX IF NOT EXISTS transfers_unique ON transfers (hash, account, destination, asset, amount)',
+]
+# Lookup indexes; built after the rows on a first bulk import, which is much faster than
+# maintaining them row by row
+INDEXES = [
+    'CREATE INDEX IF NOT EXISTS transfers_account ON transfers (account, timestamp)',
+    'CREATE INDEX IF NOT EXISTS transfers_destination ON transfers (destination, timestamp)',
+    'CREATE INDEX IF NOT EXISTS transfers_time ON transfers (timestamp)',
+    'CREATE INDEX IF NOT EXISTS transfers_ledger ON transfers (ledger_index)',
+]
+
+_local = threading.local()
+
+
+def connect_store(path=None, create=False):
+    conn = sqlite3.connect(path or LEDGER_PATH, timeout=30)
+    if create:
+        conn.execute('PRAGMA journal_mode=WAL')
+        for statement in SCHEMA:
+            conn.execute(statement)
+    return conn
+
+
+def shared_store(path=None):
+    # One read connection per tracer thread and store path
+    path = path or LEDGER_PATH
+    conns = getattr(_local, 'conns', None)
+    if conns is None:
+        conns = _local.conns = {}
+    if path not in conns:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No ledger store at {path}; import an export first")
+        conns[path] = sqlite3.connect(path, timeout=30)
+    return conns[path]
+
+
+def _stored_amount(amount):
+    return str(amount) if isinstance(amount, int) and not -2 ** 63 <= amount < 2 ** 63 else amount
+
+
+def _timestamp(date, epoch=0):
+    # ISO-8601 strings (XRPSCAN) or seconds since epoch, as numbers or numeric strings
+    if date is None or date == '':
+        return None
+    try:
+        return float(date) + epoch
+    except ValueError:
+        return datetime.fromisoformat(date.replace('Z', '+00:00')).timestamp()
+
+
+def row_from_record(record):
+    """Map one exported transaction (XRPSCAN or rippled JSON, an Etherscan row, or a flat
+    account/destination/amount record) to a store row; None for anything that moves no value."""
+    if 'Account' in record:
+        amount, asset = record.get('Amount'), None
+        if isinstance(amount, dict):
+            # Issued currency: the value is in the token's own units, named currency.issuer
+            asset = f"{amount.get('currency')}.{amount.get('issuer')}"
+            amount = amount.get('value')
+        transfer = Transfer(record['Account'], record.get('Destination'), float(amount) if amount is not None else None,
+                            _timestamp(record.get('date'), RIPPLE_EPOCH), record.get('hash'), asset)  # rippled dates are numeric
+        ledger_index = record.get('ledger_index')
+    elif 'from' in record:
+        transfer = Transfer.from_etherscan(record)
+        ledger_index = record.get('blockNumber')
+    else:
+        amount = record.get('amount')
+        if isinstance(amount, str) and amount:
+            amount = int(amount) if amount.lstrip('-').isdigit() else float(amount)
+        transfer = Transfer(record.get('account'), record.get('destination'), amount if amount != '' else None,
+                            _timestamp(record.get('timestamp')), record.get('hash') or None, record.get('asset') or None)
+        ledger_index = record.get('ledger_index')
+    if not transfer.account or not transfer.destination or transfer.amount is None:
+        return None
+    return (transfer.hash, int(ledger_index) if ledger_index not in (None, '') else None, transfer.account, transfer.destination,
+            _stored_amount(transfer.amount), transfer.timestamp, transfer.asset or '')
+
+
+def iter_export_records(path):
+    # Stream records from JSONL / NDJSON (one transaction per line), a JSON array, or CSV with a
+    # header; .gz files are decompressed on the fly
+    name = path[:-3] if path.endswith('.gz') else path
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', newline='', encoding='utf-8') as f:
+        if name.endswith('.csv'):
+            yield from csv.DictReader(f)
+        elif name.endswith('.json'):
+            data = json.load(f)
+            yield from (data.get('transactions', []) if isinstance(data, dict) else data)
+        else:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record.get('tx', record) if isinstance(record.get('tx'), dict) else record
+
+
+def import_export(paths, path=None, chunk_size=IMPORT_CHUNK):
+    """Stream export files into the store in one transaction; returns (rows seen, rows added, seconds).
+
+    Rows already in the store (same hash, parties, asset and amount) are skipped, so
+    overlapping exports can be re-imported safely.
+    """
+    started = time.perf_counter()
+    conn = connect_store(path, create=True)
+    seen = 0
+    try:
+        conn.execute('PRAGMA synchronous=NORMAL')
+        before = conn.execute('SELECT COUNT(*) FROM transfers').fetchone()[0]
+        with conn:  # Single transaction: commits once at the end, rolls back on error
+            for export in paths:
+                rows = (row for row in map(row_from_record, iter_export_records(export)) if row is not None)
+                while True:
+                    chunk = list(islice(rows, chunk_size))
+                    if not chunk:
+                        break
+                    conn.executemany(f"INSERT OR IGNORE INTO transfers ({', '.join(TRANSFER_FIELDS)}) VALUES (?, ?, ?, ?, ?, ?, ?)", chunk)
+                    seen += len(chunk)
+        with conn:
+            for statement in INDEXES:
+                conn.execute(statement)
+            conn.execute('ANALYZE')
+        added = conn.execute('SELECT COUNT(*) FROM transfers').fetchone()[0] - before
+    finally:
+        conn.close()
+    return seen, added, time.perf_counter() - started
+
+
+def store_stats(path=None):
+    conn = connect_store(path)
+    try:
+        rows, accounts, first, last = conn.execute('SELECT COUNT(*), COUNT(DISTINCT account), MIN(timestamp), MAX(timestamp) FROM transfers').fetchone()
+    finally:
+        conn.close()
+    return {'transfers': rows, 'senders': accounts, 'first': first, 'last': last}
+
+
+def _after(cursor):
+    # Keyset condition for the rows after cursor = (timestamp, rowid) in (timestamp DESC, rowid
+    # DESC) order, where NULL timestamps sort last
+    if cursor is None:
+        return '1', ()
+    timestamp, rowid = cursor
+    if timestamp is None:
+        return 'timestamp IS NULL AND rowid < ?', (rowid,)
+    return '(timestamp < ? OR (timestamp = ? AND rowid < ?) OR timestamp IS NULL)', (timestamp, timestamp, rowid)
+
+
+def _to_transfer(row):
+    hash, account, destination, amount, timestamp, asset = row
+    if isinstance(amount, str):
+        amount = int(amount)
+    return Transfer(account, destination, amount, timestamp, hash, asset or None)
+
+
+# The store as a tracer backend: an account's history is every transfer it sent or received in
+# the window, newest first like the live APIs, read through the (account, timestamp) and
+# (destination, timestamp) indexes
+class LedgerStoreBackend(LedgerBackend):
+    name = 'ledger-store'
+
+    def __init__(self, path=None, unit='XRP', decimals=6, known_exchanges=None, page_size=PAGE_SIZE):
+        self.path = path or LEDGER_PATH
+        self.unit = unit
+        self.decimals = decimals
+        self.known_exchanges = known_exchanges or {}
+        self.page_size = page_size
+        shared_store(self.path)  # Fail fast on a missing store
+
+    def window(self, start_datetime, end_datetime, session=None):
+        # Naive datetimes are UTC; unbounded ends become +/- infinity for the range query
+        start = -float('inf') if start_datetime is None else calendar.timegm(start_datetime.utctimetuple())
+        end = float('inf') if end_datetime is None else calendar.timegm(end_datetime.utctimetuple())
+        return start, end
+
+    def reaches_genesis(self, window):
+        return window[0] == -float('inf')
+
+    def fetch_page(self, account, window, cursor=None):
+        # cursor is the (timestamp, rowid) of the previous page's last row, so each page is an
+        # index seek rather than a re-scan of every row before it
+        start, end = window
+        bounded = start != -float('inf') or end != float('inf')
+        condition = 'timestamp BETWEEN ? AND ?' if bounded else '1'
+        bounds = (start, end) if bounded else ()
+        after, position = _after(cursor)
+        rows = shared_store(self.path).execute(
+            f"SELECT hash, account, destination, amount, timestamp, asset, rowid FROM transfers WHERE account = ? AND {condition} AND {after} "
+            f"UNION ALL SELECT hash, account, destination, amount, timestamp, asset, rowid FROM transfers "
+            f"WHERE destination = ? AND account != ? AND {condition} AND {after} "
+            f"ORDER BY timestamp DESC, rowid DESC LIMIT ?",
+            (account, *bounds, *position, account, account, *bounds, *position, self.page_size + 1)).fetchall()
+        page = rows[:self.page_size]
+        next_cursor = (page[-1][4], page[-1][6]) if len(rows) > self.page_size else None
+        return [_to_transfer(row[:6]) for row in page], next_cursor
+
+    def get_transaction(self, tx_hash):
+        # The stored transfer in XRPSCAN's shape, so --tx_id traces work offline too
+        row = shared_store(self.path).execute('SELECT hash, account, destination, amount, timestamp, asset FROM transfers '
+                                              'WHERE hash = ? LIMIT 1', (tx_hash,)).fetchone()
+        if row is None:
+            raise KeyError(f"Transaction {tx_hash} is not in the ledger store {self.path}")
+        transfer = _to_transfer(row)
+        date = datetime.fromtimestamp(transfer.timestamp, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z') if transfer.timestamp is not None else None
+        return {'hash': transfer.hash, 'Account': transfer.account, 'Destination': transfer.destination,
+                'Amount': str(transfer.amount), 'date': date}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import bulk ledger exports into the local ledger store.")
+    parser.add_argument("action", choices=["import", "stats"])
+    parser.add_argument("paths", nargs="*", help="Export files: JSONL/NDJSON, JSON array, or CSV (optionally .gz)")
+    parser.add_argument("--db", default=LEDGER_PATH, help="Ledger store path")
+    parser.add_argument("--chunk", type=int, default=IMPORT_CHUNK, help="Rows per batch")
+    args = parser.parse_args()
+
+    if args.action == "import":
+        if not args.paths:
+            parser.error("import needs at least one export file")
+        seen, added, seconds = import_export(args.paths, args.db, args.chunk)
+        print(f"Imported {added} new transfers ({seen} read) in {seconds:.2f}s ({seen / max(seconds, 1e-9):,.0f} rows/s)")
+    else:
+        print(store_stats(args.db))
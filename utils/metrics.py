@@ -0,0 +1,177 @@
+import io
+import json
+import time
+import pstats
+import cProfile
+import resource
+import threading
+import functools
+import tracemalloc
+from contextlib import contextmanager
+from utils import api_utils, cache_utils
+
+# Process-wide instrumentation: per-stage timers and event counters, exported together with the
+# HTTP pacing stats (requests, retries, 429s, bytes) and cache stats as JSON or Prometheus text.
+# Stage timers are inclusive: a trace streaming into build_graph counts its fetches under both.
+
+PROMETHEUS_PREFIX = 'xrp_tracker'
+
+_stages = {}
+_counters = {}
+_lock = threading.Lock()
+
+
+def count(name, n=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def record_stage(name, seconds):
+    with _lock:
+        stage = _stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'peak_bytes': 0})
+        stage['calls'] += 1
+        stage['seconds'] += seconds
+        stage['max_seconds'] = max(stage['max_seconds'], seconds)
+        if tracemalloc.is_tracing():
+            # High-water mark of traced memory as of this stage's end (only while profiling)
+            stage['peak_bytes'] = max(stage['peak_bytes'], tracemalloc.get_traced_memory()[1])
+
+
+@contextmanager
+def stage(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+# Decorator form of stage() for whole functions
+def timed(name):
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def max_rss_bytes():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # Linux reports KiB
+
+
+def snapshot():
+    with _lock:
+        stages = {name: dict(stage) for name, stage in _stages.items()}
+        counters = dict(_counters)
+    memory = {'max_rss_bytes': max_rss_bytes()}
+    if tracemalloc.is_tracing():
+        memory['traced_bytes'], memory['traced_peak_bytes'] = tracemalloc.get_traced_memory()
+    return {'stages': stages, 'counters': counters, 'http': api_utils.pacing_stats(),
+            'cache': cache_utils.cache_stats(), 'memory': memory}
+
+
+def to_json(indent=2):
+    return json.dumps(snapshot(), indent=indent)
+
+
+def _metric(lines, name, kind, help_text, samples):
+    lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}")
+    lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} {kind}")
+    for labels, value in samples:
+        label_text = ','.join(f'{key}="{label}"' for key, label in labels.items())
+        lines.append(f"{PROMETHEUS_PREFIX}_{name}{{{label_text}}} {value}" if label_text else f"{PROMETHEUS_PREFIX}_{name} {value}")
+
+
+def to_prometheus():
+    """Render snapshot() in the Prometheus text exposition format."""
+    snap = snapshot()
+    stages, http = snap['stages'], snap['http']
+    lines = []
+    _metric(lines, 'stage_calls_total', 'counter', 'Calls per instrumented stage.',
+            [({'stage': name}, stage['calls']) for name, stage in stages.items()])
+    _metric(lines, 'stage_seconds_total', 'counter', 'Wall-clock seconds spent per stage.',
+            [({'stage': name}, round(stage['seconds'], 6)) for name, stage in stages.items()])
+    _metric(lines, 'stage_max_seconds', 'gauge', 'Slowest single call per stage.',
+            [({'stage': name}, round(stage['max_seconds'], 6)) for name, stage in stages.items()])
+    _metric(lines, 'events_total', 'counter', 'Tracer event counters.',
+            [({'event': name}, value) for name, value in snap['counters'].items()])
+    for field, help_text in (('requests', 'HTTP requests sent.'), ('retries', 'HTTP requests retried.'),
+                             ('rate_limited', 'HTTP 429 responses.'), ('errors', 'Requests that exhausted their retries.'),
+                             ('bytes', 'Response bytes downloaded.')):
+        _metric(lines, f'http_{field}_total', 'counter', help_text, [({'host': host}, stats[field]) for host, stats in http.items()])
+    _metric(lines, 'cache_total', 'counter', 'API cache hits, misses, writes and evictions.',
+            [({'result': name}, value) for name, value in snap['cache'].items()])
+    _metric(lines, 'memory_bytes', 'gauge', 'Process max RSS and, while profiling, traced Python memory.',
+            [({'kind': name}, value) for name, value in snap['memory'].items()])
+    return '\n'.join(lines) + '\n'
+
+
+def write_metrics(path):
+    # .prom / .txt files get the Prometheus format, anything else JSON
+    with open(path, 'w') as f:
+        f.write(to_prometheus() if path.endswith(('.prom', '.txt')) else to_json())
+
+
+def reset_metrics():
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+
+
+def serve_metrics(port, host='127.0.0.1'):
+    """Serve /metrics (Prometheus) and /metrics.json from a daemon thread; returns the server."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # Only needed with --metrics_port
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics':
+                body, content_type = to_prometheus(), 'text/plain; version=0.0.4'
+            elif self.path == '/metrics.json':
+                body, content_type = to_json(), 'application/json'
+            else:
+                self.send_error(404)
+                return
+            payload = body.encode()
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# cProfile and tracemalloc around a block: writes pstats to path (if given) and prints the
+# top functions by cumulative time and the top allocation sites
+@contextmanager
+def profiled(path=None, top=25):
+    profiler = cProfile.Profile()
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        allocations = tracemalloc.take_snapshot().statistics('lineno')[:10]
+        _, peak = tracemalloc.get_traced_memory()
+        if started_tracing:
+            tracemalloc.stop()
+        if path:
+            profiler.dump_stats(path)
+            print(f"Profile saved as {path} (view with: python -m pstats {path})")
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(top)
+        print(out.getvalue())
+        print(f"Peak traced memory: {peak / 1024 / 1024:.1f} MiB; top allocation sites:")
+        for stat in allocations:
+            print(f"  {stat}")
@@ -0,0 +1,98 @@
+import sys
+from datetime import datetime
+import numpy as np
+
+
+class Transfer:
+    """Compact record of the fields the tracer reads from an XRPSCAN or Etherscan transaction.
+
+    Addresses are interned so each account string is stored once however many transfers
+    reference it. amount is the raw value (drops for XRP, integer wei or token base units for
+    Ethereum) or None when absent. asset is None for the chain's native coin, otherwise the
+    token contract address. destination_tag is the XRPL DestinationTag (an exchange's customer
+    deposit reference), when present.
+    """
+    __slots__ = ('hash', 'account', 'destination', 'amount', 'timestamp', 'asset', 'destination_tag')
+
+    def __init__(self, account, destination, amount=None, timestamp=None, hash=None, asset=None, destination_tag=None):
+        self.account = sys.intern(account) if account else account
+        self.destination = sys.intern(destination) if destination else destination
+        self.amount = amount
+        self.timestamp = timestamp
+        self.hash = hash
+        self.asset = sys.intern(asset) if asset else asset
+        self.destination_tag = destination_tag
+
+    @classmethod
+    def from_xrpscan(cls, txn):
+        amount = txn.get('Amount')
+        if isinstance(amount, dict):
+            amount = amount.get('value')
+        date = txn.get('date')
+        return cls(txn.get('Account'), txn.get('Destination'),
+                   float(amount) if amount is not None else None,
+                   parse_timestamp(date) if date else None,
+                   txn.get('hash'), destination_tag=txn.get('DestinationTag'))
+
+    @classmethod
+    def from_etherscan(cls, row):
+        # txlist, txlistinternal and tokentx rows share from/to/value/timeStamp/hash; token
+        # rows also carry the contract. Addresses are lowercased as Etherscan returns them.
+        asset = row['contractAddress'].lower() if 'tokenDecimal' in row else None
+        return cls(row.get('from', '').lower() or None, row.get('to', '').lower() or None,
+                   int(row['value']) if row.get('value') not in (None, '') else None,
+                   float(row['timeStamp']) if row.get('timeStamp') else None,
+                   row.get('hash'), asset)
+
+    def __repr__(self):
+        return f"Transfer({self.account!r} -> {self.destination!r}, amount={self.amount!r}, hash={self.hash!r})"
+
+    def __eq__(self, other):
+        if not isinstance(other, Transfer):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+
+def parse_timestamp(date):
+    # XRPSCAN dates are ISO-8601 UTC with a trailing Z
+    return datetime.fromisoformat(date.replace('Z', '+00:00')).timestamp()
+
+
+def format_amount(amount):
+    # Print drops as integers and IOU values without float noise
+    return f"{amount:.15g}"
+
+
+def format_units(amount, decimals=18):
+    # Exact decimal string of an integer amount in base units (wei for ETH), no float rounding
+    sign = '-' if amount < 0 else ''
+    whole, fraction = divmod(abs(amount), 10 ** decimals)
+    fraction = f"{fraction:0{decimals}d}".rstrip('0') if decimals else ''
+    return f"{sign}{whole:,}.{fraction}" if fraction else f"{sign}{whole:,}"
+
+
+class TransferBatch:
+    """Columnar view of a run of Transfers for vectorised arithmetic."""
+
+    def __init__(self, sources, destinations, amounts, timestamps, assets=None):
+        self.sources = sources
+        self.destinations = destinations
+        self.amounts = amounts
+        self.timestamps = timestamps
+        self.assets = [None] * len(sources) if assets is None else assets  # None for the native coin
+
+    @classmethod
+    def from_records(cls, records, exact=False):
+        # exact keeps integer base units (wei runs past float64's 2**53) as Python ints in an
+        # object array, so sums stay exact; otherwise amounts are float64
+        records = list(records)
+        amounts = [np.nan if r.amount is None else r.amount for r in records]
+        exact = exact and any(isinstance(amount, int) for amount in amounts)
+        return cls([r.account for r in records],
+                   [r.destination for r in records],
+                   np.array(amounts, dtype=object if exact else np.float64),
+                   np.array([np.nan if r.timestamp is None else r.timestamp for r in records], dtype=np.float64),
+                   [r.asset for r in records])
+
+    def __len__(self):
+        return len(self.sources)
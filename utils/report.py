@@ -0,0 +1,276 @@
+import io
+import html
+import base64
+import textwrap
+from collections import Counter
+from datetime import datetime, timezone
+from itertools import islice
+from utils import metrics
+from utils.graph import edge_label
+
+# Trace reports as PDF or HTML. A report is a stream of sections (summary, graph, alerts, a
+# table of flows between accounts and optionally of individual transfers) produced by
+# report_sections() and laid out by one writer per format. Writers lay out rows as they arrive
+# and start new pages as needed, so a report over tens of thousands of transfers and alerts is
+# built in one pass without holding its tables in memory. The graph image is passed in as bytes
+# already rendered by visualize_graph. reportlab is imported only when a PDF is written.
+
+REPORT_FORMATS = ('pdf', 'html')
+TOP_RECEIVERS = 10  # Accounts listed in the summary by value received
+MARGIN = 50
+FONT, BOLD, FONT_SIZE = 'Courier', 'Courier-Bold', 7  # Fixed width: text is wrapped and truncated by character count
+CHAR_WIDTH = 0.6 * FONT_SIZE  # Points per Courier character
+HEADING_FONT = 'Helvetica-Bold'
+LINE_HEIGHT = 11
+FLOW_COLUMNS = (('From', 0.25), ('To', 0.25), ('Amount', 0.3), ('Flags', 0.2))
+TRANSFER_COLUMNS = (('Time (UTC)', 0.17), ('From', 0.2), ('To', 0.2), ('Amount', 0.2), ('Hash', 0.23))
+
+
+def report_format(target, fmt=None):
+    # fmt, else html for .html/.htm file names, else pdf
+    if fmt is None:
+        fmt = 'html' if isinstance(target, str) and target.lower().endswith(('.html', '.htm')) else 'pdf'
+    if fmt not in REPORT_FORMATS:
+        raise ValueError(f"Unknown report format {fmt!r}; expected one of {', '.join(REPORT_FORMATS)}")
+    return fmt
+
+
+def node_flags(G, node):
+    attrs = G.nodes[node]
+    flags = [attrs['tag_label']] if attrs.get('tag_label') else []
+    if attrs.get('is_exchange'):
+        backend = G.graph.get('ledger')
+        flags.append(f"exchange {backend.known_exchanges.get(node, '')}".rstrip() if backend else 'exchange')
+    if attrs.get('is_mixer'):
+        flags.append('suspected mixer')
+    if attrs.get('taint'):
+        flags.append(f"{attrs['taint']:.0%} tainted")
+    return ', '.join(flags)
+
+
+def summarize(G, alerts):
+    """Headline figures for a trace: (label, value) pairs."""
+    backend = G.graph.get('ledger')
+    received = sorted(((weight, node) for node, weight in G.in_degree(weight='weight') if weight), reverse=True)
+    kinds = Counter(alert.split(':', 1)[0] for alert in alerts)
+    summary = [
+        ('Generated', datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M UTC')),
+        ('Accounts', f"{G.number_of_nodes():,}"),
+        ('Flows between accounts', f"{G.number_of_edges():,}"),
+        ('Value across all flows', f"{sum(weight for _, _, weight in G.edges(data='weight')):,.6f} {backend.unit if backend else 'XRP'}"),
+        ('Exchanges reached', f"{sum(1 for _, exchange in G.nodes(data='is_exchange') if exchange):,}"),
+        ('Suspected mixers', f"{sum(1 for _, mixer in G.nodes(data='is_mixer') if mixer):,}"),
+        ('Tagged addresses', f"{sum(1 for _, tagged in G.nodes(data='is_tagged') if tagged):,}"),
+        ('Alerts', ', '.join(f"{count:,} {kind}" for kind, count in kinds.most_common()) or 'none'),
+    ]
+    if 'taint_model' in G.graph:
+        summary.append(('Taint model', G.graph['taint_model']))
+    summary.extend((f"Top receiver {i}", f"{node} ({weight:,.6f}) {node_flags(G, node)}".rstrip())
+                   for i, (weight, node) in enumerate(received[:TOP_RECEIVERS], 1))
+    return summary
+
+
+def flow_rows(G):
+    # One row per graph edge, largest native value first
+    for source, destination, _ in sorted(G.edges(data='weight'), key=lambda edge: edge[2], reverse=True):
+        yield source, destination, edge_label(G, (source, destination)).replace('\n', ', '), node_flags(G, destination)
+
+
+def transfer_rows(G, transfers):
+    # Transfers along the graph's edges, each once (a transfer can be fetched from both ends)
+    backend = G.graph.get('ledger')
+    seen = set()
+    for txn in transfers:
+        if txn.destination is None or txn.amount is None or not G.has_edge(txn.account, txn.destination):
+            continue
+        key = (txn.hash, txn.account, txn.destination, txn.asset, txn.amount)
+        if txn.hash is not None:
+            if key in seen:
+                continue
+            seen.add(key)
+        when = datetime.fromtimestamp(txn.timestamp, timezone.utc).strftime('%Y-%m-%d %H:%M:%S') if txn.timestamp is not None else ''
+        amount = backend.format_value(txn.amount, txn.asset) if backend else f"{txn.amount:,}"
+        yield when, txn.account, txn.destination, amount, txn.hash or ''
+
+
+def report_sections(G, alerts, transfers=None, image=None, max_rows=None):
+    yield 'heading', 'Summary'
+    yield 'pairs', summarize(G, alerts)
+    if image:
+        yield 'heading', 'Transaction Graph'
+        yield 'image', image
+    yield 'heading', f"Alerts ({len(alerts):,})"
+    yield 'lines', alerts if alerts else ['No alerts detected.']
+    yield 'heading', f"Flows ({G.number_of_edges():,})"
+    yield 'table', FLOW_COLUMNS, islice(flow_rows(G), max_rows), max(G.number_of_edges() - max_rows, 0) if max_rows else 0
+    if transfers is not None:
+        yield 'heading', 'Transfers'
+        yield 'table', TRANSFER_COLUMNS, islice(transfer_rows(G, transfers), max_rows), None
+
+
+class PdfReport:
+    """Lays report sections onto letter pages with a reportlab canvas, page by page."""
+
+    def __init__(self, target, title):
+        from reportlab.lib.pagesizes import letter
+        from reportlab.pdfgen import canvas
+        self.canvas = canvas.Canvas(target, pagesize=letter, pageCompression=1)
+        self.canvas.setTitle(title)
+        self.width, self.height = letter
+        self.title = title
+        self.page = 1
+        self.y = self.height - MARGIN
+        self.text(title, HEADING_FONT, 14, 20)
+
+    def footer(self):
+        self.canvas.setFont(FONT, FONT_SIZE)
+        self.canvas.drawRightString(self.width - MARGIN, MARGIN / 2, f"{self.title} - page {self.page}")
+
+    def new_page(self):
+        self.footer()
+        self.canvas.showPage()
+        self.page += 1
+        self.y = self.height - MARGIN
+
+    def room(self, height):
+        if self.y - height < MARGIN:
+            self.new_page()
+
+    def text(self, line, font=FONT, size=FONT_SIZE, leading=LINE_HEIGHT):
+        width = int((self.width - 2 * MARGIN) / (0.6 * size))  # Characters per line at Courier's width
+        for part in textwrap.wrap(line, width, break_on_hyphens=False) or ['']:
+            self.room(leading)
+            self.y -= leading
+            self.canvas.setFont(font, size)
+            self.canvas.drawString(MARGIN, self.y, part)
+
+    def heading(self, text):
+        self.room(3 * LINE_HEIGHT)  # Don't leave a heading alone at the bottom of a page
+        self.y -= LINE_HEIGHT / 2
+        self.text(text, HEADING_FONT, 11, 16)
+
+    def pairs(self, pairs):
+        for label, value in pairs:
+            self.text(f"{label}: {value}")
+
+    def lines(self, lines):
+        for line in lines:
+            self.text(line)
+
+    def image(self, data):
+        if not data.startswith(b'\x89PNG'):
+            self.text('The graph image is not a PNG; see the graph file saved with this report.')
+            return
+        from reportlab.lib.utils import ImageReader
+        reader = ImageReader(io.BytesIO(data))
+        image_width, image_height = reader.getSize()
+        scale = min((self.width - 2 * MARGIN) / image_width, (self.height - 2 * MARGIN) / image_height, 1.0)
+        self.room(image_height * scale)
+        self.y -= image_height * scale
+        self.canvas.drawImage(reader, MARGIN, self.y, width=image_width * scale, height=image_height * scale)
+
+    def table(self, columns, rows, omitted):
+        # Each row is drawn as one fixed-width line, columns padded to their share of the page
+        chars = int((self.width - 2 * MARGIN) / CHAR_WIDTH)
+        widths = [int(share * chars) for _, share in columns]
+
+        def draw(cells, font):
+            self.room(LINE_HEIGHT)
+            self.y -= LINE_HEIGHT
+            self.canvas.setFont(font, FONT_SIZE)
+            self.canvas.drawString(MARGIN, self.y, ''.join(fit(str(cell), width - 1).ljust(width) for cell, width in zip(cells, widths)))
+
+        header = [name for name, _ in columns]
+        draw(header, BOLD)
+        for row in rows:
+            if self.y - LINE_HEIGHT < MARGIN:  # Repeat the header on each new page
+                self.new_page()
+                draw(header, BOLD)
+            draw(row, FONT)
+        if omitted:
+            self.text(f"... {omitted:,} more rows not shown")
+
+    def close(self):
+        self.footer()
+        self.canvas.save()
+
+
+def fit(text, width):
+    # Truncate text to width characters; long addresses and hashes keep their start and end
+    if len(text) <= width:
+        return text
+    if ' ' not in text:
+        keep = (width - 3) // 2
+        return f"{text[:keep]}...{text[-keep:]}"
+    return text[:width - 3] + '...'
+
+
+class HtmlReport:
+    """Writes report sections as one self-contained HTML page, row by row."""
+
+    def __init__(self, target, title):
+        self.owned = isinstance(target, str)
+        raw = open(target, 'wb') if self.owned else target
+        self.out = io.TextIOWrapper(raw, encoding='utf-8', newline='\n')
+        self.out.write(f"<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>{html.escape(title)}</title>\n"
+                       "<style>body{font-family:sans-serif;font-size:13px;margin:2em}table{border-collapse:collapse}"
+                       "td,th{border:1px solid #ccc;padding:2px 6px;font-family:monospace;white-space:nowrap}"
+                       "th{background:#eee;position:sticky;top:0}img,svg{max-width:100%;height:auto}</style>\n"
+                       f"</head><body>\n<h1>{html.escape(title)}</h1>\n")
+
+    def heading(self, text):
+        self.out.write(f"<h2>{html.escape(text)}</h2>\n")
+
+    def pairs(self, pairs):
+        self.out.write('<table>\n')
+        self.out.writelines(f"<tr><th>{html.escape(label)}</th><td>{html.escape(str(value))}</td></tr>\n" for label, value in pairs)
+        self.out.write('</table>\n')
+
+    def lines(self, lines):
+        self.out.write('<ul>\n')
+        self.out.writelines(f"<li>{html.escape(line)}</li>\n" for line in lines)
+        self.out.write('</ul>\n')
+
+    def image(self, data):
+        if data.startswith(b'\x89PNG'):
+            self.out.write(f"<img alt=\"Transaction graph\" src=\"data:image/png;base64,{base64.b64encode(data).decode('ascii')}\">\n")
+        else:  # SVG embeds as is
+            self.out.write(data.decode('utf-8').split('?>', 1)[-1] + '\n')
+
+    def table(self, columns, rows, omitted):
+        self.out.write('<table>\n<tr>' + ''.join(f"<th>{html.escape(name)}</th>" for name, _ in columns) + '</tr>\n')
+        self.out.writelines('<tr>' + ''.join(f"<td>{html.escape(str(cell))}</td>" for cell in row) + '</tr>\n' for row in rows)
+        self.out.write('</table>\n')
+        if omitted:
+            self.out.write(f"<p>... {omitted:,} more rows not shown</p>\n")
+
+    def close(self):
+        self.out.write('</body></html>\n')
+        self.out.flush()
+        if self.owned:
+            self.out.close()
+        else:
+            self.out.detach()  # Leave the caller's buffer open
+
+
+WRITERS = {'pdf': PdfReport, 'html': HtmlReport}
+
+
+@metrics.timed('write_report')
+def write_report(target, G, alerts, title='XRP Transaction Trace Report', transfers=None, image=None, fmt=None, max_rows=None):
+    """Write a trace report to target (a file name or a binary file object) as PDF or HTML.
+
+    transfers, if given, is streamed once into a table of the individual transfers along the
+    graph's edges. image is the graph as rendered by visualize_graph (PNG or SVG bytes or
+    buffer). max_rows caps each table. Returns the format written.
+    """
+    fmt = report_format(target, fmt)
+    if isinstance(image, io.BytesIO):
+        image = image.getvalue()
+    writer = WRITERS[fmt](target, title)
+    try:
+        for kind, *args in report_sections(G, alerts, transfers, image, max_rows):
+            getattr(writer, kind)(*args)
+    finally:
+        writer.close()
+    return fmt
@@ -0,0 +1,61 @@
+import time
+import threading
+
+
+class TraceSession:
+    """All mutable state of one trace: visited accounts, levels, alerts, mixer suspicions,
+    fetched history and statistics.
+
+    Each trace gets its own session, so concurrent traces in one process (e.g. several
+    Streamlit users) never see each other's visited sets. Process-wide caches (API
+    responses, the tag store, pooled HTTP sessions) are shared, so a new session starts warm.
+    """
+
+    def __init__(self, watermarks=None, collect_history=False, max_requests=None, max_seconds=None, cache_only=None, head_page_ttl=None):
+        self.traced = set()
+        self.node_levels = {}
+        self.reached_by = {}  # Account -> the source whose edge first reached it (BFS trace)
+        self.alerts = []
+        self.suspected_mixers = set()
+        self.history = [] if collect_history else None
+        self.complete_histories = set()  # Accounts fetched back to their first transfer, untruncated
+        self.watermarks = watermarks
+        self.rules = None  # Heuristic rules for this trace; None uses the built-in rules
+        self.cache_only = cache_only  # Offline mode for this trace; None follows cache_utils.CACHE_ONLY
+        self.head_page_ttl = head_page_ttl  # Seconds a cached head page stays fresh; None follows cache_utils.HEAD_PAGE_TTL
+        self.stats = {'accounts_fetched': 0, 'pages_fetched': 0, 'pages_used': 0, 'transfers_kept': 0}
+        self.started_at = time.time()
+        self.lock = threading.Lock()
+        # Trace budget: API pages (cached or not) and wall-clock seconds; None is unlimited
+        self.max_requests = max_requests
+        self.max_seconds = max_seconds
+        self.exhausted = False  # Set once a tracer stops with work left because of the budget
+        self.cancelled = False  # Set by cancel(); tracers stop at the next account
+
+    def count(self, name, n=1):
+        # Safe to call from fetch worker threads
+        with self.lock:
+            self.stats[name] = self.stats.get(name, 0) + n
+
+    def gauge(self, name, value):
+        with self.lock:
+            self.stats[name] = value
+
+    def cancel(self):
+        self.cancelled = True
+
+    def summary(self):
+        with self.lock:
+            return dict(self.stats, visited=len(self.traced), alerts=len(self.alerts),
+                        elapsed=time.time() - self.started_at)
+
+    def within_budget(self):
+        # Checked before each account fetch (see tracer.fetch_frontier), so a trace overshoots
+        # by at most the accounts already being fetched, one per worker
+        if self.cancelled:
+            return False
+        with self.lock:
+            over = self.max_requests is not None and self.stats['pages_fetched'] >= self.max_requests
+        over = over or (self.max_seconds is not None and time.time() - self.started_at >= self.max_seconds)
+        self.exhausted = self.exhausted or over
+        return not over
@@ -0,0 +1,322 @@
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from utils.db_utils import TAGS
+from utils.clusters import CLUSTERS
+from utils.heuristics import DEFAULT_RULES, DEFAULT_DECIMALS, run_heuristics
+from utils.session import TraceSession
+from utils.taint import propagate_taint, taint_by_account
+from utils import metrics
+from utils.graph import annotate_taint
+
+# Chain-agnostic tracing core. Every function takes the LedgerBackend to fetch from first;
+# xrp_track and eth_track expose versions bound to their own backend.
+
+# Heuristic rules used when a session has none; HOP_RULES are also checked per account while tracing
+HEURISTIC_RULES = DEFAULT_RULES
+HOP_RULES = ('mixer', 'cluster')
+
+# Max accounts fetched concurrently per frontier level
+DEFAULT_WORKERS = 4
+
+# Value-weighted tracing cutoffs
+MIN_TRACE_AMOUNT = 1.0  # Whole units (XRP, ETH); smaller transfers are dust and are not followed or drawn
+MIN_TAINT_SHARE = 0.01  # Accounts whose traced share of a transfer is below this are not expanded
+
+# Known tags: a cached, read-through view of data/tags.db (nothing is loaded at import)
+KNOWN_TAGS = TAGS
+
+
+# Per-hop heuristics over one account's history, run while tracing so downstream transfers can
+# be screened against fresh mixer suspicions. The full rule set runs once over the whole trace.
+def detect_heuristics(transactions, account, alerts, rules=None, suspected_mixers=None):
+    suspected_mixers = set() if suspected_mixers is None else suspected_mixers
+    rules = [rule for rule in (rules or HEURISTIC_RULES) if rule['name'] in HOP_RULES]
+    _, findings = run_heuristics(transactions, rules, accounts=[account])
+    for finding in findings:
+        if finding['rule'] == 'mixer':
+            suspected_mixers.add(account)
+            alert_msg = f"HEURISTIC ALERT: Account {account} suspected as mixer (high incoming txns: {finding['features']['in_degree']})"
+            print(alert_msg)
+            alerts.append(alert_msg)
+        elif finding['rule'] == 'cluster':
+            print(f"CLUSTER NOTE: Account {account} connects to {finding['features']['fan_out']} destinations - potential cluster")
+    return findings
+
+
+# Whole-trace heuristics: one vectorised pass over every fetched transfer; decimals is the
+# backend's, so round amounts are judged in whole coins on every chain
+def analyze_heuristics(transactions, alerts, rules=None, decimals=DEFAULT_DECIMALS):
+    _, findings = run_heuristics(transactions, rules or HEURISTIC_RULES, decimals=decimals)
+    for finding in findings:
+        if finding['rule'] in HOP_RULES:
+            continue  # Already reported per hop
+        details = ', '.join(f"{name}={value:g}" for name, value in finding['features'].items())
+        alert_msg = f"HEURISTIC ALERT: Account {finding['account']} matches {finding['rule']} ({details})"
+        print(alert_msg)
+        alerts.append(alert_msg)
+    return findings
+
+
+# Whole-trace taint analysis under one of utils.taint's models: how much of the value leaving
+# the roots plausibly reached each account. Known exchanges and tagged addresses that received
+# tainted funds raise an alert; with G, every node also gets its tainted share for colouring.
+def analyze_taint(backend, transactions, roots, alerts, model='haircut', G=None):
+    roots = {backend.normalize(root) for root in roots}
+    result = propagate_taint(transactions, roots, model)
+    tainted = taint_by_account(result)
+    KNOWN_TAGS.get_many(tainted)  # Warm the tag cache in one query
+    for account, (value, share) in sorted(tainted.items(), key=lambda item: -item[1][0]):
+        label = backend.known_exchanges.get(account) or (KNOWN_TAGS.get(account) or {}).get('label')
+        if account in roots or not label or value <= 0:
+            continue
+        alert_msg = (f"TAINT ALERT ({model}): {backend.format_value(int(round(value)))} of traced funds reached {label} "
+                     f"({account}), {share:.0%} of its inflow")
+        print(alert_msg)
+        alerts.append(alert_msg)
+    if G is not None:
+        annotate_taint(G, result)
+    return result
+
+
+# Alert on a single transfer to a tagged address, known exchange or suspected mixer
+def screen_transfer(backend, txn, account, alerts, suspected_mixers=None):
+    suspected_mixers = set() if suspected_mixers is None else suspected_mixers
+    destination = txn.destination
+    tag = KNOWN_TAGS.get(destination, None)
+    if tag:
+        alert_msg = f"TAG ALERT: Transfer to tagged {tag['label']} ({destination}) from {account} - Notes: {tag.get('notes', '')}"
+        print(alert_msg)
+        alerts.append(alert_msg)
+        # Override heuristic if conflict (e.g., tagged as legit but heuristic suspects mixer)
+        if 'type' in tag and tag['type'] != 'mixer' and destination in suspected_mixers:
+            suspected_mixers.remove(destination)
+            alerts.append(f"TAG OVERRIDE: {destination} tagged as {tag['label']}, removing mixer suspicion")
+    if destination in backend.known_exchanges:
+        alert_msg = f"ALERT: Transfer of {backend.format_value(txn.amount, txn.asset)} to known exchange {backend.known_exchanges[destination]} ({destination}) from {account}"
+        print(alert_msg)
+        alerts.append(alert_msg)
+    if destination in suspected_mixers:
+        alert_msg = f"ALERT: Transfer to suspected mixer {destination} from {account}"
+        print(alert_msg)
+        alerts.append(alert_msg)
+    cluster = CLUSTERS.service_label(destination)
+    if cluster and not tag and destination not in backend.known_exchanges:
+        alert_msg = f"CLUSTER ALERT: Transfer to {destination}, clustered with {cluster[1]} {cluster[0]}, from {account}"
+        print(alert_msg)
+        alerts.append(alert_msg)
+
+
+# Fetch stage: yields each frontier account's transfers in frontier order while the rest are
+# fetched concurrently. A frontier spanning several depths (the value-weighted trace) passes
+# levels: account -> depth. The session's budget is checked before every account, so accounts
+# not yet started once it runs out yield None instead of being fetched.
+def fetch_frontier(backend, frontier, window, depth, max_depth, workers=DEFAULT_WORKERS, watermarks=None, session=None, levels=None):
+    def fetch(account):
+        if session is not None and not session.within_budget():
+            return None
+        level = levels[account] if levels else depth
+        print(f"Tracing transactions for account {account} at depth {level}")
+        if session is not None:
+            session.count('accounts_fetched')
+        with metrics.stage('fetching'):  # One call per account, summed across fetch workers
+            return list(backend.iter_account(account, window, level, max_depth, watermarks=watermarks, session=session))
+
+    if workers <= 1 or len(frontier) <= 1:
+        for account in frontier:
+            yield fetch(account)
+        return
+    with ThreadPoolExecutor(max_workers=min(workers, len(frontier))) as executor:
+        yield from executor.map(fetch, frontier)
+
+
+# Filter stage: pass through value transfers, raising alerts as they stream by
+def iter_transfers(backend, transactions, account, alerts, suspected_mixers=None):
+    for txn in transactions:
+        if txn.destination is not None and txn.amount is not None:  # Check if 'Destination' and 'Amount' fields exist
+            screen_transfer(backend, txn, account, alerts, suspected_mixers)
+            yield txn
+
+
+# Keep stage: pass transfers through unchanged while appending each one to kept
+def iter_kept(transfers, kept):
+    for txn in transfers:
+        kept.append(txn)
+        yield txn
+
+
+# Breadth-first trace as a stream: each level's frontier is fetched concurrently, screened in
+# order, and every newly reached transfer is yielded (with node_levels already set) as soon as
+# it is found, so build_graph can consume it incrementally. Further transfers over the edge
+# that first reached an account are yielded too, so edge totals are complete. Pass a list as
+# history to also collect every fetched Transfer for analyze_heuristics. Members of exchange
+# and mixer clusters in the cluster index are kept as leaves and never fetched.
+#
+# Incremental re-trace: revisit maps depth -> accounts traced on a previous run. Those are
+# re-fetched only past their entry in watermarks, level by level alongside any new accounts.
+# Seed session.reached_by from the previous run (case_state.case_reached_by) so new transfers
+# over edges it already drew are kept.
+# Resuming from a checkpoint uses revisit the same way for the accounts still pending.
+# With a checkpoint, every fully processed account is journaled; the journal is flushed on
+# the way out, including when an exception aborts the trace.
+#
+# All trace state lives in a TraceSession (a fresh one unless passed in); the traced,
+# node_levels, alerts, history and watermarks arguments override the session's own. The
+# session's request/time budget is checked before each account is fetched; accounts left
+# unfetched when it runs out stay in node_levels (and pending in the checkpoint) as leaves.
+# Cancelling the session stops the trace at the next account.
+def iter_trace(backend, account, start_datetime, end_datetime, depth=0, max_depth=2, traced=None, node_levels=None, alerts=None, workers=DEFAULT_WORKERS, history=None, watermarks=None, revisit=None, checkpoint=None, session=None):
+    session = session or TraceSession()
+    traced = session.traced if traced is None else traced
+    node_levels = session.node_levels if node_levels is None else node_levels
+    alerts = session.alerts if alerts is None else alerts
+    history = session.history if history is None else history
+    watermarks = session.watermarks if watermarks is None else watermarks
+    suspected_mixers = session.suspected_mixers
+    account = backend.normalize(account)
+    revisit = revisit or {}
+    if revisit:
+        depth = min(revisit)
+        frontier = list(revisit[depth])
+    elif depth > max_depth or account in traced:
+        return
+    else:
+        traced.add(account)
+        frontier = [account]
+    window = backend.window(start_datetime, end_datetime, session)
+    reached_by = session.reached_by  # Seeded from the case on a re-trace, so old edges keep growing
+
+    try:
+        while depth <= max_depth and (frontier or any(level > depth for level in revisit)) and session.within_budget():
+            next_frontier = []
+            session.gauge('frontier', len(frontier))
+            for source, transactions in zip(frontier, fetch_frontier(backend, frontier, window, depth, max_depth, workers, watermarks, session)):
+                if session.cancelled:
+                    break  # Fetches not yet started are cancelled with the generator
+                if transactions is None:
+                    continue  # Over budget: left unfetched
+                alerts_before = len(alerts)
+                reached, kept = [], []
+                detect_heuristics(transactions, source, alerts, rules=session.rules, suspected_mixers=suspected_mixers)
+                KNOWN_TAGS.get_many(txn.destination for txn in transactions if txn.destination)  # Warm the tag cache in one query
+                if history is not None:
+                    history.extend(transactions)  # Compact records kept for whole-trace heuristics
+                for txn in iter_transfers(backend, transactions, source, alerts, suspected_mixers):
+                    destination = txn.destination
+                    if destination not in traced:
+                        node_levels[destination] = depth + 1
+                        # Accounts past max_depth are kept as leaves but never fetched
+                        if depth + 1 <= max_depth and not CLUSTERS.service_label(destination):
+                            traced.add(destination)
+                            next_frontier.append(destination)
+                            reached.append(destination)
+                            reached_by[destination] = source
+                    elif reached_by.get(destination) != source:
+                        continue
+                    kept.append(txn)
+                    session.count('transfers_kept')
+                    yield txn
+                if checkpoint is not None:
+                    checkpoint.record(source, depth, reached, kept, node_levels, alerts[alerts_before:], source in suspected_mixers,
+                                      watermark=watermarks.get(source) if watermarks is not None else None)
+            frontier = list(revisit.get(depth + 1, [])) + next_frontier
+            depth += 1
+    finally:
+        if checkpoint is not None:
+            checkpoint.flush()
+
+
+# Resuming a checkpointed trace: the journal holds only what the trace itself needs, so the
+# whole-trace history of the accounts it already processed is fetched again (normally straight
+# from the API cache) into session.history. levels maps each account to its depth. These
+# fetches don't count against the session's budget.
+def refetch_history(backend, levels, start_datetime, end_datetime, max_depth, workers=DEFAULT_WORKERS, session=None):
+    session = session or TraceSession()
+    replay = TraceSession(cache_only=session.cache_only, head_page_ttl=session.head_page_ttl)
+    window = backend.window(start_datetime, end_datetime, session)
+    for transactions in fetch_frontier(backend, list(levels), window, None, max_depth, workers, session=replay, levels=levels):
+        session.history.extend(transactions)
+    session.complete_histories.update(replay.complete_histories)
+    return session.history
+
+
+@metrics.timed('trace_transactions')
+def trace_transactions(backend, account, start_datetime, end_datetime, depth=0, max_depth=2, traced=None, node_levels=None, alerts=None, workers=DEFAULT_WORKERS, session=None):
+    return list(iter_trace(backend, account, start_datetime, end_datetime, depth, max_depth, traced, node_levels, alerts, workers, session=session))
+
+
+# An account is a leaf of the value-weighted trace if following it can only lead off-chain
+def is_trace_stop(backend, account, stop_at_tagged=True):
+    return (account in backend.known_exchanges or (stop_at_tagged and KNOWN_TAGS.get(account) is not None)
+            or CLUSTERS.service_label(account) is not None)
+
+
+# Value-weighted trace as a stream: instead of expanding every account level by level, the
+# accounts holding the most traced value are fetched first, up to workers at a time, until the
+# queue is empty or the session's request/time budget runs out.
+#
+# Traced value uses a proportional haircut: an account passes on each transfer's share of its
+# outflow times the value traced into it (the root's whole outflow counts). Only the native
+# coin carries value; token transfers are drawn as leaves. Transfers under min_amount whole
+# units are dropped. Destinations whose tainted share is below min_taint, known exchanges,
+# exchange and mixer cluster members and (with stop_at_tagged) tagged addresses are kept as
+# leaves and never fetched. Yields Transfer
+# records with node_levels set, like iter_trace; value is the base units traced into account
+# when starting mid-flow (e.g. from a single transaction).
+def iter_priority_trace(backend, account, start_datetime, end_datetime, depth=0, max_depth=6, workers=DEFAULT_WORKERS, min_amount=MIN_TRACE_AMOUNT, min_taint=MIN_TAINT_SHARE, stop_at_tagged=True, value=None, session=None):
+    session = session or TraceSession()
+    traced, node_levels, alerts, history = session.traced, session.node_levels, session.alerts, session.history
+    suspected_mixers = session.suspected_mixers
+    account = backend.normalize(account)
+    if depth > max_depth or account in traced:
+        return
+    window = backend.window(start_datetime, end_datetime, session)
+    min_base = min_amount * 10 ** backend.decimals
+    traced_value = {account: value}  # Base units traced into each queued account; None means everything
+    fetched = set()
+    order = count()  # Tie-breaker so equal values expand first-come first-served
+    queue = [(-float('inf') if value is None else -value, next(order), account)]
+    traced.add(account)
+    node_levels.setdefault(account, depth)
+
+    while queue and session.within_budget():
+        batch = []
+        while queue and len(batch) < workers:
+            _, _, candidate = heapq.heappop(queue)
+            if candidate not in fetched:  # Skip stale entries left by a later value increase
+                fetched.add(candidate)
+                batch.append(candidate)
+        levels = {candidate: node_levels[candidate] for candidate in batch}
+        session.gauge('frontier', len(queue) + len(batch))
+        for source, transactions in zip(batch, fetch_frontier(backend, batch, window, None, max_depth, workers, session.watermarks, session, levels)):
+            if session.cancelled:
+                break
+            if transactions is None:  # Over budget: back in the queue, so it counts as unexpanded
+                fetched.discard(source)
+                heapq.heappush(queue, (-float('inf') if traced_value[source] is None else -traced_value[source], next(order), source))
+                continue
+            detect_heuristics(transactions, source, alerts, rules=session.rules, suspected_mixers=suspected_mixers)
+            KNOWN_TAGS.get_many(txn.destination for txn in transactions if txn.destination)  # Warm the tag cache in one query
+            if history is not None:
+                history.extend(transactions)
+            outgoing = [txn for txn in iter_transfers(backend, transactions, source, alerts, suspected_mixers)
+                        if txn.account == source and txn.destination != source and (txn.asset is not None or txn.amount >= min_base)]
+            outflow = sum(txn.amount for txn in outgoing if txn.asset is None)
+            payments = [txn for txn in outgoing if txn.destination not in fetched]
+            inflow = traced_value[source]
+            share = 1.0 if inflow is None or outflow <= 0 else min(1.0, inflow / outflow)
+            for txn in payments:
+                destination = txn.destination
+                level = min(node_levels.get(destination, levels[source] + 1), levels[source] + 1)
+                node_levels[destination] = level
+                session.count('transfers_kept')
+                yield txn
+                if txn.asset is not None or level > max_depth or share < min_taint or is_trace_stop(backend, destination, stop_at_tagged):
+                    continue  # Leaf: drawn but never fetched
+                traced.add(destination)
+                traced_value[destination] = (traced_value.get(destination) or 0) + txn.amount * share
+                heapq.heappush(queue, (-traced_value[destination], next(order), destination))
+    pending = {candidate for _, _, candidate in queue} - fetched
+    session.stats['unexpanded'] = len(pending)
+    if pending:
+        print(f"Trace budget exhausted: {len(pending)} queued accounts not expanded")
@@ -1,17 +1,34 @@
-import numpy as np
-import requests
-import networkx as nx
-import matplotlib.pyplot as plt
-import time
-from datetime import datetime
-import random
+from datetime import datetime, timedelta
 import argparse  # Add this import for command-line args
-import json  # For loading tags
-import io # For in-memory image buffer
-from utils.db_utils import load_tags  # New: Load from SQLite
-import reportlab
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
+from functools import partial
+from contextlib import ExitStack
+from itertools import chain, takewhile
+import threading
+from utils import cache_utils  # On-disk cache of API responses
+from utils.records import Transfer  # Compact transaction records
+from utils.heuristics import load_rules  # Vectorised heuristics engine
+from utils.backends import LedgerBackend
+from utils.taint import TAINT_MODELS  # Taint propagation models
+from utils.clusters import update_clusters  # Persistent address clusters
+from utils.ledger_store import LedgerStoreBackend  # Offline tracing from bulk ledger exports
+from utils import tracer, graph  # Chain-agnostic tracing and graph core
+from utils.tracer import DEFAULT_WORKERS, MIN_TRACE_AMOUNT, MIN_TAINT_SHARE, KNOWN_TAGS, analyze_heuristics, detect_heuristics
+from utils.graph import RENDER_STATS, collapse_leaves, visualize_graph
+from utils.case_state import new_case, load_case, save_case, case_path, case_transfers, case_reached_by, record_transfers, revisit_levels  # Saved cases for incremental re-traces
+from utils.checkpoint import TraceCheckpoint, load_checkpoint, pending_levels  # Resumable long traces
+from utils.session import TraceSession  # Per-trace state
+from utils.api_utils import request_json, pacing_stats, latency_stats, ensure_pool_size  # Shared rate limiter, backoff and pooled sessions
+from utils import metrics  # Stage timers, counters and profiling
+from utils.report import write_report  # Paginated PDF/HTML reports
+
+# The XRP entry points, plus the core helpers callers have always imported from here
+__all__ = [
+    'KNOWN_EXCHANGES', 'XRPSCAN_API', 'PAGE_STATS', 'XRPSCAN', 'XrpscanBackend',
+    'get_transactions', 'get_transaction', 'iter_account_transactions', 'fetch_all_transactions',
+    'screen_transfer', 'iter_transfers', 'fetch_frontier', 'iter_trace', 'trace_transactions', 'iter_priority_trace',
+    'is_trace_stop', 'build_graph', 'analyze_taint', 'generate_pdf_report_cli',
+    'detect_heuristics', 'analyze_heuristics', 'RENDER_STATS', 'collapse_leaves', 'visualize_graph',
+]
 
 # Add known exchanges (expand this list based on public data; addresses are examples and should be verified)
 KNOWN_EXCHANGES = {
@@ -22,235 +39,169 @@ KNOWN_EXCHANGES = {
     # Mixer examples: "rChangeNowTemp": "ChangeNow"  # Placeholder; use real patterns if available
 }
 
-# New: Known or suspected mixers (expand with patterns or known addresses)
-SUSPECTED_MIXERS = set()  # Will populate dynamically
-
-# Load known tags (after imports)
-try:
-    KNOWN_TAGS = load_tags()
-except Exception as e:
-    print(f"Error loading tags from DB: {e}")
-    KNOWN_TAGS = {}
+XRPSCAN_API = "https://api.xrpscan.com/api/v1"  # Pointed at a local mock server by the benchmarks
 
-# Function to fetch transactions for a given account with retry on rate limiting and 504 errors
-def get_transactions(account, marker=None, limit=200, retries=5, timeout=10):
-    url = f"https://api.xrpscan.com/api/v1/account/{account}/transactions?origin=xrp-transaction-tracker"
+# Function to fetch transactions for a given account (paced and retried by utils.api_utils)
+@metrics.timed('get_transactions')
+def get_transactions(account, marker=None, limit=200, retries=5, timeout=10, cache_only=None, head_ttl=None):
+    key = cache_utils.page_key(account, marker, limit)
+    offline = cache_utils.is_offline(cache_only)
+    # Offline, a stale head page is still the best data there is
+    cached = cache_utils.get_cached(key, ttl=None if marker or offline else cache_utils.head_page_ttl(head_ttl))
+    if cached is not None:
+        return cached
+    if offline:
+        raise cache_utils.CacheMissError(f"No cached page for account {account} (marker={marker})")
+    url = f"{XRPSCAN_API}/account/{account}/transactions?origin=xrp-transaction-tracker"
     params = {'marker': marker, 'limit': limit} if marker else {'limit': limit}
-    attempt = 0
-    while attempt < retries:
-        try:
-            response = requests.get(url, params=params, timeout=timeout)
-            if response.status_code == 429:
-                print("Rate limit hit, sleeping for 60 seconds...")
-                time.sleep(60)
-            else:
-                response.raise_for_status()
-                return response.json()
-        except requests.exceptions.HTTPError as e:
-            if response.status_code == 504:
-                print(f"504 error, retrying... ({attempt + 1}/{retries})")
-                time.sleep(30)
-                attempt += 1
-            else:
-                raise e
-    raise Exception("Max retries exceeded")
+    data = request_json(url, params=params, retries=retries, timeout=timeout)
+    cache_utils.put_cached(key, data)
+    return data
 
-# Recursive function to fetch all transactions for an account within a date range
-def fetch_all_transactions(account, start_datetime, end_datetime, depth=1, max_depth=2, limit=200):
-    transactions = []
+XRPSCAN_DATE_LENGTH = len('2023-01-01T00:00:00.000Z')
+
+# Page counters for date-range pagination: pages downloaded vs pages with at least one txn in range
+PAGE_STATS = {'fetched': 0, 'used': 0}
+_page_stats_lock = threading.Lock()
+
+# Format a datetime bound like XRPSCAN's fixed-width UTC dates so bounds compare as plain strings
+def date_bound(dt, round_up=False):
+    if dt is None:
+        return None
+    millis = -(-dt.microsecond // 1000) if round_up else dt.microsecond // 1000
+    if millis == 1000:  # Rounding up .9995+ spills into the next second
+        return date_bound(dt.replace(microsecond=0) + timedelta(seconds=1))
+    return f"{dt:%Y-%m-%dT%H:%M:%S}.{millis:03d}Z"
+
+def txn_date_key(date):
+    # Fast path: XRPSCAN's fixed-width dates already sort chronologically as strings
+    if len(date) == XRPSCAN_DATE_LENGTH:
+        return date
+    return date_bound(datetime.strptime(date, '%Y-%m-%dT%H:%M:%S.%fZ'))
+
+# Position of a transaction in ledger history, used as an account's re-trace watermark
+def txn_watermark(txn):
+    return {'ledger_index': txn.get('ledger_index'), 'date': txn_date_key(txn['date']) if txn.get('date') else None}
+
+def is_after_watermark(txn, mark):
+    if mark.get('ledger_index') is not None and txn.get('ledger_index') is not None:
+        return txn['ledger_index'] > mark['ledger_index']
+    if mark.get('date') and txn.get('date'):
+        return txn_date_key(txn['date']) > mark['date']
+    return True
+
+# Stream an account's transactions within a date range, one page at a time. XRPSCAN pages are
+# newest first, so paging stops at the first page that reaches back past start_datetime. With a
+# watermarks dict, only transactions newer than the account's watermark are returned and the
+# watermark is advanced to the newest in-range transaction seen.
+def iter_account_transactions(account, start_datetime, end_datetime, depth=1, max_depth=2, limit=200, watermarks=None, session=None):
+    start_key = date_bound(start_datetime, round_up=True)
+    end_key = date_bound(end_datetime)
+    since = watermarks.get(account) if watermarks is not None else None
+    if watermarks is not None and since is None:
+        watermarks[account] = {'ledger_index': None, 'date': None}  # Fetched, but no history yet
+    mark_pending = watermarks is not None
+    cache_only, head_ttl = (session.cache_only, session.head_page_ttl) if session is not None else (None, None)
     marker = None
     while True:
-        data = get_transactions(account, marker, limit)
-        for txn in data['transactions']:
-            txn_date = datetime.strptime(txn['date'], '%Y-%m-%dT%H:%M:%S.%fZ')
-            if (start_datetime is None or start_datetime <= txn_date) and (end_datetime is None or txn_date <= end_datetime):
-                transactions.append(txn)
-        if 'marker' in data and depth < max_depth:
+        data = get_transactions(account, marker, limit, cache_only=cache_only, head_ttl=head_ttl)
+        page = data['transactions']
+        reached_start = False
+        if since is not None:
+            newer = list(takewhile(lambda txn: is_after_watermark(txn, since), page))
+            reached_start = len(newer) < len(page)  # Everything older was seen on a previous run
+            page = newer
+        if start_key is None and end_key is None:
+            in_range = page
+        else:
+            in_range = []
+            for txn in page:
+                txn_key = txn_date_key(txn['date'])
+                if start_key is not None and txn_key < start_key:
+                    reached_start = True
+                elif end_key is None or txn_key <= end_key:
+                    in_range.append(txn)
+        if mark_pending and in_range:
+            watermarks[account] = txn_watermark(in_range[0])  # Newest in-range transaction
+            mark_pending = False
+        with _page_stats_lock:
+            PAGE_STATS['fetched'] += 1
+            PAGE_STATS['used'] += 1 if in_range else 0
+        metrics.count('pages_fetched')
+        if session is not None:
+            session.count('pages_fetched')
+            session.count('pages_used', 1 if in_range else 0)
+        yield from in_range
+        if 'marker' in data and depth < max_depth and not reached_start:
             marker = data['marker']
         else:
             break
-    return transactions
-
-# New function for heuristic detection
-def detect_heuristics(transactions, account, alerts):
-    # Simple mixer detection: high number of incoming txns to this account
-    incoming_count = sum(1 for txn in transactions if txn.get('Destination') == account)
-    if incoming_count > 10:  # Arbitrary threshold for suspicion
-        SUSPECTED_MIXERS.add(account)
-        alert_msg = f"HEURISTIC ALERT: Account {account} suspected as mixer (high incoming txns: {incoming_count})"
-        print(alert_msg)
-        alerts.append(alert_msg)
-    
-    # Simple clustering note: log if multiple destinations share common sources (basic, expand later)
-    destinations = set(txn.get('Destination') for txn in transactions if 'Destination' in txn)
-    if len(destinations) > 5:  # Example threshold
-        print(f"CLUSTER NOTE: Account {account} connects to {len(destinations)} destinations - potential cluster")
-
-# Modify trace_transactions to check for exchanges and collect alerts
-def trace_transactions(account, start_datetime, end_datetime, depth=0, max_depth=2, traced=set(), node_levels={}, alerts=[]):
-    if depth > max_depth or account in traced:
-        return []
-
-    print(f"Tracing transactions for account {account} at depth {depth}")
-
-    traced.add(account)
-    transactions = fetch_all_transactions(account, start_datetime, end_datetime, depth, max_depth)
-    
-    detect_heuristics(transactions, account, alerts)  # Call new heuristic function
-    
-    all_transactions = []
-
-    for txn in transactions:
-        if 'Destination' in txn and 'Amount' in txn:  # Check if 'Destination' and 'Amount' fields exist
-            destination = txn['Destination']
-            tag = KNOWN_TAGS.get(destination, None)
-            if tag:
-                alert_msg = f"TAG ALERT: Transfer to tagged {tag['label']} ({destination}) from {account} - Notes: {tag.get('notes', '')}"
-                print(alert_msg)
-                alerts.append(alert_msg)
-                # Override heuristic if conflict (e.g., tagged as legit but heuristic suspects mixer)
-                if 'type' in tag and tag['type'] != 'mixer' and destination in SUSPECTED_MIXERS:
-                    SUSPECTED_MIXERS.remove(destination)
-                    alerts.append(f"TAG OVERRIDE: {destination} tagged as {tag['label']}, removing mixer suspicion")
-            if destination in KNOWN_EXCHANGES:
-                alert_msg = f"ALERT: Transfer of {txn['Amount']['value']} drops to known exchange {KNOWN_EXCHANGES[destination]} ({destination}) from {account}"
-                print(alert_msg)
-                alerts.append(alert_msg)
-            if destination in SUSPECTED_MIXERS:
-                alert_msg = f"ALERT: Transfer to suspected mixer {destination} from {account}"
-                print(alert_msg)
-                alerts.append(alert_msg)
-            if destination not in traced:
-                all_transactions.append(txn)
-                node_levels[destination] = depth + 1
-                all_transactions.extend(trace_transactions(destination, start_datetime, end_datetime, depth + 1, max_depth, traced, node_levels, alerts))
-
-    return all_transactions
-
-# Create a graph from transactions
-def build_graph(transactions, node_levels):
-    G = nx.DiGraph()
-    for txn in transactions:
-        source = txn['Account']
-        if 'Destination' in txn and 'Amount' in txn:  # Ensure 'Destination' and 'Amount' fields exist
-            destination = txn['Destination']
-            amount = txn['Amount']['value']
-            G.add_edge(source, destination, weight=float(amount) / 1_000_000)  # Convert from drops to XRP
-            if source not in node_levels:
-                node_levels[source] = 0  # Original wallet level
-            # Set the subset_key attribute for each node
-            G.nodes[source]['subset_key'] = node_levels[source]
-            G.nodes[destination]['subset_key'] = node_levels[destination]
-            # Flag if it's a known exchange or suspected mixer
-            G.nodes[destination]['is_exchange'] = destination in KNOWN_EXCHANGES
-            G.nodes[destination]['is_mixer'] = destination in SUSPECTED_MIXERS
-            # Flag tags
-            tag = KNOWN_TAGS.get(destination, None)
-            if tag:
-                G.nodes[destination]['tag_label'] = tag['label']
-                G.nodes[destination]['is_tagged'] = True
-    return G
-
-def format_wallet_address(address):
-    return f"{address[:4]}...{address[-4:]}"
-
-# Visualize the graph
-def visualize_graph(G, node_levels, scale_factor=3.0, filename="graph.png"):
-    if not G.nodes:
-        print("No nodes in graph, skipping visualization.")
-        return None
-    pos = {}
-    level_nodes = {}
-    max_depth = max(node_levels.values()) if node_levels else 0
-
-    # Group nodes by levels
-    for node, level in node_levels.items():
-        if level not in level_nodes:
-            level_nodes[level] = []
-        level_nodes[level].append(node)
-
-    # Sort nodes at each level by descending transaction amount
-    for level, nodes in level_nodes.items():
-        if level == 0:
-            pos[nodes[0]] = (0, 0)
-        else:
-            nodes.sort(key=lambda node: sum([G.edges[edge]['weight'] for edge in G.in_edges(node)]), reverse=True)
-            for i, node in enumerate(nodes):
-                pos[node] = (level, -i)
-
-    # Perturb node positions slightly to avoid overlapping edges
-    for node in pos:
-        x, y = pos[node]
-        pos[node] = (x + random.uniform(-0.05, 0.05), y + random.uniform(-0.05, 0.05))
-
-    plt.figure(figsize=(30, 30))
-
-    color_map = []
-    for node in G:
-        if G.nodes[node].get('is_tagged', False):
-            color_map.append('purple')  # Police-flagged tags in purple
-        elif G.nodes[node].get('is_exchange', False):
-            color_map.append('red')  # Highlight exchanges in red
-        elif G.nodes[node].get('is_mixer', False):
-            color_map.append('orange')  # Highlight suspected mixers in orange
-        else:
-            level = node_levels[node]
-            gray_value = 1 - (level / max(node_levels.values())) * 0.8  # Shades of gray
-            color_map.append((gray_value, gray_value, gray_value))
-
-    edge_weights = [G.edges[edge]['weight'] for edge in G.edges]
-    sorted_weights = sorted(edge_weights)
-    if not sorted_weights:
-        edge_color_map = ['#084960'] * len(G.edges)  # Default color if no weights
-    else:
-        quantiles = np.percentile(sorted_weights, [25, 50, 75])
-        edge_color_map = []
-        for edge in G.edges:
-            weight = G.edges[edge]['weight']
-            if weight <= quantiles[0]:
-                edge_color_map.append('#084960')
-            elif weight <= quantiles[1]:
-                edge_color_map.append('#016E93')
-            elif weight <= quantiles[2]:
-                edge_color_map.append('#4897B4')
-            else:
-                edge_color_map.append('#B0D8E9')
-
-    labels = {node: f"{format_wallet_address(node)} {G.nodes[node].get('tag_label', '')}" for node in G.nodes}  # Add tag to label
-    nx.draw(G, pos, with_labels=True, labels=labels, node_size=200, node_color=color_map, font_size=10, font_weight='bold', edge_color=edge_color_map)
-    edge_labels = {edge: f"{G.edges[edge]['weight']:,} XRP" for edge in G.edges}
-    nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels)
-    if filename:
-        plt.savefig(filename)
-        print(f"Graph saved as {filename}")
-    else:
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png')
-        buf.seek(0)
-        return buf
-    plt.close()
+    if session is not None and start_key is None and since is None and 'marker' not in data:
+        session.complete_histories.add(account)  # Paged all the way back to its first transaction
+
+@metrics.timed('fetch_all_transactions')
+def fetch_all_transactions(account, start_datetime, end_datetime, depth=1, max_depth=2, limit=200):
+    return list(iter_account_transactions(account, start_datetime, end_datetime, depth, max_depth, limit))
+
+# XRPSCAN as a tracer backend. The tracer streams from iter_account_transactions, which adds
+# the depth cut-off, re-trace watermarks and per-trace cache settings to plain paging.
+class XrpscanBackend(LedgerBackend):
+    name = 'xrpscan'
+    unit = 'XRP'
+    decimals = 6  # Amounts are in drops
+    known_exchanges = KNOWN_EXCHANGES
+
+    def fetch_page(self, account, window, cursor=None):
+        # One XRPSCAN page; cursor is its marker. Paging ends at the first page that reaches
+        # back past the window's start
+        start_key, end_key = date_bound(window[0], round_up=True), date_bound(window[1])
+        data = get_transactions(account, cursor)
+        transfers, reached_start = [], False
+        for txn in data['transactions']:
+            txn_key = txn_date_key(txn['date']) if start_key or end_key else None
+            if start_key is not None and txn_key < start_key:
+                reached_start = True
+            elif 'Destination' in txn and (end_key is None or txn_key <= end_key):
+                transfers.append(Transfer.from_xrpscan(txn))
+        return transfers, None if reached_start else data.get('marker')
+
+    def iter_account(self, account, window, depth=0, max_depth=0, watermarks=None, session=None):
+        start_datetime, end_datetime = window
+        for txn in iter_account_transactions(account, start_datetime, end_datetime, depth, max_depth, watermarks=watermarks, session=session):
+            if 'Destination' in txn:
+                yield Transfer.from_xrpscan(txn)
+
+XRPSCAN = XrpscanBackend()
+
+# The shared tracing and graph core, bound to XRPSCAN
+screen_transfer = partial(tracer.screen_transfer, XRPSCAN)
+iter_transfers = partial(tracer.iter_transfers, XRPSCAN)
+fetch_frontier = partial(tracer.fetch_frontier, XRPSCAN)
+iter_trace = partial(tracer.iter_trace, XRPSCAN)
+trace_transactions = partial(tracer.trace_transactions, XRPSCAN)
+iter_priority_trace = partial(tracer.iter_priority_trace, XRPSCAN)
+is_trace_stop = partial(tracer.is_trace_stop, XRPSCAN)
+build_graph = partial(graph.build_graph, XRPSCAN)
+analyze_taint = partial(tracer.analyze_taint, XRPSCAN)
 
 # New helper function for single txn fetch
-def get_transaction(tx_id, retries=5, timeout=10):
-    url = f"https://api.xrpscan.com/api/v1/transaction/{tx_id}?origin=xrp-transaction-tracker"
-    attempt = 0
-    while attempt < retries:
-        try:
-            response = requests.get(url, timeout=timeout)
-            if response.status_code == 429:
-                print("Rate limit hit, sleeping for 60 seconds...")
-                time.sleep(60)
-            else:
-                response.raise_for_status()
-                return response.json()
-        except requests.exceptions.HTTPError as e:
-            if response.status_code == 504:
-                print(f"504 error, retrying... ({attempt + 1}/{retries})")
-                time.sleep(30)
-                attempt += 1
-            else:
-                raise e
-    raise Exception("Max retries exceeded")
+def get_transaction(tx_id, retries=5, timeout=10, cache_only=None):
+    key = cache_utils.transaction_key(tx_id)
+    cached = cache_utils.get_cached(key)
+    if cached is not None:
+        return cached
+    if cache_utils.is_offline(cache_only):
+        raise cache_utils.CacheMissError(f"No cached transaction {tx_id}")
+    url = f"{XRPSCAN_API}/transaction/{tx_id}?origin=xrp-transaction-tracker"
+    data = request_json(url, retries=retries, timeout=timeout)
+    cache_utils.put_cached(key, data)
+    return data
+
+# Trace report as PDF, or HTML for a .html filename; image is the graph already rendered by
+# visualize_graph and transfers (streamed once) fills the per-transfer table
+def generate_pdf_report_cli(G, alerts, filename, transfers=None, image=None):
+    write_report(filename, G, alerts, 'XRP Transaction Trace Report', transfers=transfers, image=image)
+    print(f"Report saved as {filename}")
 
 # Main function
 if __name__ == "__main__":
@@ -258,8 +209,31 @@ if __name__ == "__main__":
     parser.add_argument("--account", help="Starting XRP wallet address")
     parser.add_argument("--tx_id", help="Specific transaction ID to trace from (optional; overrides account for single txn)")
     parser.add_argument("--start", help="Start date (YYYY-MM-DDTHH:MM:SS) (optional)")
-    parser.add_argument("--end", help="End date (YYYY-MM-DDTHH:MM:SS) (optional)")
+    parser.add_argument("--end", help="End date (YYYY-MM-DDTHH:MM:SS) (optional; with --update, overrides the case's own end date)")
     parser.add_argument("--depth", type=int, default=3, help="Max recursion depth for tracing")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Max accounts fetched concurrently per depth level")
+    parser.add_argument("--strategy", choices=["bfs", "value"], default="bfs", help="Expand every account level by level (bfs) or the highest-value flows first (value)")
+    parser.add_argument("--min_amount", type=float, default=MIN_TRACE_AMOUNT, help="Value strategy: ignore transfers below this many XRP")
+    parser.add_argument("--min_taint", type=float, default=MIN_TAINT_SHARE, help="Value strategy: don't expand accounts receiving less than this share of traced funds")
+    parser.add_argument("--follow_tagged", action="store_true", help="Value strategy: keep tracing through tagged addresses (exchanges always stop the trace)")
+    parser.add_argument("--max_requests", type=int, help="Stop expanding after this many API pages")
+    parser.add_argument("--max_seconds", type=float, help="Stop expanding after this many seconds")
+    parser.add_argument("--ledger_db", help="Trace from a local ledger store (see utils/ledger_store.py) instead of the XRPSCAN API")
+    parser.add_argument("--cache-only", action="store_true", help="Offline mode: use only cached API responses")
+    parser.add_argument("--rules", help="JSON file of heuristic rules and thresholds (default: built-in rules)")
+    parser.add_argument("--skip_heuristics", action="store_true", help="Skip the whole-trace heuristics (per-hop mixer screening still runs)")
+    parser.add_argument("--max_nodes", type=int, help="Draw only the root(s) and the N highest-value nodes")
+    parser.add_argument("--collapse_below", type=float, help="Merge unflagged leaves receiving less than this many XRP")
+    parser.add_argument("--graph_file", default="xrp_transaction_graph.png", help="Graph output file (.png or .svg)")
+    parser.add_argument("--report", default="xrp_trace_report.pdf", help="Report file: PDF, or HTML for a .html name (summary, graph, alerts, flow and transfer tables)")
+    parser.add_argument("--case", help="Save the trace as a named case for later --update runs")
+    parser.add_argument("--update", action="store_true", help="Re-trace --case over its saved date range (unless --end is given), fetching only activity since its last run")
+    parser.add_argument("--checkpoint", help="Journal file for resuming an interrupted trace (resumed automatically if it matches)")
+    parser.add_argument("--taint", choices=TAINT_MODELS, help="Estimate how much traced value reached each account (haircut, poison or fifo), alert on exchanges and tags it reached, and shade the graph by it")
+    parser.add_argument("--cluster", action="store_true", help="Merge this trace's funding, activation and deposit-tag links into the address cluster index")
+    parser.add_argument("--profile", nargs="?", const="", metavar="FILE", help="Profile the run with cProfile and tracemalloc; optionally save pstats to FILE")
+    parser.add_argument("--metrics", metavar="FILE", help="Write stage timings and counters to FILE (.prom/.txt: Prometheus text, otherwise JSON)")
+    parser.add_argument("--metrics_port", type=int, help="Serve live metrics on this port (/metrics and /metrics.json)")
     parser.add_argument("--test_mode", action="store_true", help="Run in test mode with example data")
     args = parser.parse_args()
 
@@ -269,36 +243,157 @@ if __name__ == "__main__":
         args.start = "2023-07-15T00:00:00"
         args.end = "2023-07-15T23:59:59"
 
-    if not args.account and not args.tx_id:
+    if args.update and not args.case:
+        parser.error("--update requires --case")
+    if not args.account and not args.tx_id and not args.update:
         parser.error("Either --account or --tx_id is required")
+    if args.strategy == "value" and args.checkpoint:
+        parser.error("--checkpoint is only supported with --strategy bfs")
+    if args.ledger_db and args.update:
+        parser.error("--update needs the XRPSCAN API; re-import the export and trace the case again instead")
+
+    backend = LedgerStoreBackend(args.ledger_db, known_exchanges=KNOWN_EXCHANGES) if args.ledger_db else XRPSCAN
+    ensure_pool_size(args.workers)  # One keep-alive connection per fetch worker
+    if args.metrics_port:
+        metrics.serve_metrics(args.metrics_port)
+    profiling = ExitStack()
+    if args.profile is not None:
+        profiling.enter_context(metrics.profiled(args.profile or None))
 
-    start_datetime = datetime.strptime(args.start, '%Y-%m-%dT%H:%M:%S') if args.start else None
-    end_datetime = datetime.strptime(args.end, '%Y-%m-%dT%H:%M:%S') if args.end else None
-    max_depth = args.depth
-
-    node_levels = {}
-    alerts = []  # List to collect alerts
-
-    if args.tx_id:
-        # New: Fetch single txn and trace from there
-        print(f"Tracing from transaction ID: {args.tx_id}")
-        txn_data = get_transaction(args.tx_id)
-        initial_account = txn_data.get('Account', '')
-        # For single txn, wrap in list for consistency
-        transactions = [txn_data]
-        if 'Destination' in txn_data:
-            node_levels[initial_account] = 0
-            node_levels[txn_data['Destination']] = 1
-            traced = set([initial_account])
-            transactions.extend(trace_transactions(txn_data['Destination'], start_datetime, end_datetime, depth=1, max_depth=max_depth, traced=traced, node_levels=node_levels, alerts=alerts))
+    # One session holds the trace state. Every fetched transfer (not just the kept ones) is held
+    # in its history only for the analyses that need it: whole-trace heuristics, taint, clusters.
+    collect_history = not args.skip_heuristics or bool(args.taint) or args.cluster
+    session = TraceSession(collect_history=collect_history, max_requests=args.max_requests, max_seconds=args.max_seconds,
+                           cache_only=args.cache_only)
+    if args.rules:
+        session.rules = load_rules(args.rules)
+    alerts = session.alerts  # List to collect alerts
+    history = session.history
+    checkpoint = None
+
+    if args.update:
+        # Re-trace a saved case: only activity newer than each account's watermark is fetched
+        case = load_case(args.case)
+        session.head_page_ttl = 0  # Newest pages must come from the network to show new activity
+        start_datetime = datetime.fromisoformat(case['start']) if case['start'] else None
+        if args.end:
+            end_datetime = datetime.strptime(args.end, '%Y-%m-%dT%H:%M:%S')
+        else:
+            end_datetime = datetime.fromisoformat(case['end']) if case['end'] else None
+        max_depth = case['max_depth']
+        session.node_levels = node_levels = case['node_levels']
+        session.traced = traced = set(case['traced'])
+        session.watermarks = case['watermarks']
+        session.reached_by = case_reached_by(case)
+        print(f"Updating case {args.case}: {len(case['watermarks'])} accounts, last run {case['updated_at']}")
+        new_transfers = iter_trace(case['account'], start_datetime, end_datetime, max_depth=max_depth, workers=args.workers, revisit=revisit_levels(case), session=session)
+        transactions = chain(case_transfers(case), record_transfers(new_transfers, case))
     else:
-        initial_account = args.account
-        node_levels[initial_account] = 0  # Level of the initial account
-        transactions = trace_transactions(initial_account, start_datetime, end_datetime, max_depth=max_depth, node_levels=node_levels, alerts=alerts)
-    
-    G = build_graph(transactions, node_levels)
-    visualize_graph(G, node_levels, scale_factor=3.0, filename="xrp_transaction_graph.png")  # Adjust the scale_factor to increase spacing
-    generate_pdf_report_cli(transactions, alerts, "xrp_trace_report.pdf")
+        start_datetime = datetime.strptime(args.start, '%Y-%m-%dT%H:%M:%S') if args.start else None
+        end_datetime = datetime.strptime(args.end, '%Y-%m-%dT%H:%M:%S') if args.end else None
+        max_depth = args.depth
+        node_levels = session.node_levels
+        traced = session.traced
+        case = None
+
+        if args.tx_id:
+            # New: Fetch single txn and trace from there
+            print(f"Tracing from transaction ID: {args.tx_id}")
+            txn_data = backend.get_transaction(args.tx_id, cache_only=session.cache_only) if args.ledger_db else get_transaction(args.tx_id)
+            initial_account = txn_data.get('Account', '')
+        else:
+            initial_account = args.account
+        if args.case:
+            case = new_case(initial_account, start_datetime, end_datetime, max_depth)
+        session.watermarks = watermarks = case['watermarks'] if case else None
+
+        trace_root, trace_depth = initial_account, 0
+        if args.tx_id:
+            # For single txn, stream it ahead of the trace for consistency
+            transactions = iter([Transfer.from_xrpscan(txn_data)])
+            trace_root, trace_depth = txn_data.get('Destination'), 1
+            if trace_root:
+                node_levels[initial_account] = 0
+                node_levels[trace_root] = 1
+                traced.add(initial_account)
+        else:
+            node_levels[initial_account] = 0  # Level of the initial account
+            transactions = iter(())
+
+        checkpoint, revisit = None, None
+        if trace_root and args.checkpoint:
+            checkpoint = TraceCheckpoint(args.checkpoint)
+            params = {'root': trace_root, 'start': args.start, 'end': args.end, 'max_depth': max_depth}
+            saved = load_checkpoint(args.checkpoint)
+            if saved and saved['params'] == params:
+                print(f"Resuming from checkpoint {args.checkpoint}: {len(saved['processed'])} accounts already traced")
+                node_levels.update(saved['node_levels'])
+                traced.update(saved['order'])
+                alerts.extend(saved['alerts'])
+                if history is not None:
+                    done = {account: node_levels.get(account, trace_depth) for account in saved['order'] if account in saved['processed']}
+                    tracer.refetch_history(backend, done, start_datetime, end_datetime, max_depth, args.workers, session)
+                session.suspected_mixers.update(saved['mixers'])
+                if watermarks is not None:
+                    watermarks.update(saved['watermarks'])
+                transactions = chain(transactions, saved['transfers'])
+                revisit = pending_levels(saved, node_levels, max_depth)
+                checkpoint.resume(saved['offset'])
+            else:
+                checkpoint.start(params, trace_root)
+        if trace_root and args.strategy == "value":
+            value = Transfer.from_xrpscan(txn_data).amount if args.tx_id else None  # Follow only the traced transaction's funds
+            transactions = chain(transactions, tracer.iter_priority_trace(backend, trace_root, start_datetime, end_datetime, depth=trace_depth, max_depth=max_depth, workers=args.workers,
+                                                                           min_amount=args.min_amount, min_taint=args.min_taint, stop_at_tagged=not args.follow_tagged, value=value, session=session))
+        elif trace_root and revisit != {}:  # An empty revisit means the checkpointed trace had finished
+            transactions = chain(transactions, tracer.iter_trace(backend, trace_root, start_datetime, end_datetime, depth=trace_depth, max_depth=max_depth, workers=args.workers, revisit=revisit, checkpoint=checkpoint, session=session))
+        if case:
+            transactions = record_transfers(transactions, case)
+
+    # The trace streams into the graph; besides the history above, only the transfers kept as
+    # graph edges are held, for the report's transfer table
+    kept = []
+    with metrics.stage('tracing'):  # The whole trace, including the graph it streams into
+        G = graph.build_graph(backend, tracer.iter_kept(transactions, kept), node_levels, session.suspected_mixers)
+    if checkpoint:
+        checkpoint.close(remove=not session.exhausted)  # Kept to resume a trace cut short by its budget
+    if not args.skip_heuristics:
+        analyze_heuristics(history, alerts, session.rules, backend.decimals)
+    if args.taint:
+        tracer.analyze_taint(backend, history, [case['account'] if args.update else initial_account], alerts, args.taint, G)
+    if args.cluster:
+        merges = update_clusters(history, backend.known_exchanges, KNOWN_TAGS, session.suspected_mixers, case=args.case,
+                                 complete=session.complete_histories)
+        print(f"Cluster index: {merges} new merges")
+
+    if case:
+        seen = set(case['alerts'])
+        new_alerts = [alert for alert in alerts if alert not in seen]
+        case['alerts'].extend(new_alerts)
+        case['traced'] = sorted(traced)
+        case['node_levels'] = node_levels
+        save_case(args.case, case)
+        print(f"Case saved as {case_path(args.case)}")
+        if args.update:
+            alerts = new_alerts  # Only report what changed since the last run
+
+    image = visualize_graph(G, node_levels, scale_factor=3.0, filename=args.graph_file, max_nodes=args.max_nodes, collapse_below=args.collapse_below)  # Adjust the scale_factor to increase spacing
+    generate_pdf_report_cli(G, alerts, args.report, transfers=kept, image=image)
+    profiling.close()  # Prints the profile, if one was taken
+    if args.metrics:
+        metrics.write_metrics(args.metrics)
+
+    summary = session.summary()
+    print(f"Trace: {summary['visited']} accounts visited, {summary['accounts_fetched']} fetched, {summary['transfers_kept']} transfers kept in {summary['elapsed']:.1f}s")
+    print(f"Pages fetched: {summary['pages_fetched']}, pages with in-range transactions: {summary['pages_used']}")
+    stats = cache_utils.cache_stats()
+    print(f"API cache: {stats['hits']} hits, {stats['misses']} misses")
+    for host, host_stats in pacing_stats().items():
+        print(f"{host}: {host_stats['requests']} requests, {host_stats['rate_limited']} rate limited, "
+              f"{host_stats['pacing_wait']:.1f}s paced, {host_stats['backoff_wait']:.1f}s backing off")
+    for host, latency in latency_stats().items():
+        print(f"{host}: mean connect {latency['connect'] * 1000:.0f} ms, TTFB {latency['ttfb'] * 1000:.0f} ms, "
+              f"download {latency['download'] * 1000:.0f} ms over {latency['new_connections']} connections")
 
     # Print summary of alerts
     if alerts:
@@ -307,11 +402,3 @@ if __name__ == "__main__":
             print(alert)
     else:
         print("\nNo known exchanges detected in the traced path.")
-
-def generate_pdf_report_cli(transactions, alerts, filename):
-    c = canvas.Canvas(filename, pagesize=letter)
-    c.drawString(100, 750, 'XRP Transaction Trace Report (CLI)')
-    for i, alert in enumerate(alerts):
-        c.drawString(100, 700 - i*20, alert)
-    c.save()
-    print(f"PDF report saved as {filename}")